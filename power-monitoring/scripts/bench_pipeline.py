@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import argparse, json, statistics, sys, time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from fake_kube_api import FakeKubeAPI
+from create_pods_annotate_parallel import ensure_ns, patch_annotations
+from pod_provisioner import DesiredPod, provision_pods
+from pod_informer import PodInformer, list_pods, pod_record
+from power_quorum import QuorumEngine
+
+"""
+Throughput benchmark for the annotate -> export pipeline without a cluster.
+
+For every pod count it starts a fresh fake_kube_api server on localhost and
+runs the real code paths against it through the `kubernetes` client. The export
+rows time the exporter's readers feeding a QuorumEngine, not the metric updates of
+run_exporter/run_informer:
+
+  provision   pod_provisioner.provision_pods            -> pods/s
+  annotate    patch_annotations on a worker pool         -> patches/s, rows/s
+  export      raw paginated list + quorum feed (poll mode) -> poll scan ms
+              same through V1Pod models (the old path)   -> poll model scan ms
+              informer drain + quorum feed per row       -> informer scan ms
+  end-to-end  row start -> every node switched to the
+              row's version in the quorum engine         -> p50 / max ms
+
+  python scripts/bench_pipeline.py --sizes 10 100 1000 --json bench.json
+  python scripts/bench_pipeline.py --baseline bench.json --tolerance 0.3   # exit 1 on regression
+"""
+
+NS = "bench"
+APP = "kwok-power-bench"
+WATTS_KEY = "emulator.power/watts"
+VERSION_KEY = "emulator.power/version"
+
+# metric -> True if higher is better
+METRICS = {
+    "provision_pods_per_s": True,
+    "patches_per_s": True,
+    "rows_per_s": True,
+    "poll_scan_ms": False,
+    "poll_model_scan_ms": False,
+    "informer_scan_ms": False,
+    "e2e_p50_ms": False,
+    "e2e_max_ms": False,
+}
+
+
+def feed(quorum, pods):
+    for p in pods:
+        ann = p.annotations
+        try:
+            ver, watts = int(float(ann[VERSION_KEY])), float(ann[WATTS_KEY])
+        except Exception:
+            continue
+        quorum.update((p.namespace, p.name), p.node, ver, watts)
+    return quorum.decide()
+
+
+def bench_size(n, args):
+    api = FakeKubeAPI(latency=args.api_latency).start()
+    informer = None
+    try:
+        v1 = api.core_v1(pool_maxsize=args.concurrency)
+        ensure_ns(v1, NS)
+        nodes = [f"bench-node-{i}" for i in range(max(1, min(args.nodes, n)))]
+        desired = [DesiredPod(NS, f"bench-{i:05d}", nodes[i % len(nodes)],
+                              {"app": APP, "kwok.power/column": f"c{i}"}) for i in range(n)]
+        sel = f"app={APP}"
+        rep = provision_pods(v1, desired, label_selector=sel, image="registry.k8s.io/pause:3.9",
+                             annotations={WATTS_KEY: "0", VERSION_KEY: "0"},
+                             concurrency=args.concurrency, verbose=False)
+
+        informer = PodInformer(v1, [NS], sel, name="bench", page_size=args.page_size,
+                               metadata_only=args.metadata_only).start()
+        informer.wait_synced(60)
+        quorum = QuorumEngine(args.switch_threshold)
+        feed(quorum, informer.drain()[0].values())
+
+        rng = np.random.default_rng(args.seed)
+        patch_s, scan_s, e2e_s = [], [], []
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+            for r in range(args.rows):
+                version = r + 1
+                watts = rng.uniform(0.0, 50.0, n).tolist()
+                t0 = time.perf_counter()
+                futures = [ex.submit(patch_annotations, v1, NS, p.name, w, version, WATTS_KEY, VERSION_KEY)
+                           for p, w in zip(desired, watts)]
+                pending, spent = set(nodes), 0.0
+                give_up = t0 + args.timeout
+                while pending and time.perf_counter() < give_up:
+                    changed, _ = informer.drain()
+                    if changed:
+                        s0 = time.perf_counter()
+                        for node, total, switched, wait in feed(quorum, changed.values()):
+                            if switched is not None and switched >= version:
+                                pending.discard(node)
+                        spent += time.perf_counter() - s0
+                    else:
+                        time.sleep(0.001)
+                e2e = time.perf_counter() - t0
+                for f in futures:
+                    f.result()
+                patch_s.append(time.perf_counter() - t0)
+                scan_s.append(spent)
+                if pending:
+                    print(f"[bench] n={n} row {version}: {len(pending)} node(s) never reached quorum", file=sys.stderr)
+                else:
+                    e2e_s.append(e2e)
+
+        poll, poll_model = [], []
+        for _ in range(args.scans):
+            s0 = time.perf_counter()
+            feed(QuorumEngine(args.switch_threshold), list_pods(v1, [NS], sel, args.page_size, args.metadata_only))
+            poll.append(time.perf_counter() - s0)
+            s0 = time.perf_counter()
+            feed(QuorumEngine(args.switch_threshold),
+                 [pod_record(p) for p in v1.list_namespaced_pod(namespace=NS, label_selector=sel).items])
+            poll_model.append(time.perf_counter() - s0)
+
+        mean_patch = statistics.mean(patch_s)
+        return {
+            "pods": n,
+            "provision_pods_per_s": rep.created / rep.seconds if rep.seconds else 0.0,
+            "patches_per_s": n / mean_patch,
+            "rows_per_s": 1.0 / mean_patch,
+            "poll_scan_ms": 1000 * statistics.median(poll),
+            "poll_model_scan_ms": 1000 * statistics.median(poll_model),
+            "informer_scan_ms": 1000 * statistics.median(scan_s),
+            "e2e_p50_ms": 1000 * statistics.median(e2e_s) if e2e_s else float("nan"),
+            "e2e_max_ms": 1000 * max(e2e_s) if e2e_s else float("nan"),
+        }
+    finally:
+        if informer is not None:
+            informer.stop()
+        api.stop()
+        if informer is not None:
+            informer.join(timeout=5)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for size, cur in results.items():
+        base = baseline.get(size)
+        if not base:
+            continue
+        for metric, higher_better in METRICS.items():
+            b, c = base.get(metric), cur.get(metric)
+            if not b or c is None or c != c:
+                continue
+            worse = c < b * (1 - tolerance) if higher_better else c > b * (1 + tolerance)
+            if worse:
+                regressions.append(f"{size} pods: {metric} {c:.1f} vs baseline {b:.1f}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the annotate->export pipeline against an in-memory fake API.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="pod counts to benchmark")
+    ap.add_argument("--nodes", type=int, default=3, help="fake nodes the pods are spread over")
+    ap.add_argument("--rows", type=int, default=3, help="rows (full batches) annotated per size")
+    ap.add_argument("--scans", type=int, default=3, help="poll-mode scans timed per size")
+    ap.add_argument("--concurrency", type=int, default=32, help="annotator/provisioner pool size")
+    ap.add_argument("--switch-threshold", type=float, default=0.8)
+    ap.add_argument("--page-size", type=int, default=500, help="pods per LIST request in the export path")
+    ap.add_argument("--metadata-only", action="store_true", help="export path lists PartialObjectMetadata")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="artificial delay per API request (seconds)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="max seconds to wait for a row to reach quorum")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--baseline", help="compare against a previous --json file; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown vs baseline")
+    args = ap.parse_args()
+
+    results = {}
+    cols = ["pods"] + list(METRICS)
+    print("  ".join(f"{c:>20s}" for c in cols), flush=True)
+    for n in args.sizes:
+        res = bench_size(n, args)
+        results[str(n)] = res
+        print("  ".join(f"{res[c]:>20.1f}" if c != "pods" else f"{res[c]:>20d}" for c in cols), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
 #!/usr/bin/env python3
-import argparse, os, re, sys, time
-from typing import List, Dict, Tuple
-import pandas as pd
+import argparse, re, sys, time
+from typing import Optional
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
+from replay_plan import RESAMPLE_METHODS, ReplayCursor
+from replay_scheduler import DeadlineScheduler, LATE_POLICIES
+from trace_cache import load_plan
+from pipeline_metrics import PERIOD_KEY, TRACE_TIME_KEY
+from pod_provisioner import DesiredPod, provision_pods
+from power_shm import DEFAULT_DIR as SHM_DIR, RingWriter, ring_path
 
 # Create KWOK-friendly pods from CSV column headers, then annotate power (watts).
 # - Runs on the node (no Pods/YAML needed) using your kubeconfig.
 # - Ignores columns named 'time' or 'total' (case-insensitive) and any 'Unnamed: *' columns.
 # - Creates one pod per remaining column (sanitized to a valid pod name).
-# - Replays the CSV rows in a fixed tick (ignores actual time values) and annotates power.
+# - Replays the CSV rows in a fixed tick (ignores actual time values) and annotates power;
+#   --speedup N instead follows the CSV's time column N times faster, --resample puts
+#   the rows on a uniform time grid first (hold or linear).
+# - Row n is due at start + n*tick however long the patches take (replay_scheduler.py);
+#   --late-policy decides what happens to rows that fall behind.
+# - The columns are streamed once into a memory-mapped NumPy cache next to the CSV
+#   (trace_cache.py); with --changes-only only cells whose value changed since the
+#   last write are patched.
 # - Annotation key: emulator.power/watts (customizable).
+# - --shm also writes every row into a shared-memory ring buffer (power_shm.py) for
+#   exporters on this host (power_export_versioned2.py --source shm); only every
+#   --mirror-every-th row is then annotated.
 
 
 DEFAULT_IGNORE_REGEX = r'(?i)^(time|Total)$|^Unnamed:.*'
@@ -25,56 +40,22 @@ def sanitize_name(s: str, prefix: str = "") -> str:
     name = f"{prefix}{s}" if prefix else s
     return name[:63]
 
-def choose_columns(df: pd.DataFrame, ignore_regex: str) -> List[str]:
-    cols = []
-    pat = re.compile(ignore_regex)
-    for c in df.columns:
-        if pat.match(str(c)):
-            continue
-        cols.append(str(c))
-    return cols
-
 def load_kubeconfig():
     try:
         config.load_incluster_config()
     except Exception:
         config.load_kube_config()
 
-def ensure_pod(api: client.CoreV1Api, *, ns: str, pod_name: str, node: str, image: str, labels: Dict[str,str], toleration_key: str):
-    try:
-        api.read_namespaced_pod(pod_name, ns)
-        return False  # exists
-    except ApiException as e:
-        if e.status != 404:
-            raise
-    body = client.V1Pod(
-        api_version="v1",
-        kind="Pod",
-        metadata=client.V1ObjectMeta(name=pod_name, labels=labels, annotations={"emulator.power/watts":"0"}),
-        spec=client.V1PodSpec(
-            node_name=node,
-            tolerations=[client.V1Toleration(key=toleration_key, effect="NoSchedule", operator="Exists")],
-            containers=[client.V1Container(name="nop", image=image, image_pull_policy="IfNotPresent")],
-            restart_policy="Always",
-        ),
-    )
-    api.create_namespaced_pod(ns, body)
-    return True
-
-def patch_power_annotation(api: client.CoreV1Api, ns: str, pod: str, key: str, value: float):
-    body = {"metadata": {"annotations": {key: str(value)}}}
+def patch_power_annotation(api: client.CoreV1Api, ns: str, pod: str, key: str, value: float,
+                           period: Optional[float] = None, trace_time: Optional[float] = None):
+    ann = {key: str(value)}
+    if period is not None:
+        ann[PERIOD_KEY] = f"{period:g}"     # lets --adaptive-interval exporters keep up
+    if trace_time is not None:
+        ann[TRACE_TIME_KEY] = f"{trace_time:.3f}"   # energy counters integrate over trace time
+    body = {"metadata": {"annotations": ann}}
     api.patch_namespaced_pod(name=pod, namespace=ns, body=body)
 
-def is_number(x) -> bool:
-    try:
-        if x is None: return False
-        if isinstance(x, str) and not x.strip(): return False
-        v = float(x)
-        if pd.isna(v): return False
-        return True
-    except Exception:
-        return False
-
 def main():
     ap = argparse.ArgumentParser(description="Create pods from CSV headers and annotate power values (host-run).")
     ap.add_argument("--csv", required=True, help="Path to wide CSV (columns are services/pods).")
@@ -85,17 +66,52 @@ def main():
     ap.add_argument("--ignore", default=DEFAULT_IGNORE_REGEX, help="Regex for columns to ignore (default ignores time/total/Unnamed).")
     ap.add_argument("--name-prefix", default="", help="Optional prefix for created pod names.")
     ap.add_argument("--label-app", default="kwok-power", help="Value for label app=<label-app>.")
-    ap.add_argument("--tick", type=float, default=1.0, help="Seconds to sleep between CSV rows (ignores real timestamps).")
+    ap.add_argument("--tick", type=float, default=1.0, help="Seconds between CSV rows (ignores real timestamps).")
+    ap.add_argument("--speedup", type=float, default=0,
+                    help="Follow the CSV's time column N times faster instead of --tick.")
+    ap.add_argument("--resample", type=float, default=0,
+                    help="Resample rows onto a uniform grid of this many trace seconds.")
+    ap.add_argument("--resample-method", choices=RESAMPLE_METHODS, default="hold",
+                    help="hold: last sample at or before each grid point; linear: interpolate.")
     ap.add_argument("--create_only", action="store_true", help="Only create pods, do not annotate.")
     ap.add_argument("--annotate_only", action="store_true", help="Only annotate existing pods, do not create.")
     ap.add_argument("--loop", action="store_true", help="Loop the CSV replay forever.")
+    ap.add_argument("--late-policy", choices=LATE_POLICIES, default="run",
+                    help="What to do with rows that start more than --max-lag after their deadline "
+                         "(run: fire them back to back; coalesce: jump to the newest due row; skip: drop them).")
+    ap.add_argument("--max-lag", type=float, default=None,
+                    help="Seconds a row may start after its deadline before it counts as late (default: one tick).")
+    ap.add_argument("--create-concurrency", type=int, default=16, help="Parallel pod creations while provisioning.")
+    ap.add_argument("--prune", action="store_true",
+                    help="Delete pods with app=<label-app> on --node that no longer map to a CSV column.")
+    ap.add_argument("--changes-only", action="store_true", help="Only patch pods whose value changed since the last write.")
+    ap.add_argument("--full-refresh-every", type=int, default=0,
+                    help="With --changes-only, patch every pod every N rows (default: 0 = first row only).")
+    ap.add_argument("--shm", action="store_true",
+                    help="Also publish every row into a shared-memory ring buffer for exporters on this host.")
+    ap.add_argument("--shm-dir", default=SHM_DIR, help=f"Ring buffer directory (default: {SHM_DIR}).")
+    ap.add_argument("--mirror-every", type=int, default=10,
+                    help="With --shm, annotate every Nth row for kubectl users (0 = never).")
+    ap.add_argument("--cache-dir", default=None, help="Directory for the trace cache (default: next to the CSV).")
+    ap.add_argument("--no-cache", action="store_true", help="Parse the CSV in chunks every run instead of caching it.")
+    ap.add_argument("--chunksize", type=int, default=1000, help="CSV rows parsed per chunk.")
     args = ap.parse_args()
 
-    df = pd.read_csv(args.csv)
-    cols = choose_columns(df, args.ignore)
-    if not cols:
-        print("No columns to use after applying ignore rules.", file=sys.stderr)
+    try:
+        plan = load_plan(args.csv, args.ignore, cache=not args.no_cache,
+                         cache_dir=args.cache_dir, chunksize=args.chunksize,
+                         resample_step=args.resample or ("native" if args.speedup else None),
+                         method=args.resample_method)
+    except ValueError as e:
+        print(e, file=sys.stderr)
         sys.exit(2)
+    cols = plan.columns
+    tick, period = args.tick, None
+    if args.speedup:
+        if not plan.step:
+            print("--speedup needs a numeric 'time' column in the CSV.", file=sys.stderr)
+            sys.exit(2)
+        tick = period = plan.step / args.speedup
 
     # Build mapping: column -> pod_name
     mapping = {}
@@ -125,37 +141,48 @@ def main():
 
     # Ensure pods exist (unless annotate-only)
     if  not args.annotate_only:
-        for col, pod_name in mapping.items():
-            created = ensure_pod(
-                v1,
-                ns=args.namespace,
-                pod_name=pod_name,
-                node=args.node,
-                image=args.image,
-                labels={"app": args.label_app, "kwok.power/column": sanitize_name(str(col))},
-                toleration_key="kwok.x-k8s.io/node",
-            )
-            print(f"{'CREATED' if created else 'EXISTS '} {args.namespace}/{pod_name} for column '{col}'")
+        desired = [
+            DesiredPod(args.namespace, pod_name, args.node,
+                       {"app": args.label_app, "kwok.power/column": sanitize_name(str(col))})
+            for col, pod_name in mapping.items()
+        ]
+        provision_pods(v1, desired, label_selector=f"app={args.label_app}", image=args.image,
+                       annotations={args.annotation_key: "0"},
+                       concurrency=args.create_concurrency, prune=args.prune)
 
     if args.create_only:
         print("Create-only mode requested; exiting after pod creation.")
         return
 
-    # Replay rows: annotate power for each column/pod
-    while True:
-        for idx, row in df.iterrows():
-            for col, pod_name in mapping.items():
-                val = row[col] if col in row else None
-                if is_number(val):
-                    try:
-                        patch_power_annotation(v1, args.namespace, pod_name, args.annotation_key, float(val))
-                        print(f"ANNOTATE {args.namespace}/{pod_name} = {val}")
-                    except ApiException as e:
-                        print(f"PATCH failed {args.namespace}/{pod_name}: {e}", file=sys.stderr)
-                # else: skip non-numeric
-            time.sleep(max(0.0, args.tick))
-        if not args.loop:
-            break
+    # Replay rows: annotate power for each column/pod (non-numeric cells are skipped)
+    cursor = ReplayCursor(plan, changes_only=args.changes_only, full_refresh_every=args.full_refresh_every)
+    pods = [mapping[c] for c in plan.columns]
+    ring = None
+    if args.shm:
+        ring = RingWriter(ring_path(args.shm_dir, args.namespace, args.node), args.namespace, args.node,
+                          args.label_app, [sanitize_name(str(c)) for c in cols], pods)
+    n_rows = len(plan)
+    sched = DeadlineScheduler(tick, policy=args.late_policy, max_lag=args.max_lag)
+    for n, deadline, lag in sched.run(last=None if args.loop else n_rows):
+        idx = n % n_rows
+        if lag > sched.max_lag:
+            print(f"LATE row {idx} (pass {n // n_rows}) started {lag:.3f}s after its deadline", file=sys.stderr)
+        trace_time = plan.trace_time(n, tick)
+        if ring is not None:
+            # row counter as version, above whatever the last run left in the ring
+            ring.write(ring.last_version + n + 1, plan.row(idx), time.time(), period or tick, trace_time)
+        mirror = ring is None or (args.mirror_every > 0 and n % args.mirror_every == 0)
+        vals, write = cursor.step(idx) if mirror else (None, [])
+        for c in write:
+            pod_name = pods[c]
+            try:
+                patch_power_annotation(v1, args.namespace, pod_name, args.annotation_key, vals[c], period,
+                                       trace_time)
+                print(f"ANNOTATE {args.namespace}/{pod_name} = {vals[c]}")
+            except ApiException as e:
+                print(f"PATCH failed {args.namespace}/{pod_name}: {e}", file=sys.stderr)
+    print(f"Patched {cursor.cells_written}/{cursor.cells_total} cells; {sched.fired} rows fired, "
+          f"{sched.late} late, {sched.dropped} dropped, max lag {sched.max_seen_lag:.3f}s")
 
 if __name__ == "__main__":
     main()
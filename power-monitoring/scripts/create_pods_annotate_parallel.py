@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
-import argparse, os, re, sys, time
-import pandas as pd
+import argparse, atexit, re, sys, time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from kubernetes import client, config
+from kubernetes import client
 from kubernetes.client.rest import ApiException
+from replay_scheduler import DeadlineScheduler, LATE_POLICIES
+from replay_plan import RESAMPLE_METHODS, ReplayCursor
+from trace_cache import load_plan
+from power_configmap import write_node_snapshot
+from pod_provisioner import DesiredPod, provision_pods
+from kube_transport import make_core_v1
+from pipeline_metrics import PERIOD_KEY, SCHEDULED_KEY, TRACE_TIME_KEY, AnnotatorMetrics, wall_deadline
+from replay_checkpoint import Checkpointer, default_path, mapping_hash, source_fingerprint
+from trace_amplifier import AmplifiedPlan
+from power_shm import DEFAULT_DIR as SHM_DIR, RingWriter, ring_path
+from prometheus_client import start_http_server
  
 IGNORE_REGEX = r'(?i)^(time|total)$|^Unnamed:.*'
  
@@ -16,15 +26,20 @@ def sanitize_name(s: str, prefix: str = "") -> str:
     name = f"{prefix}{s}" if prefix else s
     return name[:63]
  
-def choose_columns(df: pd.DataFrame, ignore_regex: str):
-    pat = re.compile(ignore_regex)
-    return [str(c) for c in df.columns if not pat.match(str(c))]
- 
-def load_kubeconfig():
-    try:
-        config.load_incluster_config()
-    except Exception:
-        config.load_kube_config()
+def build_mapping(cols, prefix="", used=None):
+    # column -> unique pod name
+    mapping = {}
+    used = set() if used is None else used
+    for c in cols:
+        base = sanitize_name(c, prefix)
+        name = base; i = 1
+        while name in used:
+            sfx = f"-{i}"
+            name = (base[:63-len(sfx)]) + sfx
+            i += 1
+        used.add(name)
+        mapping[c] = name
+    return mapping
  
 def ensure_ns(v1, ns):
     try:
@@ -35,42 +50,33 @@ def ensure_ns(v1, ns):
         else:
             raise
  
-def ensure_pod(v1, ns, pod_name, node, image, labels, toleration_key):
-    try:
-        v1.read_namespaced_pod(pod_name, ns)
-        return False
-    except ApiException as e:
-        if e.status != 404: raise
-    body = client.V1Pod(
-        api_version="v1",
-        kind="Pod",
-        metadata=client.V1ObjectMeta(
-            name=pod_name,
-            labels=labels,
-            annotations={"emulator.power/watts":"0","emulator.power/version":"0"},
-        ),
-        spec=client.V1PodSpec(
-            node_name=node,
-            tolerations=[client.V1Toleration(key=toleration_key, effect="NoSchedule", operator="Exists")],
-            containers=[client.V1Container(name="nop", image=image, image_pull_policy="IfNotPresent")],
-            restart_policy="Always",
-        ),
-    )
-    v1.create_namespaced_pod(ns, body)
-    return True
- 
-def patch_annotations(v1, ns, pod, watts, version, key_watts, key_ver):
-    body = {"metadata":{"annotations":{key_watts:str(watts), key_ver:str(version)}}}
+def patch_annotations(v1, ns, pod, watts, version, key_watts, key_ver, batch=None, key_batch=None, stamps=None):
+    ann = {key_watts:str(watts), key_ver:str(version)}
+    if key_batch:
+        # change-only replays: how many pods carry this version, so the
+        # exporter knows when the (partial) batch is complete; full replays
+        # delete a size left over from an earlier change-only run (null in a
+        # merge patch), or the quorum would keep applying it
+        ann[key_batch] = None if batch is None else str(batch)
+    if stamps:
+        # per-row timing (row deadline, row period) for the exporter
+        ann.update(stamps)
+    body = {"metadata":{"annotations":ann}}
     v1.patch_namespaced_pod(name=pod, namespace=ns, body=body)
  
-def is_number(x):
-    try:
-        if x is None: return False
-        if isinstance(x,str) and not x.strip(): return False
-        v = float(x)
-        return not pd.isna(v)
-    except Exception:
-        return False
+def row_stamps(args, deadline, tick, trace_time=None):
+    stamps = {args.scheduled_key: f"{wall_deadline(deadline):.3f}", args.period_key: f"{tick:g}"}
+    if trace_time is not None:
+        stamps[args.trace_time_key] = f"{trace_time:.3f}"
+    return stamps
+ 
+def replay_tick(args, plan):
+    # --speedup plays the trace's own timeline N times faster; otherwise one row per --tick
+    if not args.speedup:
+        return args.tick
+    if not plan.step:
+        print("--speedup needs a numeric 'time' column in the CSV.", file=sys.stderr); sys.exit(2)
+    return plan.step / args.speedup
  
 def main():
     ap = argparse.ArgumentParser(description="Create pods from CSV headers and annotate watts + version atomically.")
@@ -80,67 +86,188 @@ def main():
     ap.add_argument("--image", default="registry.k8s.io/pause:3.9")
     ap.add_argument("--annotation-key", default="emulator.power/watts")
     ap.add_argument("--version-key", default="emulator.power/version")
+    ap.add_argument("--batch-key", default="emulator.power/batch")
+    ap.add_argument("--scheduled-key", default=SCHEDULED_KEY)
+    ap.add_argument("--period-key", default=PERIOD_KEY)
+    ap.add_argument("--trace-time-key", default=TRACE_TIME_KEY)
     ap.add_argument("--ignore", default=IGNORE_REGEX)
+    ap.add_argument("--cache-dir", default=None,
+                    help="where to keep the memory-mapped trace cache (default: next to the CSV)")
+    ap.add_argument("--no-cache", action="store_true", help="parse the CSV in chunks every run instead of caching it")
+    ap.add_argument("--chunksize", type=int, default=1000, help="CSV rows parsed per chunk")
     ap.add_argument("--name-prefix", default="")
     ap.add_argument("--label-app", default="kwok-power")
     ap.add_argument("--tick", type=float, default=15.0, help="seconds between rows")
+    ap.add_argument("--speedup", type=float, default=0,
+                    help="replay the CSV's time column N times faster (tick = row step / N; overrides --tick)")
+    ap.add_argument("--resample", type=float, default=0,
+                    help="resample the trace onto a uniform grid of this many trace seconds before replaying")
+    ap.add_argument("--resample-method", choices=RESAMPLE_METHODS, default="hold",
+                    help="hold: last sample at or before each grid point; linear: interpolate")
     ap.add_argument("--loop", action="store_true")
     ap.add_argument("--concurrency", type=int, default=32, help="parallel patches per batch")
+    ap.add_argument("--late-policy", choices=LATE_POLICIES, default="run",
+                    help="what to do with rows that start more than --max-lag after their deadline "
+                         "(run: fire anyway, coalesce: jump to newest due row, skip: drop them)")
+    ap.add_argument("--max-lag", type=float, default=None,
+                    help="seconds a row may start after its deadline before it counts as late (default: one tick)")
+    ap.add_argument("--changes-only", action="store_true",
+                    help="only patch pods whose value changed since the last write (adds the --batch-key annotation)")
+    ap.add_argument("--full-refresh-every", type=int, default=0,
+                    help="with --changes-only, patch every pod every N rows (default: 0 = first row only)")
+    ap.add_argument("--create-concurrency", type=int, default=16, help="parallel pod creations while provisioning")
+    ap.add_argument("--prune", action="store_true",
+                    help="delete pods with app=<label-app> on --node that no longer map to a CSV column")
+    ap.add_argument("--write-mode", choices=("pods","configmap"), default="pods",
+                    help="pods: annotate every pod; configmap: write each row as one ConfigMap per node "
+                         "(kwok-power-<node>) read by power_export_versioned2.py --source configmap")
+    ap.add_argument("--patch-retries", type=int, default=3, help="retries per write on 409/429/5xx")
+    ap.add_argument("--qps", type=float, default=0.0,
+                    help="client-side API request rate limit, like client-go QPS (default: 0 = unlimited)")
+    ap.add_argument("--burst", type=int, default=None, help="requests allowed above --qps after idle time (default: --qps)")
+    ap.add_argument("--pool-size", type=int, default=0,
+                    help="keep-alive HTTP connections (default: max of --concurrency and --create-concurrency)")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="serve annotator self-metrics (row lag, batch time, write errors/retries) on this port")
+    ap.add_argument("--amplify-pods", type=int, default=0,
+                    help="replay this many synthetic pods generated from the CSV's columns (trace_amplifier.py)")
+    ap.add_argument("--amplify-seed", type=int, default=0)
+    ap.add_argument("--amplify-jitter", type=float, default=0.05, help="per-cell noise fraction (default: 0.05)")
+    ap.add_argument("--amplify-shift", type=float, default=300.0,
+                    help="max time shift per replica in trace seconds (default: 300)")
+    ap.add_argument("--amplify-scale", type=float, default=0.2, help="per-replica scale spread (default: 0.2)")
+    ap.add_argument("--shm", action="store_true",
+                    help="also publish every row into a shared-memory ring buffer for exporters on this host "
+                         "(--source shm); the API only gets every --mirror-every-th row")
+    ap.add_argument("--shm-dir", default=SHM_DIR, help=f"ring buffer directory (default: {SHM_DIR})")
+    ap.add_argument("--mirror-every", type=int, default=10,
+                    help="with --shm, write every Nth row to the pods/ConfigMap for kubectl users (0 = never)")
+    ap.add_argument("--checkpoint", default=None,
+                    help="replay checkpoint file (default: <csv>.<node>.checkpoint.json next to the trace cache)")
+    ap.add_argument("--no-checkpoint", action="store_true", help="start at row 0 and do not record progress")
+    ap.add_argument("--checkpoint-every", type=float, default=1.0, help="seconds between checkpoint writes")
+    ap.add_argument("--reprovision", action="store_true",
+                    help="list/create pods even if the checkpoint's column->pod mapping is unchanged")
     args = ap.parse_args()
  
-    df = pd.read_csv(args.csv)
-    cols = choose_columns(df, args.ignore)
-    if not cols:
-        print("No usable columns (after ignoring time/total/Unnamed).", file=sys.stderr); sys.exit(2)
+    # Streamed into a memory-mapped float64 matrix once; non-numeric cells replay as 0 W
+    try:
+        plan = load_plan(args.csv, args.ignore, fill=0.0, cache=not args.no_cache,
+                         cache_dir=args.cache_dir, chunksize=args.chunksize,
+                         resample_step=args.resample or ("native" if args.speedup else None),
+                         method=args.resample_method)
+    except ValueError as e:
+        print(e, file=sys.stderr); sys.exit(2)
+    if args.amplify_pods:
+        plan = AmplifiedPlan(plan, args.amplify_pods, args.node, args.amplify_seed, args.amplify_jitter,
+                             args.amplify_shift, args.amplify_scale)
+        print(f"AMPLIFY {len(plan.sources)} pods from {len(set(plan.sources))} columns (seed {args.amplify_seed})")
+    tick = replay_tick(args, plan)
+    if args.speedup or args.resample:
+        print(f"REPLAY {len(plan)} rows of {plan.step:g} trace-s every {tick:g}s "
+              f"({plan.step / tick if tick else float('inf'):g}x, {args.resample_method})")
  
-    # build mapping column -> pod name
-    mapping = {}
-    used = set()
-    for c in cols:
-        base = sanitize_name(c, args.name_prefix)
-        name = base; i = 1
-        while name in used:
-            sfx = f"-{i}"
-            name = (base[:63-len(sfx)]) + sfx
-            i += 1
-        used.add(name)
-        mapping[c] = name
+    mapping = build_mapping(plan.columns, args.name_prefix)
+ 
+    # resume row cursor and version counter from the last run
+    ckpt_path = None if args.no_checkpoint else (args.checkpoint or default_path(args.csv, args.node, args.cache_dir))
+    try:
+        ckpt = Checkpointer(ckpt_path, mapping_hash((args.namespace, args.node, args.label_app, c, p)
+                                                    for c, p in mapping.items()),
+                            len(plan), source=source_fingerprint([args.csv]), every=args.checkpoint_every)
+    except ValueError as e:
+        print(f"{args.csv}: {e}", file=sys.stderr); sys.exit(2)
+    first = ckpt.resume(args.loop)
+ 
+    # pooled keep-alive connections for every worker, optional QPS/burst ceiling
+    v1 = make_core_v1(args.pool_size or max(args.concurrency, args.create_concurrency), args.qps, args.burst)
+ 
+    # create missing pods (one LIST, concurrent CREATEs)
+    desired = [DesiredPod(args.namespace, pod, args.node, {"app": args.label_app, "kwok.power/column": src})
+               for (col, pod), src in zip(mapping.items(), plan.sources)]
+    def provision():
+        ensure_ns(v1, args.namespace)
+        provision_pods(v1, desired, label_selector=f"app={args.label_app}", image=args.image,
+                       annotations={"emulator.power/watts":"0","emulator.power/version":"0"},
+                       concurrency=args.create_concurrency, prune=args.prune)
+    trust_pods = ckpt.same_mapping and not args.reprovision
+    if trust_pods:
+        print("PROVISION skipped: column->pod mapping unchanged since the checkpoint (--reprovision to force)")
+    else:
+        provision()
+ 
+    cursor = ReplayCursor(plan, changes_only=args.changes_only, full_refresh_every=args.full_refresh_every)
+    pods = [mapping[c] for c in plan.columns]
+    ring = None
+    if args.shm:
+        ring = RingWriter(ring_path(args.shm_dir, args.namespace, args.node), args.namespace, args.node,
+                          args.label_app, plan.sources, pods)
+        # versions also continue above the ring's, for exporters reading it
+        ckpt.offset = max(ckpt.offset, ring.last_version - first)
+        mirrored = f"every {args.mirror_every} rows" if args.mirror_every > 0 else "off"
+        print(f"SHM {ring.path}: every row; API mirror {mirrored}")
  
-    load_kubeconfig()
-    v1 = client.CoreV1Api()
-    ensure_ns(v1, args.namespace)
- 
-    # create pods if missing
-    for col, pod in mapping.items():
-        created = ensure_pod(
-            v1, ns=args.namespace, pod_name=pod, node=args.node,
-            image=args.image,
-            labels={"app": args.label_app, "kwok.power/column": col},
-            toleration_key="kwok.x-k8s.io/node",
-        )
-        print(f"{'CREATED' if created else 'EXISTS '} {args.namespace}/{pod} for column '{col}'")
- 
-    version = 0
-    while True:
-        for _, row in df.iterrows():
-            version += 1
+    # Row n of the replay (across loop passes) is due at t0 + n*tick; one
+    # long-lived pool serves every batch.
+    n_rows = len(plan)
+    sched = DeadlineScheduler(tick, policy=args.late_policy, max_lag=args.max_lag)
+    metrics = AnnotatorMetrics()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    atexit.register(ckpt.close)   # also on Ctrl-C: keep the cursor of the last finished row
+    with ThreadPoolExecutor(max_workers=max(1,args.concurrency)) as ex:
+        for n, deadline, lag in sched.run(first=first, last=None if args.loop else n_rows):
+            idx = n % n_rows
+            version = ckpt.version(n)
+            metrics.row_lag.observe(lag)
+            if lag > sched.max_lag:
+                print(f"LATE row {idx} (pass {n // n_rows}) started {lag:.3f}s after its deadline", file=sys.stderr)
+            trace_time = plan.trace_time(n, tick)
+            if ring is not None:
+                # the whole row, visible to local exporters at once
+                ring.write(version, plan.row(idx), wall_deadline(deadline), tick, trace_time)
+            mirror = ring is None or (args.mirror_every > 0 and n % args.mirror_every == 0)
+            vals, write = cursor.step(idx) if mirror else (None, [])
+            batch = len(write) if args.changes_only else None
+            stamps = row_stamps(args, deadline, tick, trace_time)
+            started = time.monotonic()
             futures = []
-            with ThreadPoolExecutor(max_workers=max(1,args.concurrency)) as ex:
-                for col, pod in mapping.items():
-                    val = row[col] if col in row else None
-                    watts = float(val) if is_number(val) else 0.0
-                    futures.append(ex.submit(
-                        patch_annotations, v1, args.namespace, pod, watts, version,
-                        args.annotation_key, args.version_key
-                    ))
-                for f in as_completed(futures):
-                    try: f.result()
-                    except Exception as e:
-                        print(f"PATCH error: {e}", file=sys.stderr)
+            if mirror and args.write_mode == "configmap":
+                # whole row for the node in one write; readers never see half a batch
+                write = []
+                futures.append(ex.submit(
+                    metrics.call, "configmap", write_node_snapshot, v1, args.namespace, args.node, version,
+                    dict(zip(plan.columns, vals)), mapping, args.label_app, wall_deadline(deadline), tick,
+                    trace_time, retries=args.patch_retries
+                ))
+            for c in write:
+                futures.append(ex.submit(
+                    metrics.call, "patch", patch_annotations, v1, args.namespace, pods[c], vals[c], version,
+                    args.annotation_key, args.version_key, batch, args.batch_key, stamps,
+                    retries=args.patch_retries
+                ))
+            missing = 0
+            for f in as_completed(futures):
+                try: f.result()
+                except Exception as e:
+                    missing += getattr(e, "status", None) == 404
+                    print(f"PATCH error: {e}", file=sys.stderr)
             # finished atomic batch; exporter will pick modal 'version'
-            time.sleep(max(0.0, args.tick))
-        if not args.loop:
-            break
+            took = time.monotonic() - started
+            metrics.batch.observe(time.monotonic() - deadline)
+            if took > tick:
+                print(f"OVERRUN row {idx}: batch took {took:.3f}s (tick {tick:g}s)", file=sys.stderr)
+            ckpt.record(n)
+            if missing and trust_pods:
+                # pods went away while we were down: provision after all
+                print(f"PROVISION {missing} pod(s) not found; re-provisioning", file=sys.stderr)
+                provision()
+                trust_pods = False
+                cursor.last_row = None    # next row rewrites every pod
+    limiter = v1.api_client.limiter
+    throttled = f", {limiter.waited:.1f}s throttled at {args.qps:g} qps" if limiter is not None else ""
+    print(f"Replay done: {sched.fired} rows fired, {sched.late} late, {sched.dropped} dropped, "
+          f"max lag {sched.max_seen_lag:.3f}s, {cursor.cells_written}/{cursor.cells_total} cells patched{throttled}")
  
 if __name__ == "__main__":
     main()
\ No newline at end of file
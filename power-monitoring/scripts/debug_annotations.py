@@ -1,41 +1,295 @@
 #!/usr/bin/env python3
-# debug_annotations.py
-from kubernetes import client, config
-import time
-
-config.load_kube_config()
-v1 = client.CoreV1Api()
-
-print("Monitoring pod annotations in real-time...\n")
-
-while True:
-    pods = v1.list_namespaced_pod("demo", label_selector="app=kwok-power").items
-    
-    total = 0.0
-    zero_count = 0
-    missing_count = 0
-    
-    print(f"\n=== {time.strftime('%H:%M:%S')} ===")
-    
-    for p in pods:
-        name = p.metadata.name
-        ann = (p.metadata.annotations or {}).get("emulator.power/watts")
-        
-        if ann is None:
-            missing_count += 1
-            print(f"  {name:30s} - MISSING ANNOTATION")
-        elif ann == "0" or ann == "0.0":
-            zero_count += 1
-        else:
-            try:
-                watts = float(ann)
-                total += watts
-                if watts > 50:  # Only print significant values
-                    print(f"  {name:30s} = {watts:6.2f}W")
-            except:
-                print(f"  {name:30s} = INVALID: {ann}")
-    
-    print(f"\n  TOTAL: {total:.2f}W  |  Zeros: {zero_count}  |  Missing: {missing_count}  |  Total pods: {len(pods)}")
-    if total < 5:
-        print(f"!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!found bug {total} !!!!!!!!!!!!!!!!!!!!!!!!!!!")
-    time.sleep(1)
\ No newline at end of file
+import argparse, sys, time
+import numpy as np
+from kube_transport import make_core_v1
+from pod_informer import PodInformer
+from trace_cache import DEFAULT_IGNORE, read_trace
+
+"""
+Live anomaly monitor for the power annotations.
+
+Follows the pods through one list + watch (pod_informer.PodInformer) instead
+of re-listing every second, keeps per-node totals up to date from the changed
+pods only, samples every node every --interval seconds into a fixed-size ring
+buffer (--history samples) and reports, with the offending pods and versions:
+
+  DROP      node total fell by more than --drop-ratio against the median of the
+            last --drop-window samples (or below the --min-total floor)
+  SPIKE     a pod or node total above the maximum of that node's own trace
+            (--csv NODE=CSV, as the annotator's --node/--csv; or --max-*)
+  MISSING   pods without a parseable watts/version annotation
+  MIXED     a node holding several versions for longer than --mixed-grace
+            (normal for a moment while a row is being written)
+
+Anomalies are printed when they start and when they clear; --summary prints
+the per-node totals every few seconds.
+
+  python scripts/debug_annotations.py --namespaces demo --csv sn-fake=data/sn.csv sa-fake=data/sa.csv
+"""
+
+MAX_LISTED = 5   # offending pods listed per anomaly
+
+
+class Ring:
+    """Fixed-size float ring buffer."""
+
+    def __init__(self, size):
+        self.buf = np.zeros(max(1, size))
+        self.pos = 0
+        self.count = 0
+
+    def push(self, value):
+        self.buf[self.pos] = value
+        self.pos = (self.pos + 1) % len(self.buf)
+        self.count = min(self.count + 1, len(self.buf))
+
+    def last(self, n):
+        n = min(n, self.count)
+        idx = (self.pos - n + np.arange(n)) % len(self.buf)
+        return self.buf[idx]
+
+
+class NodeWatch:
+    __slots__ = ("pods", "missing", "versions", "total", "ring", "moved", "spiked", "mixed_since", "active",
+                 "max_pod", "max_total")
+
+    def __init__(self, history, max_pod=None, max_total=None):
+        self.pods = {}            # key -> (version, watts)
+        self.missing = set()      # keys with unusable annotations
+        self.versions = {}        # version -> pod count
+        self.total = 0.0
+        self.ring = Ring(history)
+        self.moved = {}           # key -> watts at the previous sample (pods changed since)
+        self.spiked = {}          # key -> watts above the pod maximum, since the previous sample
+        self.mixed_since = None
+        self.active = {}          # anomaly kind -> start time
+        self.max_pod, self.max_total = max_pod, max_total
+
+
+class AnnotationMonitor:
+    def __init__(self, args, ceilings=None, out=sys.stdout):
+        self.args = args
+        self.ceilings = ceilings or {}    # node -> (max pod watts, max node total); --max-* override both
+        self.out = out
+        self.nodes = {}
+        self._where = {}          # key -> node
+
+    def _node(self, node):
+        st = self.nodes.get(node)
+        if st is None:
+            a = self.args
+            max_pod, max_total = self.ceilings.get(node, (None, None))
+            st = self.nodes[node] = NodeWatch(a.history, a.max_pod if a.max_pod is not None else max_pod,
+                                              a.max_total if a.max_total is not None else max_total)
+        return st
+
+    def _parse(self, rec):
+        ann = rec.annotations
+        try:
+            return int(float(ann[self.args.version_key])), float(ann[self.args.annotation_key])
+        except Exception:
+            return None
+
+    def _forget(self, key):
+        node = self._where.pop(key, None)
+        if node is None:
+            return
+        st = self.nodes[node]
+        st.missing.discard(key)
+        old = st.pods.pop(key, None)
+        if old is not None:
+            st.moved.setdefault(key, old[1])
+            st.total -= old[1]
+            c = st.versions[old[0]] - 1
+            if c:
+                st.versions[old[0]] = c
+            else:
+                del st.versions[old[0]]
+
+    def apply(self, changed, deleted):
+        for key in deleted:
+            self._forget(key)
+        for key, rec in changed.items():
+            self._forget(key)
+            node = rec.node or "(unscheduled)"
+            st = self._node(node)
+            self._where[key] = node
+            parsed = self._parse(rec)
+            if parsed is None:
+                st.missing.add(key)
+                continue
+            ver, watts = parsed
+            st.pods[key] = parsed
+            st.moved.setdefault(key, 0.0)
+            st.total += watts
+            st.versions[ver] = st.versions.get(ver, 0) + 1
+            if st.max_pod is not None and watts > st.max_pod * self.args.tolerance:
+                st.spiked[key] = watts
+
+    # ---------- sampling ----------
+    def _raise(self, st, node, kind, now, detail):
+        if kind not in st.active:
+            st.active[kind] = now
+            self._print(f"{kind:7s} {node}: {detail}")
+
+    def _clear(self, st, node, kind, now):
+        since = st.active.pop(kind, None)
+        if since is not None:
+            self._print(f"CLEARED {node}: {kind} after {now - since:.1f}s (total {st.total:.2f}W)")
+
+    def _print(self, line):
+        print(f"[{time.strftime('%H:%M:%S')}] {line}", file=self.out, flush=True)
+
+    @staticmethod
+    def _pods(keys):
+        keys = sorted(keys)
+        names = ", ".join(f"{ns}/{name}" for ns, name in keys[:MAX_LISTED])
+        return names + (f" (+{len(keys) - MAX_LISTED} more)" if len(keys) > MAX_LISTED else "")
+
+    def sample(self, now=None):
+        now = time.monotonic() if now is None else now
+        a = self.args
+        for node, st in self.nodes.items():
+            window = st.ring.last(a.drop_window)
+            window = window[~np.isnan(window)]
+            over_total = st.max_total is not None and st.total > st.max_total * a.tolerance
+            spiking = bool(st.spiked) or over_total
+            # spike samples stay out of the drop reference, so coming back down is not a drop
+            st.ring.push(np.nan if spiking else st.total)
+            fallers = sorted(((st.pods.get(k, (None, 0.0))[1] - old, k) for k, old in st.moved.items()))
+            st.moved.clear()
+
+            if spiking:
+                pods = ", ".join(f"{k[1]}={w:.2f}W" for k, w in sorted(st.spiked.items())[:MAX_LISTED])
+                limit = f"node max {st.max_total:.2f}W" if over_total else f"pod max {st.max_pod:.2f}W"
+                self._raise(st, node, "SPIKE", now, f"total {st.total:.2f}W above {limit}; pods: {pods or '-'}")
+            else:
+                self._clear(st, node, "SPIKE", now)
+            st.spiked.clear()
+
+            ref = float(np.median(window)) if len(window) else None
+            dropped = ref is not None and ref > a.min_total and st.total < ref * (1.0 - a.drop_ratio)
+            if not spiking and (dropped or (st.pods and st.total < a.min_total)):
+                worst = ", ".join(f"{k[1]}@v{st.pods[k][0] if k in st.pods else '-'} {d:+.2f}W"
+                                  for d, k in fallers[:MAX_LISTED] if d < 0)
+                ref_s = f" from median {ref:.2f}W" if ref is not None else ""
+                self._raise(st, node, "DROP", now, f"total {st.total:.2f}W{ref_s}; biggest falls: {worst or 'none'}")
+            else:
+                self._clear(st, node, "DROP", now)
+
+            if st.missing:
+                self._raise(st, node, "MISSING", now,
+                            f"{len(st.missing)} pod(s) without a usable {a.annotation_key} or {a.version_key}: "
+                            f"{self._pods(st.missing)}")
+            else:
+                self._clear(st, node, "MISSING", now)
+
+            if len(st.versions) > 1:
+                if st.mixed_since is None:
+                    st.mixed_since = now
+                if now - st.mixed_since >= a.mixed_grace:
+                    newest = max(st.versions)
+                    lagging = [k for k, (v, _) in st.pods.items() if v != newest]
+                    counts = ", ".join(f"v{v}:{n}" for v, n in sorted(st.versions.items()))
+                    self._raise(st, node, "MIXED", now, f"versions {counts}; behind v{newest}: {self._pods(lagging)}")
+            else:
+                st.mixed_since = None
+                self._clear(st, node, "MIXED", now)
+
+    def summary(self):
+        for node in sorted(self.nodes):
+            st = self.nodes[node]
+            vers = ",".join(f"v{v}" for v in sorted(st.versions)) or "-"
+            flags = " ".join(sorted(st.active))
+            self._print(f"  {node:24s} {st.total:10.2f}W  pods={len(st.pods):5d}  missing={len(st.missing):4d}  "
+                        f"versions={vers}  {flags}")
+
+
+def trace_maxima(path, ignore_regex=DEFAULT_IGNORE):
+    """(largest single value, largest row total) of one trace CSV. Rows without a time (a
+    trailing summary row, say) are skipped when the trace has a time column."""
+    _, values, times = read_trace(path, ignore_regex)
+    if times is not None:
+        values = values[~np.isnan(times)]
+    if not values.size or np.isnan(values).all():
+        return None, None
+    return float(np.nanmax(values)), float(np.nansum(values, axis=1).max())
+
+
+def node_ceilings(pairs, ignore_regex=DEFAULT_IGNORE):
+    """{node: (max pod watts, max node total)} from (node, csv) pairs. Traces replayed onto the
+    same node add up: the pod ceiling is the largest of them, the node ceiling their sum."""
+    ceilings = {}
+    for node, path in pairs:
+        m, t = trace_maxima(path, ignore_regex)
+        if m is None:
+            continue
+        pod, total = ceilings.get(node, (m, 0.0))
+        ceilings[node] = (max(pod, m), total + t)
+    return ceilings
+
+
+def node_csv(spec):
+    node, sep, path = spec.partition("=")
+    if not sep or not node or not path:
+        raise argparse.ArgumentTypeError(f"expected NODE=CSV, got {spec!r}")
+    return node, path
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Watch power annotations and report anomalies per node.")
+    ap.add_argument("--namespaces", nargs="*", default=["demo"], help="namespaces to watch (default: demo; empty: all)")
+    ap.add_argument("--label-selector", default="app=kwok-power")
+    ap.add_argument("--annotation-key", default="emulator.power/watts")
+    ap.add_argument("--version-key", default="emulator.power/version")
+    ap.add_argument("--interval", type=float, default=0.25, help="seconds between samples (default: 0.25)")
+    ap.add_argument("--history", type=int, default=240, help="samples kept per node (default: 240)")
+    ap.add_argument("--drop-ratio", type=float, default=0.5,
+                    help="flag a drop when the total falls by more than this fraction of the recent median")
+    ap.add_argument("--drop-window", type=int, default=8, help="samples the drop median is taken over")
+    ap.add_argument("--min-total", type=float, default=5.0, help="flag nodes with pods whose total is below this")
+    ap.add_argument("--mixed-grace", type=float, default=2.0,
+                    help="seconds a node may hold several versions before it is flagged")
+    ap.add_argument("--csv", nargs="*", type=node_csv, default=[], metavar="NODE=CSV",
+                    help="trace CSV replayed onto each node (the annotator's --node/--csv); its maxima bound "
+                         "that node's pod and total values")
+    ap.add_argument("--ignore", default=DEFAULT_IGNORE, help="regex of CSV columns to drop")
+    ap.add_argument("--max-pod", type=float, default=None, help="pod watts ceiling on every node (overrides --csv)")
+    ap.add_argument("--max-total", type=float, default=None, help="node total ceiling on every node (overrides --csv)")
+    ap.add_argument("--tolerance", type=float, default=1.05, help="slack on the ceilings (default: 1.05)")
+    ap.add_argument("--summary", type=float, default=5.0, help="seconds between per-node summaries (0: off)")
+    ap.add_argument("--metadata-only", action="store_true",
+                    help="watch PartialObjectMetadata (node from the kwok.power/node label)")
+    ap.add_argument("--page-size", type=int, default=500)
+    args = ap.parse_args()
+
+    ceilings = node_ceilings(args.csv, args.ignore)
+
+    v1 = make_core_v1(concurrency=len(args.namespaces) + 1)
+    informer = PodInformer(v1, args.namespaces, args.label_selector, name="monitor",
+                           page_size=args.page_size, metadata_only=args.metadata_only).start()
+    informer.wait_synced()
+    mon = AnnotationMonitor(args, ceilings)
+    ceil = f"trace ceilings for {len(ceilings)} node(s)" if ceilings else "no trace ceilings"
+    print(f"Monitoring {len(informer)} pods in {', '.join(args.namespaces) or 'all namespaces'} "
+          f"every {args.interval}s ({ceil})", flush=True)
+    for node in sorted(ceilings):
+        print(f"  {node:24s} pod<={ceilings[node][0]:.2f}W node<={ceilings[node][1]:.2f}W", flush=True)
+
+    next_summary = time.monotonic() + args.summary
+    try:
+        while True:
+            mon.apply(*informer.drain())
+            mon.sample()
+            if args.summary > 0 and time.monotonic() >= next_summary:
+                mon.summary()
+                next_summary += args.summary
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        informer.stop()
+
+
+if __name__ == "__main__":
+    main()
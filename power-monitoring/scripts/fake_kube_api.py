@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+import argparse, base64, copy, json, socket, threading, time, uuid
+import yaml
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+"""
+In-memory stand-in for the slice of the Kubernetes core/v1 API used by the
+annotators and exporters, served over HTTP on localhost so the real
+`kubernetes` client (including watch streams) runs against it unchanged.
+
+Supported:
+  namespaces   GET one, POST
+  pods         LIST / WATCH (all namespaces or one), GET, POST, PATCH, PUT, DELETE
+  configmaps   same as pods
+
+LIST/WATCH understand labelSelector (k=v, k!=v, k), resourceVersion and
+timeoutSeconds; LIST pages with limit/continue (the token expires with 410
+once its resourceVersion is compacted, but later pages show current objects
+rather than a consistent snapshot), and both honour an Accept header asking
+for PartialObjectMetadata(List) by returning metadata-only objects. PATCH
+applies a JSON merge patch (strategic merge behaves the same for the
+metadata/data fields these scripts touch). Every write bumps a global
+resourceVersion and is appended to a bounded event history; a WATCH from a
+resourceVersion older than that history gets a 410 Gone ERROR event, like a
+compacted etcd.
+
+  python scripts/fake_kube_api.py --port 18080 --kubeconfig /tmp/fake.kubeconfig
+  KUBECONFIG=/tmp/fake.kubeconfig python scripts/create_pods_annotate_parallel.py ...
+"""
+
+KINDS = {"pods": "Pod", "configmaps": "ConfigMap"}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _status(code, reason, message):
+    return {"kind": "Status", "apiVersion": "v1", "metadata": {}, "status": "Failure",
+            "message": message, "reason": reason, "code": code}
+
+
+def parse_selector(sel):
+    reqs = []
+    for part in (sel or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "!=" in part:
+            k, v = part.split("!=", 1); reqs.append((k.strip(), "!=", v.strip()))
+        elif "==" in part:
+            k, v = part.split("==", 1); reqs.append((k.strip(), "=", v.strip()))
+        elif "=" in part:
+            k, v = part.split("=", 1); reqs.append((k.strip(), "=", v.strip()))
+        elif part.startswith("!"):
+            reqs.append((part[1:].strip(), "!", None))
+        else:
+            reqs.append((part, "exists", None))
+    return reqs
+
+
+def matches(obj, reqs):
+    labels = obj.get("metadata", {}).get("labels") or {}
+    for k, op, v in reqs:
+        if op == "=" and labels.get(k) != v: return False
+        if op == "!=" and labels.get(k) == v: return False
+        if op == "exists" and k not in labels: return False
+        if op == "!" and k in labels: return False
+    return True
+
+
+def partial_metadata(obj):
+    return {"kind": "PartialObjectMetadata", "apiVersion": "meta.k8s.io/v1", "metadata": obj["metadata"]}
+
+
+def merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    out = dict(target) if isinstance(target, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            out.pop(k, None)
+        else:
+            out[k] = merge_patch(out.get(k), v)
+    return out
+
+
+class FakeKubeAPI:
+    def __init__(self, host="127.0.0.1", port=0, history=100000, latency=0.0):
+        self.host, self.port = host, port
+        self.latency = latency            # artificial per-request delay (seconds)
+        self.requests = Counter()         # (method, resource) -> count
+        self._cond = threading.Condition()
+        self._rv = 0
+        self._objs = {"namespaces": {}, "pods": {}, "configmaps": {}}
+        self._events = deque(maxlen=history)   # (rv, resource, type, obj)
+        self._compacted_rv = 0
+        self._stopping = False
+        self._httpd = None
+
+    # ---------- lifecycle ----------
+    def start(self):
+        api = self
+
+        class Handler(_Handler):
+            fake = api
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="fake-kube-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def core_v1(self, pool_maxsize=None):
+        from kubernetes import client
+        cfg = client.Configuration()
+        cfg.host = self.url
+        if pool_maxsize:
+            cfg.connection_pool_maxsize = pool_maxsize
+        return client.CoreV1Api(client.ApiClient(cfg))
+
+    def compact(self):
+        # Forget the whole event history: every open resourceVersion becomes too old
+        with self._cond:
+            self._events.clear()
+            self._compacted_rv = self._rv
+
+    def count(self, resource):
+        return len(self._objs[resource])
+
+    # ---------- store (caller holds self._cond) ----------
+    def _record(self, resource, etype, obj):
+        if len(self._events) == self._events.maxlen:
+            self._compacted_rv = self._events[0][0]
+        self._events.append((self._rv, resource, etype, obj))
+        self._cond.notify_all()
+
+    def _bump(self, obj):
+        self._rv += 1
+        obj["metadata"]["resourceVersion"] = str(self._rv)
+        return obj
+
+    def create(self, resource, ns, body):
+        meta = body.setdefault("metadata", {})
+        name = meta.get("name")
+        if not name:
+            return 422, _status(422, "Invalid", "metadata.name is required")
+        key = (ns, name)
+        with self._cond:
+            store = self._objs[resource]
+            if key in store:
+                return 409, _status(409, "AlreadyExists", f'{resource} "{name}" already exists')
+            if ns is not None:
+                meta["namespace"] = ns
+            meta.setdefault("uid", str(uuid.uuid4()))
+            meta.setdefault("creationTimestamp", _now())
+            body.setdefault("apiVersion", "v1")
+            body.setdefault("kind", KINDS.get(resource, "Namespace"))
+            if resource == "pods":
+                body.setdefault("status", {"phase": "Running"})
+            self._bump(body)
+            store[key] = body
+            self._record(resource, "ADDED", body)
+            return 201, body
+
+    def get(self, resource, ns, name):
+        obj = self._objs[resource].get((ns, name))
+        if obj is None:
+            return 404, _status(404, "NotFound", f'{resource} "{name}" not found')
+        return 200, obj
+
+    def update(self, resource, ns, name, patch=None, replace=None):
+        with self._cond:
+            store = self._objs[resource]
+            cur = store.get((ns, name))
+            if cur is None:
+                return 404, _status(404, "NotFound", f'{resource} "{name}" not found')
+            if replace is not None:
+                new = dict(replace)
+                new["metadata"] = dict(replace.get("metadata") or {}, name=name, namespace=ns,
+                                       uid=cur["metadata"]["uid"],
+                                       creationTimestamp=cur["metadata"]["creationTimestamp"])
+            else:
+                new = merge_patch(cur, patch or {})
+                new["metadata"] = dict(new["metadata"])   # never bump the stored/event copy
+            self._bump(new)
+            store[(ns, name)] = new
+            self._record(resource, "MODIFIED", new)
+            return 200, new
+
+    def delete(self, resource, ns, name):
+        with self._cond:
+            obj = self._objs[resource].pop((ns, name), None)
+            if obj is None:
+                return 404, _status(404, "NotFound", f'{resource} "{name}" not found')
+            gone = dict(obj, metadata=dict(obj["metadata"]))
+            self._bump(gone)
+            self._record(resource, "DELETED", gone)
+            return 200, gone
+
+    def list(self, resource, ns, reqs, limit=0, token=None, partial=False):
+        after = None
+        with self._cond:
+            if token:
+                try:
+                    rv, after = json.loads(base64.urlsafe_b64decode(token))
+                except Exception:
+                    return 400, _status(400, "BadRequest", "invalid continue token")
+                if rv < self._compacted_rv:
+                    return 410, _status(410, "Expired", "continue token too old; restart the list")
+                after = tuple(after)
+            else:
+                rv = self._rv
+            keys = sorted(k for k, o in self._objs[resource].items()
+                          if (ns is None or k[0] == ns) and (after is None or k > after) and matches(o, reqs))
+            more = bool(limit) and len(keys) > limit
+            if more:
+                keys = keys[:limit]
+            items = [self._objs[resource][k] for k in keys]
+        meta = {"resourceVersion": str(rv)}
+        if more:
+            meta["continue"] = base64.urlsafe_b64encode(json.dumps([rv, list(keys[-1])]).encode()).decode()
+        if partial:
+            return 200, {"kind": "PartialObjectMetadataList", "apiVersion": "meta.k8s.io/v1",
+                         "metadata": meta, "items": [partial_metadata(o) for o in items]}
+        return 200, {"kind": KINDS[resource] + "List", "apiVersion": "v1", "metadata": meta, "items": items}
+
+    def events_after(self, rv, resource, ns, reqs, timeout):
+        """Block until events newer than rv exist (or timeout); -> (new rv, events) or None if too old."""
+        with self._cond:
+            if rv < self._compacted_rv:
+                return None
+            if not self._events or self._events[-1][0] <= rv:
+                self._cond.wait(timeout)
+            out = []
+            for erv, eres, etype, obj in reversed(self._events):
+                if erv <= rv:
+                    break
+                if eres == resource and (ns is None or obj["metadata"].get("namespace") == ns) \
+                        and matches(obj, reqs):
+                    out.append((etype, obj))
+            last = self._events[-1][0] if self._events else rv
+            return max(rv, last), out[::-1]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---------- plumbing ----------
+    def _route(self):
+        parts = urlsplit(self.path)
+        seg = [s for s in parts.path.split("/") if s]
+        q = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        if seg[:2] != ["api", "v1"]:
+            return None, None, None, q
+        seg = seg[2:]
+        if seg[:1] == ["namespaces"]:
+            if len(seg) == 1:
+                return "namespaces", None, None, q
+            if len(seg) == 2:
+                return "namespaces", None, seg[1], q
+            if len(seg) in (3, 4) and seg[2] in KINDS:
+                return seg[2], seg[1], (seg[3] if len(seg) == 4 else None), q
+        elif len(seg) == 1 and seg[0] in KINDS:
+            return seg[0], None, None, q
+        return None, None, None, q
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+    def _send(self, code, obj):
+        data = json.dumps(obj, separators=(",", ":")).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, resource):
+        self.fake.requests[(self.command, resource)] += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+    # ---------- verbs ----------
+    def do_GET(self):
+        resource, ns, name, q = self._route()
+        if resource is None:
+            return self._send(404, _status(404, "NotFound", self.path))
+        self._count(resource)
+        if name is not None:
+            return self._send(*self.fake.get(resource, None if resource == "namespaces" else ns, name))
+        if resource == "namespaces":
+            return self._send(405, _status(405, "MethodNotAllowed", "namespace list not supported"))
+        reqs = parse_selector(q.get("labelSelector"))
+        partial = "as=PartialObjectMetadata" in (self.headers.get("Accept") or "")
+        if q.get("watch") in ("true", "1"):
+            return self._watch(resource, ns, reqs, q, partial)
+        try:
+            limit = int(q.get("limit") or 0)
+        except ValueError:
+            return self._send(400, _status(400, "BadRequest", "invalid limit"))
+        return self._send(*self.fake.list(resource, ns, reqs, limit, q.get("continue"), partial))
+
+    def do_POST(self):
+        resource, ns, name, q = self._route()
+        if resource is None or name is not None:
+            return self._send(404, _status(404, "NotFound", self.path))
+        self._count(resource)
+        body = self._body()
+        if resource == "namespaces":
+            return self._send(*self.fake.create("namespaces", None, body))
+        return self._send(*self.fake.create(resource, ns, body))
+
+    def do_PATCH(self):
+        resource, ns, name, q = self._route()
+        if resource not in KINDS or name is None:
+            return self._send(404, _status(404, "NotFound", self.path))
+        self._count(resource)
+        return self._send(*self.fake.update(resource, ns, name, patch=self._body()))
+
+    def do_PUT(self):
+        resource, ns, name, q = self._route()
+        if resource not in KINDS or name is None:
+            return self._send(404, _status(404, "NotFound", self.path))
+        self._count(resource)
+        return self._send(*self.fake.update(resource, ns, name, replace=self._body()))
+
+    def do_DELETE(self):
+        resource, ns, name, q = self._route()
+        if resource not in KINDS or name is None:
+            return self._send(404, _status(404, "NotFound", self.path))
+        self._count(resource)
+        self._body()
+        return self._send(*self.fake.delete(resource, ns, name))
+
+    def _chunk(self, obj):
+        data = json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _watch(self, resource, ns, reqs, q, partial=False):
+        try:
+            rv = int(q.get("resourceVersion") or 0) or self.fake._rv
+        except ValueError:
+            return self._send(400, _status(400, "BadRequest", "invalid resourceVersion"))
+        timeout = float(q.get("timeoutSeconds") or 1800)
+        deadline = time.monotonic() + timeout
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while not self.fake._stopping:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                res = self.fake.events_after(rv, resource, ns, reqs, min(left, 1.0))
+                if res is None:
+                    self._chunk({"type": "ERROR", "object": _status(
+                        410, "Expired", f"too old resource version: {rv} ({self.fake._compacted_rv})")})
+                    break
+                rv, events = res
+                for etype, obj in events:
+                    self._chunk({"type": etype, "object": partial_metadata(obj) if partial else obj})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def write_kubeconfig(path, url):
+    cfg = {
+        "apiVersion": "v1", "kind": "Config", "current-context": "fake",
+        "clusters": [{"name": "fake", "cluster": {"server": url}}],
+        "users": [{"name": "fake", "user": {}}],
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}],
+    }
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve an in-memory fake Kubernetes core/v1 API on localhost.")
+    ap.add_argument("--bind", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--latency", type=float, default=0.0, help="artificial delay per request in seconds")
+    ap.add_argument("--kubeconfig", help="write a kubeconfig pointing at this server to the given path")
+    args = ap.parse_args()
+    api = FakeKubeAPI(args.bind, args.port, latency=args.latency).start()
+    if args.kubeconfig:
+        write_kubeconfig(args.kubeconfig, api.url)
+    print(f"[fake-kube-api] serving on {api.url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import sys, time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, REGISTRY
+from kube_transport import retry_api_call
+
+"""
+Self-metrics for the annotate -> export pipeline.
+
+Annotators stamp every write with the wall-clock time its row was due
+(emulator.power/scheduled, epoch seconds, next to emulator.power/version), so
+the exporter can measure how long a row took to reach node_power_watts, and
+with the replay period (emulator.power/period) so it can pace its scans, and
+with the row's trace time (emulator.power/trace-time, trace seconds) for the
+energy counters (power_energy.py).
+
+Annotator side (served with --metrics-port):
+  annotator_row_lag_seconds            row start - row deadline
+  annotator_batch_seconds              row deadline -> last write acknowledged
+  annotator_writes_total{op}           writes attempted (op: patch, configmap)
+  annotator_write_errors_total{op}     writes that failed after retries
+  annotator_write_retries_total{op}    retried writes (409/429/5xx)
+
+Exporter side:
+  pipeline_row_export_seconds{node}    row deadline -> node total switched to it
+  pipeline_batch_complete_seconds{node} row deadline -> every pod of the batch visible
+  exporter_quorum_wait_seconds{node}   first newer pod seen -> version switch
+  exporter_scan_seconds{phase}         list, parse, aggregate, publish
+  exporter_errors_total{op}            list / watch errors, node: pods without a node
+  exporter_relists_total               informer re-lists (initial list and 410 Gone)
+
+ScanPacer shortens the exporter's scan interval to a fraction of the fastest
+row period it sees, so accelerated replays (--speedup) are not under-sampled.
+"""
+
+SCHEDULED_KEY = "emulator.power/scheduled"
+PERIOD_KEY = "emulator.power/period"      # wall seconds between rows (paces the exporter scan)
+TRACE_TIME_KEY = "emulator.power/trace-time"   # trace seconds of the row (energy integration)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0,
+                   30.0, 60.0, 120.0)
+SCAN_PHASES = ("list", "parse", "aggregate", "publish")
+
+
+def wall_deadline(deadline, clock=time.monotonic):
+    """Convert a monotonic scheduler deadline into epoch seconds for the annotation."""
+    return time.time() - (clock() - deadline)
+
+
+def annotation_float(ann, key):
+    try:
+        return float(ann[key])
+    except Exception:
+        return None
+
+
+class AnnotatorMetrics:
+    def __init__(self, registry=REGISTRY):
+        self.row_lag = Histogram("annotator_row_lag_seconds", "Seconds a row started after its deadline",
+                                 buckets=LATENCY_BUCKETS, registry=registry)
+        self.batch = Histogram("annotator_batch_seconds",
+                               "Seconds from a row's deadline until its last write was acknowledged",
+                               buckets=LATENCY_BUCKETS, registry=registry)
+        self.writes = Counter("annotator_writes_total", "Annotation/ConfigMap writes attempted", ["op"],
+                              registry=registry)
+        self.errors = Counter("annotator_write_errors_total", "Writes that failed after retries", ["op"],
+                              registry=registry)
+        self.retries = Counter("annotator_write_retries_total", "Writes retried after 409/429/5xx", ["op"],
+                               registry=registry)
+
+    def call(self, op, fn, *args, retries=3):
+        """Run one write with retries, counting attempts, retries and final failures."""
+        self.writes.labels(op).inc()
+        try:
+            return retry_api_call(fn, *args, retries=retries,
+                                  on_retry=lambda e, attempt: self.retries.labels(op).inc())
+        except Exception:
+            self.errors.labels(op).inc()
+            raise
+
+
+class ExporterMetrics:
+    def __init__(self, registry=REGISTRY):
+        self.row_export = Histogram("pipeline_row_export_seconds",
+                                    "Seconds from a row's deadline until the node total switched to it",
+                                    ["node"], buckets=LATENCY_BUCKETS, registry=registry)
+        self.batch_complete = Histogram("pipeline_batch_complete_seconds",
+                                        "Seconds from a row's deadline until every pod of its batch was seen",
+                                        ["node"], buckets=LATENCY_BUCKETS, registry=registry)
+        self.quorum_wait = Histogram("exporter_quorum_wait_seconds",
+                                     "Seconds a node waited for version quorum before switching",
+                                     ["node"], buckets=LATENCY_BUCKETS, registry=registry)
+        self.scan = Histogram("exporter_scan_seconds", "Scan duration by phase", ["phase"],
+                              buckets=LATENCY_BUCKETS, registry=registry)
+        self.errors = Counter("exporter_errors_total", "Exporter API errors", ["op"], registry=registry)
+        self.relists = Counter("exporter_relists_total", "Informer re-lists (initial list and 410 Gone)",
+                               registry=registry)
+        for phase in SCAN_PHASES:
+            self.scan.labels(phase)
+        self._scheduled = {}      # (node, version) -> row deadline (epoch seconds)
+        self._informer = (0, 0)   # last seen (relists, errors) of the informer
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.scan.labels(name).observe(time.perf_counter() - t0)
+
+    def seen(self, node, version, scheduled):
+        if scheduled is not None:
+            self._scheduled.setdefault((node, version), scheduled)
+
+    def switched(self, node, version, wait=None, now=None):
+        """Record a node switching its total to a newer version."""
+        if wait is not None:
+            self.quorum_wait.labels(node).observe(wait)
+        sched = self._scheduled.get((node, version))
+        if sched is not None:
+            now = time.time() if now is None else now
+            self.row_export.labels(node).observe(max(0.0, now - sched))
+        # older rows of this node can no longer switch
+        for key in [k for k in self._scheduled if k[0] == node and k[1] < version]:
+            del self._scheduled[key]
+
+    def completed(self, node, version, now=None):
+        sched = self._scheduled.get((node, version))
+        if sched is not None:
+            now = time.time() if now is None else now
+            self.batch_complete.labels(node).observe(max(0.0, now - sched))
+
+    def forget_node(self, node):
+        for key in [k for k in self._scheduled if k[0] == node]:
+            del self._scheduled[key]
+
+    def sync_informer(self, informer):
+        relists, errors = informer.relists, informer.errors
+        last_relists, last_errors = self._informer
+        if relists > last_relists:
+            self.relists.inc(relists - last_relists)
+        if errors > last_errors:
+            self.errors.labels("watch").inc(errors - last_errors)
+        self._informer = (relists, errors)
+
+
+class ScanPacer:
+    def __init__(self, interval, adaptive=False, scans_per_row=4, min_interval=0.05,
+                 key=PERIOD_KEY, name="exporter"):
+        self.base = interval
+        self.adaptive = adaptive
+        self.scans_per_row = max(1, scans_per_row)
+        self.min_interval = min_interval
+        self.key = key
+        self.name = name
+        self._periods = {}        # node -> row period announced by its annotator
+        self._current = interval
+
+    def observe(self, node, period):
+        if self.adaptive and period and period > 0:
+            self._periods[node] = period
+
+    def observe_annotations(self, node, ann):
+        if self.adaptive:
+            self.observe(node, annotation_float(ann, self.key))
+
+    def forget(self, node):
+        self._periods.pop(node, None)
+
+    def interval(self):
+        if not self.adaptive or not self._periods:
+            return self.base
+        period = min(self._periods.values())
+        interval = max(self.min_interval, min(self.base, period / self.scans_per_row))
+        if interval != self._current:
+            print(f"[{self.name}] scan interval {interval:g}s (row period {period:g}s)", file=sys.stderr, flush=True)
+            self._current = interval
+        return interval
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+import argparse, json, os, sys, time
+import numpy as np
+import yaml
+from replay_plan import RESAMPLE_METHODS, merge_plans
+from trace_cache import DEFAULT_IGNORE, load_plan
+
+"""
+Offline placement evaluator for power-aware scheduling studies.
+
+Trying a pod -> node placement used to mean pinning the pods, replaying the
+trace in real time and reading node_power_watts afterwards. Here the trace
+columns are loaded once as a services x rows matrix P (every trace looping
+inside the longest one, as the orchestrator replays them) and a placement is
+a vector of node indices, one per service: the power of a node over time is
+the sum of the rows of P placed on it. Candidate placements are scored in
+batches, as one-hot assignment matrices multiplied with P.
+
+Per node:
+  peak     highest power over the trace (W)
+  energy   trapezoid over trace time (J), as node_energy_joules_total books it
+  overcap  trace seconds above --cap watts
+
+Objectives (lower is better; the second term breaks ties):
+  peak     highest node peak              then the sum of the node peaks
+  overcap  node-seconds above --cap       then the highest node peak
+  energy   highest node energy (balance)  then the highest node peak
+
+Strategies:
+  baseline  the placement of --manifest (one trace per node), for reference
+  random    --candidates random placements
+  greedy    services by descending peak, each onto the node where it raises
+            the objective least
+  local     single-service moves, starting from the best placement so far:
+            every (service, node) move is scored per step, recomputing only
+            the two nodes it touches, and the best one is applied until no
+            move improves (or --iterations)
+
+--max-pods caps the services per node in every strategy. The winner is
+written as an orchestrator manifest with one `parts:` trace per node, so one
+validation replay checks it:
+
+  python scripts/placement_eval.py --manifest replay-manifest.yaml --cap 450 --out placement-manifest.yaml
+  python scripts/replay_orchestrator.py --manifest placement-manifest.yaml --prune
+
+Pods are named <node>-<service> there: a service that moved gets a new pod
+on its new node, and --prune deletes the old one.
+"""
+
+OBJECTIVES = ("peak", "overcap", "energy")
+STRATEGIES = ("random", "greedy", "local")
+
+
+def _best(scores):
+    """Flat index of the lexicographically smallest (primary, tie-break) pair."""
+    return int(np.lexsort((scores[..., 1].ravel(), scores[..., 0].ravel()))[0])
+
+
+def _better(a, b, eps=1e-9):
+    tol = eps * max(1.0, abs(b[0]))
+    return a[0] < b[0] - tol or (a[0] <= b[0] + tol and a[1] < b[1] - eps * max(1.0, abs(b[1])))
+
+
+class PlacementProblem:
+    def __init__(self, power, step, nodes, cap=None, objective="peak", max_pods=0):
+        self.power = np.ascontiguousarray(np.asarray(power, dtype=np.float64).T)   # services x rows
+        self.nodes = list(nodes)
+        self.step = step
+        self.cap = cap
+        self.objective = objective
+        self.max_pods = max_pods
+        rows = self.power.shape[1]
+        # trapezoid: every row weighs one step, the first and last half a step
+        self.w_energy = np.full(rows, float(step))
+        if rows > 1:
+            self.w_energy[[0, -1]] = step / 2.0
+        self.peaks = self.power.max(axis=1)
+
+    def node_costs(self, loads):
+        """loads (..., rows) -> (..., 3): seconds over cap, peak watts, joules."""
+        over = (loads > self.cap).sum(axis=-1) * float(self.step) if self.cap is not None \
+            else np.zeros(loads.shape[:-1])
+        return np.stack([over, loads.max(axis=-1), loads @ self.w_energy], axis=-1)
+
+    def score(self, costs):
+        """costs (..., nodes, 3) -> (..., 2): the objective and its tie-break."""
+        over, peak, energy = costs[..., 0], costs[..., 1], costs[..., 2]
+        if self.objective == "overcap":
+            return np.stack([over.sum(-1), peak.max(-1)], axis=-1)
+        if self.objective == "energy":
+            return np.stack([energy.max(-1), peak.max(-1)], axis=-1)
+        return np.stack([peak.max(-1), peak.sum(-1)], axis=-1)
+
+    def loads(self, assign):
+        """assign (K, services) -> node power (K, nodes, rows)."""
+        onehot = (assign[:, None, :] == np.arange(len(self.nodes))[None, :, None]).astype(np.float64)
+        return onehot @ self.power
+
+    def evaluate(self, assign):
+        """-> (node costs (K, nodes, 3), scores (K, 2)) of K placements, in chunks of ~256 MiB."""
+        assign = np.atleast_2d(assign)
+        chunk = max(1, 2 ** 25 // (len(self.nodes) * max(self.power.shape)))
+        costs = np.concatenate([self.node_costs(self.loads(assign[i:i + chunk]))
+                                for i in range(0, len(assign), chunk)])
+        return costs, self.score(costs)
+
+    def random(self, count, rng):
+        services, n = self.power.shape[0], len(self.nodes)
+        if not self.max_pods:
+            return rng.integers(0, n, (count, services))
+        # a random choice of `services` out of max_pods slots per node
+        slots = np.repeat(np.arange(n), self.max_pods)
+        return slots[np.argsort(rng.random((count, slots.size)), axis=1)[:, :services]]
+
+    def greedy(self):
+        services, n = self.power.shape[0], len(self.nodes)
+        loads = np.zeros((n, self.power.shape[1]))
+        costs = self.node_costs(loads)
+        counts = np.zeros(n, dtype=np.int64)
+        assign = np.empty(services, dtype=np.int64)
+        nodes = np.arange(n)
+        for svc in np.argsort(-self.peaks, kind="stable"):
+            trial = np.repeat(costs[None], n, axis=0)          # trial[b]: svc placed on node b
+            trial[nodes, nodes] = self.node_costs(loads + self.power[svc])
+            scores = self.score(trial)
+            if self.max_pods:
+                scores[counts >= self.max_pods] = np.inf
+            b = _best(scores)
+            assign[svc] = b
+            loads[b] += self.power[svc]
+            costs[b] = self.node_costs(loads[b])
+            counts[b] += 1
+        return assign
+
+    def local_search(self, assign, iterations=1000):
+        """-> (improved placement, moves applied)."""
+        assign = np.array(assign, dtype=np.int64)
+        services, n = self.power.shape[0], len(self.nodes)
+        loads = self.loads(assign[None])[0]
+        costs = self.node_costs(loads)
+        current = self.score(costs)
+        counts = np.bincount(assign, minlength=n)
+        nodes = np.arange(n)
+        chunk = max(1, min(256, 2 ** 22 // (n * max(n, self.power.shape[1]))))
+        moves = 0
+        while moves < iterations:
+            best = None
+            for lo in range(0, services, chunk):
+                svc = np.arange(lo, min(services, lo + chunk))
+                src = assign[svc]
+                rows = np.arange(len(svc))[:, None]
+                # trial[i, b]: node costs after moving svc[i] from src[i] to b
+                trial = np.repeat(np.repeat(costs[None, None], len(svc), 0), n, 1)
+                trial[rows, nodes[None, :], src[:, None]] = self.node_costs(loads[src] - self.power[svc])[:, None]
+                trial[rows, nodes[None, :], nodes[None, :]] = self.node_costs(loads[None] + self.power[svc][:, None])
+                scores = self.score(trial)
+                scores[rows[:, 0], src] = np.inf
+                if self.max_pods:
+                    scores[:, counts >= self.max_pods] = np.inf
+                i, b = divmod(_best(scores), n)
+                if best is None or _better(scores[i, b], best[0]):
+                    best = (scores[i, b], svc[i], b)
+            if best is None or not _better(best[0], current):
+                break
+            _, s, b = best
+            a = assign[s]
+            loads[a] -= self.power[s]
+            loads[b] += self.power[s]
+            costs[a], costs[b] = self.node_costs(loads[a]), self.node_costs(loads[b])
+            counts[a] -= 1
+            counts[b] += 1
+            assign[s] = b
+            current = self.score(costs)
+            moves += 1
+        return assign, moves
+
+
+def describe(costs):
+    over, peak, energy = costs[..., 0], costs[..., 1], costs[..., 2]
+    return (f"max node peak {peak.max():.1f}W, over cap {over.sum():g}s, "
+            f"node energy {energy.min() / 3600:.1f}..{energy.max() / 3600:.1f}Wh")
+
+
+def write_manifest(path, problem, services, assign, namespace, header):
+    """services: [(csv path, column)] in the order of the problem's rows."""
+    base = os.path.dirname(os.path.abspath(path))
+    lines = header + ["traces:"]
+    for b, node in enumerate(problem.nodes):
+        parts = {}
+        for (csv, col), a in zip(services, assign):
+            if a == b:
+                parts.setdefault(csv, []).append(col)
+        if not parts:
+            continue
+        lines += [f"  - node: {node}", f"    namespace: {namespace}", f"    prefix: \"{node}-\"", "    parts:"]
+        for csv, cols in parts.items():
+            lines += [f"      - csv: {json.dumps(os.path.relpath(os.path.abspath(csv), base))}",
+                      f"        columns: {json.dumps(cols)}"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Score pod->node placements of the traces offline and write the best "
+                                             "one as a replay manifest.")
+    ap.add_argument("--manifest", default=None,
+                    help="orchestrator manifest: its traces are the services and its placement the baseline")
+    ap.add_argument("--csv", nargs="*", default=[], help="more traces whose columns are services to place")
+    ap.add_argument("--nodes", nargs="*", default=[], help="nodes to place on (in addition to the manifest's)")
+    ap.add_argument("--namespace", default="demo", help="namespace of the written manifest (default: demo)")
+    ap.add_argument("--cap", type=float, default=None, help="per-node power cap in watts for the overcap metric")
+    ap.add_argument("--objective", choices=OBJECTIVES, default=None,
+                    help="what to minimize (default: overcap with --cap, else peak)")
+    ap.add_argument("--max-pods", type=int, default=0, help="services per node at most (default: 0 = no limit)")
+    ap.add_argument("--strategy", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    ap.add_argument("--candidates", type=int, default=4096, help="random placements to score (default: 4096)")
+    ap.add_argument("--iterations", type=int, default=1000, help="local search moves at most (default: 1000)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ignore", default=DEFAULT_IGNORE)
+    ap.add_argument("--resample", type=float, default=0,
+                    help="common grid in trace seconds (default: each trace's native step, which must agree)")
+    ap.add_argument("--resample-method", choices=RESAMPLE_METHODS, default="hold")
+    ap.add_argument("--cache-dir", default=None, help="where to keep trace caches (default: next to each CSV)")
+    ap.add_argument("--out", default="placement-manifest.yaml",
+                    help="manifest for replay_orchestrator.py with the winning placement (default: placement-manifest.yaml)")
+    ap.add_argument("--report", default=None, help="also write scores and per-node metrics as JSON")
+    args = ap.parse_args()
+    objective = args.objective or ("overcap" if args.cap is not None else "peak")
+    if objective == "overcap" and args.cap is None:
+        print("--objective overcap needs --cap", file=sys.stderr); sys.exit(2)
+
+    manifest, base_dir = {}, "."
+    traces = []             # (csv, node or None)
+    if args.manifest:
+        with open(args.manifest) as f:
+            manifest = yaml.safe_load(f) or {}
+        base_dir = os.path.dirname(os.path.abspath(args.manifest))
+        for e in manifest.get("traces") or []:
+            if "csv" not in e or e.get("amplify"):
+                print(f"{args.manifest}: placement needs plain csv traces (no parts/amplify)", file=sys.stderr)
+                sys.exit(2)
+            traces.append((os.path.join(base_dir, e["csv"]), e["node"]))
+    traces += [(csv, None) for csv in args.csv]
+    nodes = list(dict.fromkeys([n for _, n in traces if n] + args.nodes))
+    if not traces or not nodes:
+        print("need traces (--manifest/--csv) and nodes (--manifest/--nodes)", file=sys.stderr); sys.exit(2)
+
+    opts = dict(fill=0.0, cache_dir=args.cache_dir, resample_step=args.resample or "native",
+                method=args.resample_method)
+    try:
+        plans = [load_plan(csv, args.ignore, **opts) for csv, _ in traces]
+    except ValueError as e:
+        print(e, file=sys.stderr); sys.exit(2)
+    merged = merge_plans([(p, range(len(p.columns))) for p in plans])
+    if not merged.step:
+        print(f"traces need a time column and one common step (got {sorted(str(p.step) for p in plans)}); "
+              f"pass --resample", file=sys.stderr); sys.exit(2)
+    services = [(csv, col) for (csv, _), p in zip(traces, plans) for col in p.columns]
+    if len({col for _, col in services}) < len(services):
+        print("service (column) names must be unique across the traces", file=sys.stderr); sys.exit(2)
+    if args.max_pods and args.max_pods * len(nodes) < len(services):
+        print(f"--max-pods {args.max_pods} x {len(nodes)} nodes < {len(services)} services", file=sys.stderr)
+        sys.exit(2)
+
+    problem = PlacementProblem(merged.values, merged.step, nodes, args.cap, objective, args.max_pods)
+    print(f"PLACE {len(services)} services on {len(nodes)} nodes, {len(merged)} rows of {merged.step:g}s, "
+          f"objective {objective}" + (f", cap {args.cap:g}W" if args.cap is not None else ""))
+
+    results = {}            # strategy -> (placement, node costs, score, seconds)
+    def record(name, assign, started, note=""):
+        costs, scores = problem.evaluate(assign)
+        results[name] = (np.asarray(assign), costs[0], scores[0], time.perf_counter() - started)
+        print(f"{name.upper():<8} {objective} {scores[0][0]:.1f} (tie-break {scores[0][1]:.1f}): "
+              f"{describe(costs[0])}{note}, {results[name][3]:.3f}s")
+
+    if all(n for _, n in traces):
+        started = time.perf_counter()
+        record("baseline", np.array([nodes.index(n) for (_, n), p in zip(traces, plans) for _ in p.columns]),
+               started)
+    rng = np.random.default_rng(args.seed)
+    if "random" in args.strategy and args.candidates > 0:
+        started = time.perf_counter()
+        cand = problem.random(args.candidates, rng)
+        _, scores = problem.evaluate(cand)
+        took = time.perf_counter() - started
+        record("random", cand[_best(scores)], started,
+               f" (best of {len(cand)}, {len(cand) / took:.0f} placements/s)")
+    if "greedy" in args.strategy:
+        started = time.perf_counter()
+        record("greedy", problem.greedy(), started)
+    if "local" in args.strategy:
+        start_from = min(results, key=lambda k: tuple(results[k][2])) if results else "a random placement"
+        start = results[start_from][0] if results else problem.random(1, rng)[0]
+        started = time.perf_counter()
+        assign, moves = problem.local_search(start, args.iterations)
+        record("local", assign, started, f" ({moves} moves from {start_from})")
+
+    winner = min((k for k in results if k != "baseline" or len(results) == 1), key=lambda k: tuple(results[k][2]))
+    assign, costs, score, _ = results[winner]
+    for b, node in enumerate(nodes):
+        print(f"NODE {node}: {int((assign == b).sum())} services, peak {costs[b][1]:.1f}W, "
+              f"{costs[b][2] / 3600:.1f}Wh, {costs[b][0]:g}s over cap")
+
+    header = [f"# Generated by scripts/placement_eval.py: {winner} placement, {objective} {score[0]:.1f}"]
+    for key in ("tick", "speedup", "loop"):
+        if key in manifest:
+            val = manifest[key]
+            header.append(f"{key}: {str(val).lower() if isinstance(val, bool) else val}")
+    if args.resample:
+        header.append(f"resample: {args.resample:g}")
+    write_manifest(args.out, problem, services, assign, args.namespace, header)
+    print(f"Wrote {winner} placement to {args.out}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"objective": objective, "cap": args.cap, "step": merged.step, "rows": len(merged),
+                       "winner": winner,
+                       "strategies": {k: {"score": [float(x) for x in v[2]], "seconds": round(v[3], 4)}
+                                      for k, v in results.items()},
+                       "nodes": {node: {"services": [col for (_, col), a in zip(services, assign) if a == b],
+                                        "overcap_seconds": float(costs[b][0]), "peak_watts": float(costs[b][1]),
+                                        "energy_joules": float(costs[b][2])}
+                                 for b, node in enumerate(nodes)}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
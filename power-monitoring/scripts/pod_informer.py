@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import json, sys, threading, time
+from collections import namedtuple
+from kubernetes.client.rest import ApiException
+from kubernetes.watch.watch import iter_resp_lines
+
+"""
+List+watch pod cache for the exporters (informer pattern).
+
+One initial LIST fills the cache and yields a resourceVersion; a WATCH started
+from that resourceVersion then only delivers ADDED/MODIFIED/DELETED deltas.
+When the watch history has expired (410 Gone) the informer re-lists and diffs
+the fresh list against its cache, so consumers never miss a change.
+
+Consumers call drain() to get just the pods that changed since their previous
+call, which keeps exporter work proportional to annotation churn instead of
+pods x scan frequency.
+
+Lists and watches skip the OpenAPI models: responses are read as raw JSON
+(_preload_content=False) and parsed straight into PodRecord tuples, lists are
+paginated with limit/continue (page_size pods per request), and with
+metadata_only the API server is asked for PartialObjectMetadata instead of
+full pods. Partial objects carry no spec, so the node then comes from the
+kwok.power/node label that pod_provisioner puts on every pod.
+"""
+
+# Compact, immutable view of the pod fields the exporters actually use.
+PodRecord = namedtuple("PodRecord", "namespace name node app column annotations")
+
+NODE_LABEL = "kwok.power/node"
+# metadata-only media types (trailing plain JSON: servers without support send full objects)
+PARTIAL_LIST = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,application/json"
+PARTIAL_WATCH = "application/json;as=PartialObjectMetadata;g=meta.k8s.io;v=v1,application/json"
+
+
+def pod_record(p) -> PodRecord:
+    labels = p.metadata.labels or {}
+    return PodRecord(
+        p.metadata.namespace or "",
+        p.metadata.name or "",
+        p.spec.node_name or "",
+        labels.get("app", ""),
+        labels.get("kwok.power/column", ""),
+        p.metadata.annotations or {},
+    )
+
+
+def pod_record_from_dict(obj) -> PodRecord:
+    meta = obj.get("metadata") or {}
+    labels = meta.get("labels") or {}
+    return PodRecord(
+        meta.get("namespace") or "",
+        meta.get("name") or "",
+        (obj.get("spec") or {}).get("nodeName") or labels.get(NODE_LABEL, ""),
+        labels.get("app", ""),
+        labels.get("kwok.power/column", ""),
+        meta.get("annotations") or {},
+    )
+
+
+def missing_node(rec, warned) -> bool:
+    """True (and a warning the first time per pod) when a pod has neither spec.nodeName nor the node label."""
+    if rec.node:
+        return False
+    key = (rec.namespace, rec.name)
+    if key not in warned:
+        warned.add(key)
+        print(f"[exporter] {rec.namespace}/{rec.name}: no node (no {NODE_LABEL} label with --metadata-only?), "
+              f"skipped", file=sys.stderr)
+    return True
+
+
+def _list_func(v1, scope):
+    if scope is None:
+        return v1.list_pod_for_all_namespaces, {}
+    return v1.list_namespaced_pod, {"namespace": scope}
+
+
+def list_scope(v1, scope, label_selector=None, page_size=500, metadata_only=False):
+    """One namespace (None: all) as ([PodRecord], resourceVersion), page_size pods per request."""
+    func, kw = _list_func(v1, scope)
+    if metadata_only:
+        kw["_headers"] = {"Accept": PARTIAL_LIST}
+    if page_size and page_size > 0:
+        kw["limit"] = page_size
+    records, token = [], None
+    while True:
+        try:
+            resp = func(label_selector=label_selector or None, _continue=token, _preload_content=False, **kw)
+        except ApiException as e:
+            if e.status == 410 and token is not None:
+                # continue token expired (compaction) mid-list: start over from a fresh snapshot
+                records, token = [], None
+                continue
+            raise
+        try:
+            body = json.loads(resp.data)
+        finally:
+            resp.release_conn()
+        records.extend(pod_record_from_dict(o) for o in body.get("items") or ())
+        meta = body.get("metadata") or {}
+        token = meta.get("continue")
+        if not token:
+            return records, meta.get("resourceVersion")
+
+
+def list_pods(v1, namespaces, label_selector, page_size=500, metadata_only=False):
+    # Plain polling path: one (paginated) LIST per namespace, or one cluster-wide LIST.
+    records = []
+    for scope in list(namespaces) or [None]:
+        records.extend(list_scope(v1, scope, label_selector, page_size, metadata_only)[0])
+    return records
+
+
+class PodInformer:
+    def __init__(self, v1, namespaces=(), label_selector=None,
+                 watch_timeout=300, retry_delay=1.0, name="informer",
+                 page_size=500, metadata_only=False):
+        self.v1 = v1
+        self.scopes = list(namespaces) or [None]   # None = all namespaces
+        self.label_selector = label_selector or None
+        self.page_size = page_size
+        self.metadata_only = metadata_only
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+        self.name = name
+        self.relists = 0
+        self.events = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._pods = {}        # (namespace, name) -> PodRecord
+        self._changed = {}     # keys touched since the last drain()
+        self._deleted = set()
+        self._synced = {scope: threading.Event() for scope in self.scopes}
+        self._stop = threading.Event()
+        self._threads = []
+
+    # ---------- consumer side ----------
+    def start(self):
+        for scope in self.scopes:
+            t = threading.Thread(target=self._run, args=(scope,),
+                                 name=f"{self.name}-{scope or 'all'}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        # The watch loops exit at their next event or when the server closes the stream.
+        self._stop.set()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def wait_synced(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for ev in self._synced.values():
+            left = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not ev.wait(left):
+                return False
+        return True
+
+    def drain(self):
+        """Return ({key: PodRecord} changed, {key} deleted) since the last call."""
+        with self._lock:
+            changed, deleted = self._changed, self._deleted
+            self._changed, self._deleted = {}, set()
+        return changed, deleted
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._pods.values())
+
+    def __len__(self):
+        return len(self._pods)
+
+    # ---------- cache maintenance (caller holds the lock) ----------
+    def _upsert(self, rec):
+        key = (rec.namespace, rec.name)
+        if self._pods.get(key) == rec:
+            return                       # status-only update: nothing we export changed
+        self._pods[key] = rec
+        self._changed[key] = rec
+        self._deleted.discard(key)
+
+    def _delete(self, key):
+        if self._pods.pop(key, None) is None:
+            return
+        self._changed.pop(key, None)
+        self._deleted.add(key)
+
+    # ---------- producer side ----------
+    def _relist(self, scope):
+        records, rv = list_scope(self.v1, scope, self.label_selector, self.page_size, self.metadata_only)
+        fresh = {(rec.namespace, rec.name): rec for rec in records}
+        with self._lock:
+            for key in [k for k in self._pods if scope is None or k[0] == scope]:
+                if key not in fresh:
+                    self._delete(key)
+            for rec in fresh.values():
+                self._upsert(rec)
+        self.relists += 1
+        return rv
+
+    def _stream(self, scope, rv):
+        """Raw watch events as dicts; an ERROR event is raised as ApiException (410 -> re-list)."""
+        func, kw = _list_func(self.v1, scope)
+        if self.metadata_only:
+            kw["_headers"] = {"Accept": PARTIAL_WATCH}
+        resp = func(watch=True, label_selector=self.label_selector, resource_version=rv,
+                    allow_watch_bookmarks=True, timeout_seconds=self.watch_timeout,
+                    _preload_content=False, **kw)
+        try:
+            for line in iter_resp_lines(resp):
+                if self._stop.is_set():
+                    return
+                if not line:
+                    continue
+                ev = json.loads(line)
+                if ev.get("type") == "ERROR":
+                    status = ev.get("object") or {}
+                    raise ApiException(status=status.get("code", 500), reason=status.get("message"))
+                yield ev
+        finally:
+            # a stream abandoned mid-way must not go back to the pool half-read
+            resp.close()
+            resp.release_conn()
+
+    def _run(self, scope):
+        where = scope or "all namespaces"
+        rv = None
+        while not self._stop.is_set():
+            try:
+                if rv is None:
+                    rv = self._relist(scope)
+                    self._synced[scope].set()
+                for ev in self._stream(scope, rv):
+                    etype, obj = ev["type"], ev.get("object") or {}
+                    rv = (obj.get("metadata") or {}).get("resourceVersion") or rv
+                    if etype == "BOOKMARK":
+                        continue
+                    rec = pod_record_from_dict(obj)
+                    with self._lock:
+                        if etype == "DELETED":
+                            self._delete((rec.namespace, rec.name))
+                        else:
+                            self._upsert(rec)
+                    self.events += 1
+                # Server closed the watch (timeout_seconds); resume from rv.
+            except ApiException as e:
+                if self._stop.is_set():
+                    break
+                if e.status == 410:
+                    print(f"[{self.name}] watch expired for {where} (410 Gone); re-listing",
+                          file=sys.stderr, flush=True)
+                    rv = None
+                    continue
+                self.errors += 1
+                print(f"[{self.name}] watch error for {where}: {e}", file=sys.stderr, flush=True)
+                time.sleep(self.retry_delay)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.errors += 1
+                print(f"[{self.name}] watch error for {where}: {e}", file=sys.stderr, flush=True)
+                time.sleep(self.retry_delay)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import sys, threading, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from kube_transport import _already_exists, retry_api_call
+from pod_informer import NODE_LABEL, list_scope
+
+"""
+Bulk provisioning of the KWOK power pods.
+
+Instead of a read + create round trip per pod, provision_pods():
+  1. lists the existing pods once per namespace by label selector (raw,
+     paginated pod_informer.list_scope),
+  2. diffs them against the desired column -> pod mapping,
+  3. creates the missing pods concurrently (bounded pool) with jittered
+     exponential backoff on 409 Conflict / 429 / 5xx (kube_transport),
+  4. optionally deletes orphans: selector-matching pods on the same nodes
+     that are no longer in the mapping,
+and reports the provisioning throughput in pods/s.
+
+Every pod is labelled kwok.power/node=<node> so metadata-only exporters
+(which get no pod spec) can still attribute it. Existing pods without the
+label (created by older versions) are found with a second, !kwok.power/node
+list and get the label patched on.
+"""
+
+DesiredPod = namedtuple("DesiredPod", "namespace name node labels")
+ProvisionReport = namedtuple("ProvisionReport", "desired existing created deleted failed retries seconds labelled")
+
+def pod_body(pod: DesiredPod, image, toleration_key, annotations):
+    return client.V1Pod(
+        api_version="v1",
+        kind="Pod",
+        metadata=client.V1ObjectMeta(name=pod.name, labels=dict(pod.labels, **{NODE_LABEL: pod.node}),
+                                     annotations=dict(annotations)),
+        spec=client.V1PodSpec(
+            node_name=pod.node,
+            tolerations=[client.V1Toleration(key=toleration_key, effect="NoSchedule", operator="Exists")],
+            containers=[client.V1Container(name="nop", image=image, image_pull_policy="IfNotPresent")],
+            restart_policy="Always",
+        ),
+    )
+
+
+def provision_pods(v1, desired, *, label_selector, image, annotations,
+                   toleration_key="kwok.x-k8s.io/node", concurrency=16, prune=False,
+                   retries=5, verbose=True) -> ProvisionReport:
+    started = time.monotonic()
+    by_ns = {}
+    for p in desired:
+        by_ns.setdefault(p.namespace, []).append(p)
+    nodes = {p.node for p in desired}
+
+    missing, orphans, unlabelled, existing = [], [], [], 0
+    for ns, pods in by_ns.items():
+        live = {r.name: r.node for r in list_scope(v1, ns, label_selector)[0]}
+        bare = {r.name for r in list_scope(v1, ns, f"{label_selector},!{NODE_LABEL}", metadata_only=True)[0]}
+        want = {p.name for p in pods}
+        for p in pods:
+            if p.name in live:
+                existing += 1
+                if p.name in bare:
+                    unlabelled.append(p)
+            else:
+                missing.append(p)
+        if prune:
+            orphans.extend((ns, name) for name, node in live.items() if name not in want and node in nodes)
+
+    counts = {"created": 0, "deleted": 0, "labelled": 0, "failed": 0, "retries": 0}
+    lock = threading.Lock()
+
+    def count_retry(e, attempt):
+        with lock:
+            counts["retries"] += 1
+
+    def create(p):
+        try:
+            retry_api_call(v1.create_namespaced_pod, p.namespace,
+                           pod_body(p, image, toleration_key, annotations),
+                           retries=retries, on_retry=count_retry)
+            return "created"
+        except ApiException as e:
+            if _already_exists(e):
+                return "existing"
+            raise
+
+    def label(p):
+        retry_api_call(v1.patch_namespaced_pod, p.name, p.namespace,
+                       {"metadata": {"labels": {NODE_LABEL: p.node}}}, retries=retries, on_retry=count_retry)
+        return "labelled"
+
+    def delete(ns, name):
+        try:
+            retry_api_call(v1.delete_namespaced_pod, name, ns, retries=retries, on_retry=count_retry)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        return "deleted"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futures = {ex.submit(create, p): f"{p.namespace}/{p.name}" for p in missing}
+        futures.update({ex.submit(delete, ns, name): f"{ns}/{name}" for ns, name in orphans})
+        futures.update({ex.submit(label, p): f"{p.namespace}/{p.name}" for p in unlabelled})
+        for f in as_completed(futures):
+            what = futures[f]
+            try:
+                res = f.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"PROVISION failed {what}: {e}", file=sys.stderr)
+                continue
+            if res == "existing":
+                existing += 1
+            else:
+                counts[res] += 1
+                if verbose:
+                    print(f"{res.upper()} {what}")
+
+    rep = ProvisionReport(len(desired), existing, counts["created"], counts["deleted"],
+                          counts["failed"], counts["retries"], time.monotonic() - started, counts["labelled"])
+    rate = (rep.created + rep.deleted) / rep.seconds if rep.seconds > 0 else 0.0
+    print(f"PROVISION {rep.desired} desired: {rep.existing} existing, {rep.created} created, "
+          f"{rep.deleted} deleted, {rep.labelled} labelled, {rep.failed} failed, {rep.retries} retries "
+          f"in {rep.seconds:.2f}s ({rate:.1f} pods/s)", flush=True)
+    return rep
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import json
+from collections import namedtuple
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from pipeline_metrics import annotation_float
+
+"""
+One ConfigMap per fake node holding a whole CSV row for that node.
+
+Instead of one PATCH per pod per row, the annotator writes the row's vector of
+watts (keyed by kwok.power/column) into a single object, so readers always see
+a complete row and node totals are needle-free by construction:
+
+  metadata.name    kwok-power-<node>
+  metadata.labels  kwok.power/snapshot=true, kwok.power/node=<node>, app=<label-app>
+  data.node        node name
+  data.version     row version (same counter as emulator.power/version)
+  data.pods        JSON {column: pod name}      (written when the object is created)
+  data.watts       JSON {column: watts}         (rewritten every row)
+  data.scheduled   row deadline, epoch seconds  (optional, for latency metrics)
+  data.period      seconds between rows         (optional, exporter scan pacing)
+  data.trace_time  trace seconds of the row     (optional, energy integration)
+"""
+
+SNAPSHOT_LABEL = "kwok.power/snapshot"
+SNAPSHOT_SELECTOR = f"{SNAPSHOT_LABEL}=true"
+
+NodeSnapshot = namedtuple("NodeSnapshot", "namespace node version app entries total scheduled period trace_time",
+                          defaults=(None, None, None))  # entries: [(column, pod, watts)]
+
+
+def snapshot_name(node: str) -> str:
+    return f"kwok-power-{node}"[:253]
+
+
+def write_node_snapshot(v1, ns, node, version, watts, pods, app="kwok-power", scheduled=None, period=None,
+                        trace_time=None):
+    """watts/pods: {column: value}; one PATCH (or CREATE on first write) per call."""
+    name = snapshot_name(node)
+    data = {"version": str(version), "watts": json.dumps(watts, separators=(",", ":"))}
+    if scheduled is not None:
+        data["scheduled"] = f"{scheduled:.3f}"
+    if period is not None:
+        data["period"] = f"{period:g}"
+    if trace_time is not None:
+        data["trace_time"] = f"{trace_time:.3f}"
+    try:
+        v1.patch_namespaced_config_map(name=name, namespace=ns, body={"data": data})
+        return False
+    except ApiException as e:
+        if e.status != 404:
+            raise
+    data.update(node=node, pods=json.dumps(pods, separators=(",", ":")))
+    body = client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(
+            name=name,
+            labels={SNAPSHOT_LABEL: "true", "kwok.power/node": node, "app": app},
+        ),
+        data=data,
+    )
+    v1.create_namespaced_config_map(ns, body)
+    return True
+
+
+def parse_node_snapshot(cm):
+    data = cm.data or {}
+    labels = cm.metadata.labels or {}
+    try:
+        version = int(float(data["version"]))
+        watts = json.loads(data["watts"])
+        pods = json.loads(data.get("pods") or "{}")
+    except Exception:
+        return None
+    node = data.get("node") or labels.get("kwok.power/node", "")
+    entries = []
+    total = 0.0
+    for col, w in watts.items():
+        try:
+            w = float(w)
+        except Exception:
+            continue
+        entries.append((col, pods.get(col, col), w))
+        total += w
+    return NodeSnapshot(cm.metadata.namespace or "", node, version, labels.get("app", ""), entries, total,
+                        annotation_float(data, "scheduled"), annotation_float(data, "period"),
+                        annotation_float(data, "trace_time"))
+
+
+def list_node_snapshots(v1, namespaces, label_selector=SNAPSHOT_SELECTOR):
+    if namespaces:
+        items = []
+        for ns in namespaces:
+            items.extend(v1.list_namespaced_config_map(namespace=ns, label_selector=label_selector).items)
+    else:
+        items = v1.list_config_map_for_all_namespaces(label_selector=label_selector).items
+    return [s for s in (parse_node_snapshot(cm) for cm in items) if s is not None]
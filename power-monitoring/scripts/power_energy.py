@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+from prometheus_client import Counter
+
+"""
+Energy counters integrated by the exporters.
+
+  pod_energy_joules_total{namespace,pod,node,app,column}
+  node_energy_joules_total{node}
+
+Power is integrated with the trapezoid rule over the rows' trace time
+(emulator.power/trace-time, stamped by the annotators from the CSV's time
+column and counting on across loop passes), not over the wall clock, so an
+accelerated replay books the same joules as a real-time one and an energy
+figure is one increase(node_energy_joules_total[1h]) instead of a
+sum_over_time over hours of samples. Rows without the stamp fall back to the
+row deadline (emulator.power/scheduled).
+
+RowIntegrator (versioned exporter): every version a node accepts is one
+sample (trace time, node total, the watts of the pods behind it). The sample
+stays open while quorum re-decides the same version, keeping the most
+complete view of the row, and is integrated once a newer version is
+accepted: the counters trail the gauges by one row, but each row counts
+exactly once however often it is re-decided. A version below the open one
+(an annotator restarted without its checkpoint, or a recreated ring buffer)
+and a trace time that goes backwards (a different trace) both start a new
+segment from that row instead of stalling or booking negative energy. Pod
+and node counters use the same samples, so the pods add up to their node.
+
+PodIntegrator (plain exporter, no versions): each pod is integrated between
+its own successive trace times; a node books the sum of its pods.
+"""
+
+
+def _remove(metric, labels):
+    try:
+        metric.remove(*labels)
+    except KeyError:
+        pass
+
+
+class EnergyCounters:
+    def __init__(self, counter=Counter):
+        # counter: prometheus_client.Counter or SnapshotCollector.counter
+        self.pod = counter("pod_energy_joules", "Per-pod energy in joules, integrated over trace time",
+                           ["namespace", "pod", "node", "app", "column"])
+        self.node = counter("node_energy_joules", "Per-node energy in joules, integrated over trace time", ["node"])
+        self._labels = {}    # pod key -> label tuple of its counter
+
+    def track(self, key, labels):
+        old = self._labels.get(key)
+        if old == labels:
+            return
+        if old is not None:
+            _remove(self.pod, old)
+        self._labels[key] = labels
+        self.pod.labels(*labels)         # exported at 0 J from the start
+
+    def forget(self, key):
+        labels = self._labels.pop(key, None)
+        if labels is not None:
+            _remove(self.pod, labels)
+
+    def forget_node(self, node):
+        _remove(self.node, (node,))
+
+    def add(self, node, joules, pods):
+        """Book `joules` on node and {pod key: joules} on its pods."""
+        child = self.node.labels(node)
+        if joules > 0:
+            child.inc(joules)
+        for key, j in pods.items():
+            labels = self._labels.get(key)
+            if labels is not None and j > 0:
+                self.pod.labels(*labels).inc(j)
+
+
+class RowIntegrator:
+    def __init__(self, counters):
+        self.counters = counters
+        self._times = {}    # node -> {version: trace time}
+        self._open = {}     # node -> (version, t, total, {pod key: watts}) of the accepted row
+        self._last = {}     # node -> (t, total, {pod key: watts}) of the row before it
+
+    def stamp(self, node, version, t):
+        if t is not None:
+            self._times.setdefault(node, {})[version] = t
+
+    def observe(self, node, version, total, members):
+        """The node accepted `version` with `total` over members [(pod key, watts)]."""
+        cur = self._open.get(node)
+        if cur is not None:
+            if version < cur[0]:
+                # versions restarted lower: integrate again from this row
+                self._open.pop(node, None)
+                self._last.pop(node, None)
+            elif version == cur[0] and len(members) < len(cur[3]):
+                return          # the row's pods already moving on to the next version
+            elif version > cur[0]:
+                self._close(node, cur)
+        times = self._times.get(node, {})
+        t = times.get(version)
+        if t is None:
+            # no time for this row: it cannot be integrated, start over after it
+            self._open.pop(node, None)
+            self._last.pop(node, None)
+            return
+        self._open[node] = (version, t, total, dict(members))
+        for v in [v for v in times if v < version]:
+            del times[v]
+
+    def _close(self, node, row):
+        _, t, total, watts = row
+        last = self._last.get(node)
+        self._last[node] = (t, total, watts)
+        if last is None or t <= last[0]:
+            return
+        dt = t - last[0]
+        prev = last[2]
+        pods = {k: 0.5 * (prev.get(k, 0.0) + w) * dt for k, w in watts.items()}
+        for k, w in prev.items():
+            if k not in watts:
+                pods[k] = 0.5 * w * dt
+        self.counters.add(node, 0.5 * (last[1] + total) * dt, pods)
+
+    def drop_node(self, node):
+        for d in (self._times, self._open, self._last):
+            d.pop(node, None)
+        self.counters.forget_node(node)
+
+
+class PodIntegrator:
+    def __init__(self, counters):
+        self.counters = counters
+        self._last = {}     # pod key -> (t, watts)
+
+    def observe(self, key, node, t, watts):
+        last = self._last.get(key)
+        if t is None:
+            self._last.pop(key, None)
+            return
+        self._last[key] = (t, watts)
+        if last is None or t <= last[0]:
+            return
+        j = 0.5 * (last[1] + watts) * (t - last[0])
+        self.counters.add(node, j, {key: j})
+
+    def forget(self, key):
+        self._last.pop(key, None)
+        self.counters.forget(key)
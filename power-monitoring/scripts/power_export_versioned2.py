@@ -1,15 +1,36 @@
 #!/usr/bin/env python3
 import argparse, time, sys
-from collections import defaultdict, Counter
 from kubernetes import client, config
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import start_http_server, Gauge, Counter
+from pod_informer import PodInformer, list_pods, missing_node
+from power_quorum import QuorumEngine
+from series_tracker import SeriesTracker
+from snapshot_collector import SnapshotCollector, start_snapshot_http_server
+from power_configmap import SNAPSHOT_SELECTOR, list_node_snapshots
+from pipeline_metrics import PERIOD_KEY, SCHEDULED_KEY, TRACE_TIME_KEY, ExporterMetrics, ScanPacer, annotation_float
+from power_shards import ShardMap, run_shard_workers
+from power_rollups import LIQO_PREFIX, RollupEngine
+from power_energy import EnergyCounters, RowIntegrator
+from power_shm import DEFAULT_DIR as SHM_DIR, RingDirectory
  
 """
 Host-run exporter that reads Kubernetes pod annotations and exposes power gauges.
  
 Exposed metrics:
-  - pod_power_watts{namespace,pod,node,app,column,version}
+  - pod_power_watts{namespace,pod,node,app,column}   (+version with --version-label)
+  - pod_power_version{namespace,pod,node}            (with --version-info; value = version)
   - node_power_watts{node}
+  - node_quorum_wait_seconds{node}   (time the last version switch waited for quorum)
+  - power_rollup_watts{level,group}, power_rollup_avg_watts / power_rollup_peak_watts
+    {level,group,window}: node, namespace, app, column, cluster and fleet totals
+    with rolling means and peaks (power_rollups.py; off with --no-rollups)
+  - pod_energy_joules_total{namespace,pod,node,app,column}, node_energy_joules_total{node}:
+    trapezoid over the rows' trace time, one sample per accepted version, so
+    quorum re-decisions never count a row twice (power_energy.py; off with --no-energy)
+  - exporter_series_evicted_total{reason}, exporter_live_series
+  - pipeline self-metrics (pipeline_metrics.py): row->export latency and batch
+    completion per node (from the annotators' emulator.power/scheduled stamp),
+    quorum wait histogram, scan duration by phase, list/watch error counters
  
 Stability feature:
   * Each row your annotator writes has a 'version' (emulator.power/version).
@@ -17,6 +38,45 @@ Stability feature:
     (e.g., 80%) of that node’s pods report the same version. This prevents
     “needles” caused by Prometheus scraping mid-batch while pods are partially
     updated.
+  * Per-node, per-version pod counts and watt sums are kept incrementally
+    (power_quorum.QuorumEngine), so a scan only re-evaluates nodes whose pods
+    changed.
+  * Change-only replays (emulator.power/batch annotation) switch once the
+    newest batch is complete and publish the sum over all pods.
+ 
+Bounded cardinality:
+  * Each pod owns exactly one pod_power_watts series. Series of deleted pods
+    and of superseded versions are removed, and --max-series caps the number
+    of live per-pod series (least recently seen are evicted first).
+ 
+Collector mode (--collector):
+  * pod_power_watts/node_power_watts are kept in an immutable snapshot that the
+    scan loop swaps once per scan and /metrics renders on demand (cached per
+    snapshot generation) instead of living in prometheus_client Gauges.
+ 
+ConfigMap source (--source configmap):
+  * Reads one kwok-power-<node> ConfigMap per node (annotator --write-mode
+    configmap) holding the whole row; totals are complete by construction, so
+    no quorum is needed and only nodes whose version moved are republished.
+ 
+Shared-memory source (--source shm):
+  * Reads the annotators' per-node ring buffers (annotator --shm, power_shm.py)
+    from --shm-dir on the same host: whole rows like --source configmap, but
+    without the API server in the path, so the scan interval (see
+    --adaptive-interval) is the only delay between a write and the gauges.
+ 
+Adaptive interval (--adaptive-interval):
+  * Annotators stamp their row period (emulator.power/period); the scan
+    interval follows the fastest node at --scans-per-row scans per row, so
+    --speedup replays are sampled as densely as real-time ones.
+ 
+Informer mode (--informer):
+  * Pods are listed once and then followed through a watch stream; each scan
+    only processes the pods whose annotations changed since the last one.
+
+Sharding (--shard-index/--shard-count, --shard-nodes, --shard-file):
+  * Each instance only exports the nodes of its shard (power_shards.py);
+    --shard-workers N runs N shard processes behind this one metrics port.
 """
  
 def load_kube():
@@ -30,6 +90,24 @@ def load_kube():
             print(f"Failed to load kube config: {e}", file=sys.stderr)
             sys.exit(1)
  
+def parse_versioned(p, args):
+    # -> (version, watts, batch-or-None, scheduled-or-None, trace-time-or-None) or None if the pod has
+    #    no usable annotations
+    ann   = p.annotations
+    ver_s = ann.get(args.version_key)
+    w_s   = ann.get(args.annotation_key)
+    if not ver_s or not w_s:
+        return None
+    try:
+        ver, watts = int(float(ver_s)), float(w_s)   # accept "12" or "12.0"
+    except Exception:
+        return None
+    try:
+        batch = int(ann[args.batch_key])
+    except Exception:
+        batch = None
+    return ver, watts, batch, annotation_float(ann, args.scheduled_key), annotation_float(ann, args.trace_time_key)
+ 
 def main():
     ap = argparse.ArgumentParser(
         description="Expose pod/node power gauges from pod annotations with quorum switching."
@@ -38,12 +116,27 @@ def main():
                     help="Annotation key for watts (default: emulator.power/watts).")
     ap.add_argument("--version-key", default="emulator.power/version",
                     help="Annotation key for version (default: emulator.power/version).")
+    ap.add_argument("--batch-key", default="emulator.power/batch",
+                    help="Annotation key for the batch size of change-only replays (default: emulator.power/batch).")
+    ap.add_argument("--scheduled-key", default=SCHEDULED_KEY,
+                    help=f"Annotation key for the row deadline used for latency metrics (default: {SCHEDULED_KEY}).")
     ap.add_argument("--port", type=int, default=9100,
                     help="HTTP port to expose metrics (default: 9100).")
     ap.add_argument("--bind", default="0.0.0.0",
                     help="Bind address (default: 0.0.0.0).")
     ap.add_argument("--interval", type=float, default=0.5,
                     help="Seconds between scans (default: 0.5).")
+    ap.add_argument("--adaptive-interval", action="store_true",
+                    help="Shorten --interval to follow the annotators' row period (emulator.power/period).")
+    ap.add_argument("--scans-per-row", type=int, default=4,
+                    help="Scans per replayed row with --adaptive-interval (default: 4).")
+    ap.add_argument("--min-interval", type=float, default=0.05,
+                    help="Lower bound for the adaptive interval (default: 0.05).")
+    ap.add_argument("--period-key", default=PERIOD_KEY,
+                    help=f"Annotation key for the annotators' row period (default: {PERIOD_KEY}).")
+    ap.add_argument("--trace-time-key", default=TRACE_TIME_KEY,
+                    help=f"Annotation key for the row's trace time used by the energy counters "
+                         f"(default: {TRACE_TIME_KEY}).")
     ap.add_argument("--label-selector", default="app=kwok-power",
                     help="Label selector to filter pods (default: app=kwok-power; empty for all pods).")
     ap.add_argument("--namespaces", nargs="*", default=[],
@@ -51,99 +144,351 @@ def main():
     ap.add_argument("--switch-threshold", type=float, default=0.8,
                     help="Fraction [0..1] of a node's pods that must report the same version "
                          "before node total switches to that version (default: 0.8).")
+    ap.add_argument("--informer", action="store_true",
+                    help="List once, then follow a watch stream instead of re-listing every interval.")
+    ap.add_argument("--page-size", type=int, default=500,
+                    help="Pods per LIST request (limit/continue pagination; default: 500, 0 = unpaginated).")
+    ap.add_argument("--metadata-only", action="store_true",
+                    help="Fetch PartialObjectMetadata instead of full pods; the node comes from the "
+                         "kwok.power/node label set by the annotators.")
+    ap.add_argument("--version-label", action="store_true",
+                    help="Keep the legacy 'version' label on pod_power_watts (old series are still evicted).")
+    ap.add_argument("--version-info", action="store_true",
+                    help="Expose pod_power_version{namespace,pod,node} with the pod's current version as value.")
+    ap.add_argument("--max-series", type=int, default=10000,
+                    help="Cap on live per-pod series; least recently seen are evicted (0 = no cap, default: 10000).")
+    ap.add_argument("--source", choices=("pods","configmap","shm"), default="pods",
+                    help="pods: per-pod annotations with quorum switching; configmap: one row object per node; "
+                         "shm: the annotators' local ring buffers.")
+    ap.add_argument("--shm-dir", default=SHM_DIR,
+                    help=f"Directory of the annotators' ring buffers with --source shm (default: {SHM_DIR}).")
+    ap.add_argument("--snapshot-selector", default=SNAPSHOT_SELECTOR,
+                    help=f"Label selector for per-node ConfigMaps with --source configmap (default: {SNAPSHOT_SELECTOR}).")
+    ap.add_argument("--collector", action="store_true",
+                    help="Render pod/node power from a per-scan snapshot at scrape time instead of Gauges.")
+    ap.add_argument("--shard-index", type=int, default=0,
+                    help="This instance's shard with --shard-count/--shard-file (default: 0).")
+    ap.add_argument("--shard-count", type=int, default=1,
+                    help="Split nodes over this many exporters by consistent hashing of the node name (default: 1).")
+    ap.add_argument("--shard-nodes", nargs="*", default=[],
+                    help="Export only these nodes (explicit shard).")
+    ap.add_argument("--shard-file", default=None,
+                    help="JSON shard layout re-read on change: {\"count\": N, \"pins\": {node: shard}} "
+                         "or {\"nodes\": {\"<shard>\": [node, ...]}}.")
+    ap.add_argument("--shard-handoff", type=float, default=None,
+                    help="Seconds after a --shard-file change (without an \"at\" time) at which every "
+                         "instance switches layout (default: 2 x --interval, at least 1).")
+    ap.add_argument("--shard-workers", type=int, default=0,
+                    help="Run this many shard worker processes behind one metrics port (implies --collector).")
+    ap.add_argument("--no-rollups", action="store_true",
+                    help="Do not publish the node/namespace/app/column/cluster/fleet rollups.")
+    ap.add_argument("--rollup-windows", type=float, nargs="*", default=[60.0, 300.0],
+                    help="Rolling windows in seconds for the rollup means and peaks (default: 60 300).")
+    ap.add_argument("--cluster-name", default="local",
+                    help="Cluster label of the local nodes in the cluster rollup (default: local).")
+    ap.add_argument("--liqo-prefix", default=LIQO_PREFIX,
+                    help=f"Nodes named <prefix><cluster> are Liqo virtual nodes of a peered cluster "
+                         f"(default: {LIQO_PREFIX}).")
+    ap.add_argument("--no-energy", action="store_true",
+                    help="Do not publish the pod/node energy counters.")
     args = ap.parse_args()
+    if args.shard_handoff is None:
+        args.shard_handoff = max(1.0, 2 * args.interval)
+ 
+    if args.shard_workers > 1:
+        run_shard_workers(run_exporter, args, args.shard_workers, args.port, args.bind)
+        return
+    run_exporter(args)
+ 
+def run_exporter(args, sink=None):
+    # sink: power_shards.ShardSink when running as a shard worker (no HTTP server of its own)
+    if sink is not None:
+        args.collector = True
+    v1 = None
+    if args.source != "shm":
+        load_kube()
+        v1 = client.CoreV1Api()
+ 
+    # Gauges (or snapshot-backed stand-ins rendered at scrape time)
+    pod_labels = ["namespace","pod","node","app","column"] + (["version"] if args.version_label else [])
+    snap = SnapshotCollector() if args.collector else None
+    gauge = snap.gauge if snap is not None else Gauge
+    g_pod  = gauge("pod_power_watts",  "Per-pod power in watts", pod_labels)
+    g_node = gauge("node_power_watts", "Per-node power in watts", ["node"])
+    g_wait = Gauge("node_quorum_wait_seconds",
+                   "Seconds the node waited for version quorum before its last switch", ["node"])
+ 
+    c_evict = Counter("exporter_series_evicted_total",
+                      "Per-pod series removed from the exporter", ["reason"])
+    g_live = Gauge("exporter_live_series", "Live per-pod series exported")
+    metrics = ExporterMetrics()
+    pacer = ScanPacer(args.interval, args.adaptive_interval, args.scans_per_row, args.min_interval, args.period_key)
+    pod_series = SeriesTracker(g_pod, args.max_series, c_evict)
+    ver_series = None
+    if args.version_info:
+        g_ver = Gauge("pod_power_version", "Row version currently reported by the pod",
+                      ["namespace","pod","node"])
+        ver_series = SeriesTracker(g_ver, args.max_series, c_evict)
  
-    load_kube()
-    v1 = client.CoreV1Api()
+    shards = ShardMap(args.shard_index, args.shard_count, args.shard_nodes, args.shard_file,
+                      args.shard_handoff, name=f"exporter-{args.shard_index}" if sink is not None else "exporter")
+    rollups = None
+    if not args.no_rollups and args.rollup_windows:
+        rollups = RollupEngine(gauge, args.rollup_windows, args.cluster_name, args.liqo_prefix,
+                               shard=args.shard_index if shards.active else None)
+    energy = None
+    if not args.no_energy:
+        energy = RowIntegrator(EnergyCounters(snap.counter if snap is not None else Counter))
  
-    # Gauges
-    g_pod  = Gauge("pod_power_watts",  "Per-pod power in watts",
-                   ["namespace","pod","node","app","column","version"])
-    g_node = Gauge("node_power_watts", "Per-node power in watts", ["node"])
+    # Per-node/per-version pod counts and watt sums, maintained incrementally;
+    # also keeps the last accepted (version,total) per node to avoid dips mid-batch
+    quorum = QuorumEngine(args.switch_threshold)
+ 
+    def drop_pod(key):
+        quorum.remove(key)
+        pod_series.remove(key)
+        if ver_series is not None:
+            ver_series.remove(key)
+        if rollups is not None:
+            rollups.forget(key)
+        if energy is not None:
+            energy.counters.forget(key)
+ 
+    def release_node(node):
+        # the node moved to another shard: its series are now the new owner's
+        for key in quorum.drop_node(node):
+            drop_pod(key)
+        for g in (g_node, g_wait):
+            try:
+                g.remove(node)
+            except KeyError:
+                pass
+        metrics.forget_node(node)
+        pacer.forget(node)
+        if rollups is not None:
+            rollups.drop_node(node)
+        if energy is not None:
+            energy.drop_node(node)
  
     # Start HTTP
-    start_http_server(args.port, addr=args.bind)
+    if sink is None:
+        if snap is not None:
+            start_snapshot_http_server(snap, args.port, addr=args.bind)
+        else:
+            start_http_server(args.port, addr=args.bind)
     sel = args.label_selector if args.label_selector else "(none)"
-    print(f"[exporter] listening on {args.bind}:{args.port}  selector={sel}  "
+    where = f"shard {args.shard_index}/{args.shard_count}" if sink is not None else f"listening on {args.bind}:{args.port}"
+    print(f"[exporter] {where}  selector={sel}  "
           f"interval={args.interval}s  switch-threshold={args.switch_threshold}", flush=True)
  
-    # Keep last accepted (version,total) per node to avoid dips mid-batch
-    last_good = {}  # node -> (version, total)
+    if args.source in ("configmap", "shm"):
+        run_configmap_source(args, v1, pod_series, ver_series, g_node, g_live, snap, metrics, pacer, shards, sink,
+                             rollups, energy)
+        return
  
-    while True:
-        # 1) List pods (optionally per namespace, with selector)
-        try:
-            pods = []
-            if args.namespaces:
-                for ns in args.namespaces:
-                    pods.extend(v1.list_namespaced_pod(namespace=ns,
-                                                       label_selector=(args.label_selector or None)).items)
-            else:
-                pods = v1.list_pod_for_all_namespaces(label_selector=(args.label_selector or None)).items
-        except Exception as e:
-            print(f"[exporter] list pods error: {e}", file=sys.stderr)
-            time.sleep(max(0.1, args.interval))
-            continue
+    informer = None
+    if args.informer:
+        informer = PodInformer(v1, args.namespaces, args.label_selector, name="exporter",
+                               page_size=args.page_size, metadata_only=args.metadata_only).start()
+        informer.wait_synced()
+        print(f"[exporter] informer synced: {len(informer)} pods", flush=True)
  
-        # 2) Build per-node -> version -> [watts,...] and also set per-pod gauges
-        per_node_versions = defaultdict(lambda: defaultdict(list))
-        for p in pods:
-            ns   = p.metadata.namespace or ""
-            name = p.metadata.name or ""
-            node = p.spec.node_name or ""
-            labels = p.metadata.labels or {}
-            app   = labels.get("app", "")
-            col   = labels.get("kwok.power/column", "")
-            ann   = (p.metadata.annotations or {})
-            ver_s = ann.get(args.version_key)
-            w_s   = ann.get(args.annotation_key)
-            if not ver_s or not w_s:
-                continue
+    nodeless = set()    # pods already warned about for having no node
+    while True:
+        # 1) Get changed pods: drained from the watch-fed cache, or by listing
+        #    (optionally per namespace) and dropping pods that disappeared
+        if informer is not None:
+            with metrics.phase("list"):
+                changed, deleted = informer.drain()
+            metrics.sync_informer(informer)
+            pods = changed.values()
+        else:
             try:
-                ver = int(float(ver_s))   # accept "12" or "12.0"
-                watts = float(w_s)
-            except Exception:
+                with metrics.phase("list"):
+                    pods = list_pods(v1, args.namespaces, args.label_selector, args.page_size, args.metadata_only)
+            except Exception as e:
+                metrics.errors.labels("list").inc()
+                print(f"[exporter] list pods error: {e}", file=sys.stderr)
+                time.sleep(max(0.1, args.interval))
                 continue
+            seen = {(p.namespace, p.name) for p in pods}
+            deleted = [k for k in quorum.keys() if k not in seen]
  
-            # Per-pod gauge always reflects the latest annotation
-            g_pod.labels(ns, name, node, app, col, str(ver)).set(watts)
+        if shards.poll():
+            for node in [n for n in quorum.nodes() if not shards.owns(n)]:
+                release_node(node)
+            if informer is not None:
+                # nodes won in a rebalance: their pods may not change again for a while
+                pods = dict(changed)
+                for p in informer.snapshot():
+                    key = (p.namespace, p.name)
+                    if key not in pods and key not in quorum.keys() and shards.owns(p.node):
+                        pods[key] = p
+                pods = pods.values()
  
-            # For node totals, group by version
-            per_node_versions[node][ver].append(watts)
+        # 2) Feed pod changes into the quorum engine; per-pod gauge always
+        #    reflects the latest annotation
+        with metrics.phase("parse"):
+            for key in deleted:
+                drop_pod(key)
+            for p in pods:
+                key = (p.namespace, p.name)
+                if missing_node(p, nodeless):
+                    metrics.errors.labels("node").inc()
+                    drop_pod(key)
+                    continue
+                parsed = parse_versioned(p, args) if shards.owns(p.node) else None
+                if parsed is None:
+                    drop_pod(key)
+                    continue
+                ver, watts, batch, scheduled, trace_time = parsed
+                if quorum.update(key, p.node, ver, watts, batch):
+                    metrics.seen(p.node, ver, scheduled)
+                    pacer.observe_annotations(p.node, p.annotations)
+                    labels = (p.namespace, p.name, p.node, p.app, p.column)
+                    pod_series.set(key, labels + (str(ver),) if args.version_label else labels, watts)
+                    if ver_series is not None:
+                        ver_series.set(key, (p.namespace, p.name, p.node), ver)
+                    if rollups is not None:
+                        rollups.track(key, p.app, p.column)
+                    if energy is not None:
+                        energy.stamp(p.node, ver, trace_time if trace_time is not None else scheduled)
+                        energy.counters.track(key, labels)
+                else:
+                    pod_series.touch(key)
+                    if ver_series is not None:
+                        ver_series.touch(key)
+            g_live.set(len(pod_series))
  
-        # 3) For each node, decide if we switch to the new version or keep last
-        for node, versions in per_node_versions.items():
-            if not versions:
-                # No data for this node this cycle; keep previous gauge value
-                if node in last_good:
-                    g_node.labels(node).set(last_good[node][1])
-                continue
+        # 3) For each touched node, switch to the new version on quorum or keep last
+        with metrics.phase("aggregate"):
+            for node, total, switched, wait in quorum.decide():
+                g_node.labels(node).set(total)
+                if wait is not None:
+                    g_wait.labels(node).set(wait)
+                    metrics.switched(node, switched, wait)
+                if switched is not None or quorum.accepted(node) is None:
+                    # the pods behind the new total (a kept total keeps its rollups and energy row)
+                    members = quorum.members(node)
+                    # unchanged pods of a change-only row are seen too, even without a watch event
+                    for key, _ in members:
+                        pod_series.touch(key)
+                        if ver_series is not None:
+                            ver_series.touch(key)
+                    if rollups is not None:
+                        rollups.set_node(node, members)
+                    if energy is not None and switched is not None:
+                        energy.observe(node, switched, total, members)
+            for node, ver in quorum.drain_completed():
+                metrics.completed(node, ver)
+            if rollups is not None:
+                rollups.publish()
+        with metrics.phase("publish"):
+            if snap is not None:
+                snap.publish()
+            if sink is not None:
+                sink.send(snap)
  
-            # Count pods per version on this node
-            counts = {ver: len(vals) for ver, vals in versions.items()}
-            n_total = sum(counts.values())
+        time.sleep(max(0.0, pacer.interval()))
  
-            # Pick the version with most pods (ties → highest version)
-            best_ver = max(counts.items(), key=lambda kv: (kv[1], kv[0]))[0]
-            best_cnt = counts[best_ver]
+def run_configmap_source(args, v1, pod_series, ver_series, g_node, g_live, snap, metrics, pacer,
+                         shards=None, sink=None, rollups=None, energy=None):
+    # whole rows per node: kwok-power-<node> ConfigMaps, or the local ring buffers (--source shm)
+    exported = {}   # node -> (version, {pod key})
+    rings = RingDirectory(args.shm_dir) if args.source == "shm" else None
+    while True:
+        if shards is not None:
+            shards.poll()
+        try:
+            with metrics.phase("list"):
+                if rings is not None:
+                    snaps = rings.snapshots(shards.owns if shards is not None else None)
+                    if args.namespaces:
+                        snaps = [s for s in snaps if s.namespace in args.namespaces]
+                else:
+                    snaps = list_node_snapshots(v1, args.namespaces, args.snapshot_selector)
+        except Exception as e:
+            metrics.errors.labels("list").inc()
+            print(f"[exporter] list {args.source} error: {e}", file=sys.stderr)
+            time.sleep(max(0.1, args.interval))
+            continue
  
-            # Compute quorum threshold (#pods). Ceil for safety.
-            need = max(1, int(args.switch_threshold * n_total + 0.999))
+        if shards is not None:
+            snaps = [s for s in snaps if shards.owns(s.node)]
  
-            if best_cnt >= need:
-                # Enough pods are on the same version → switch
-                total = sum(versions[best_ver])
-                g_node.labels(node).set(total)
-                last_good[node] = (best_ver, total)
-            else:
-                # Not enough yet → keep last good total to avoid “needles”
-                if node in last_good:
-                    g_node.labels(node).set(last_good[node][1])
-                else:
-                    # first cycle ever: publish current best anyway
-                    g_node.labels(node).set(sum(versions[best_ver]))
+        with metrics.phase("parse"):
+            seen_nodes = set()
+            for s in snaps:
+                seen_nodes.add(s.node)
+                prev = exported.get(s.node)
+                if prev is not None and prev[0] == s.version:
+                    for key in prev[1]:
+                        pod_series.touch(key)
+                        if ver_series is not None:
+                            ver_series.touch(key)
+                    continue            # row unchanged since last scan
+                keys = set()
+                members = []
+                for col, pod, watts in s.entries:
+                    key = (s.namespace, pod)
+                    keys.add(key)
+                    members.append((key, watts))
+                    if rollups is not None:
+                        rollups.track(key, s.app, col)
+                    if energy is not None:
+                        energy.counters.track(key, (s.namespace, pod, s.node, s.app, col))
+                    labels = (s.namespace, pod, s.node, s.app, col)
+                    pod_series.set(key, labels + (str(s.version),) if args.version_label else labels, watts)
+                    if ver_series is not None:
+                        ver_series.set(key, (s.namespace, pod, s.node), s.version)
+                for key in (prev[1] - keys if prev is not None else ()):
+                    pod_series.remove(key)
+                    if ver_series is not None:
+                        ver_series.remove(key)
+                    if rollups is not None:
+                        rollups.forget(key)
+                    if energy is not None:
+                        energy.counters.forget(key)
+                g_node.labels(s.node).set(s.total)
+                if rollups is not None:
+                    rollups.set_node(s.node, members)
+                if energy is not None:
+                    energy.stamp(s.node, s.version, s.trace_time if s.trace_time is not None else s.scheduled)
+                    energy.observe(s.node, s.version, s.total, members)
+                pacer.observe(s.node, s.period)
+                if prev is not None and s.version > prev[0]:
+                    # the whole row lands in one object: switch and completion coincide
+                    metrics.seen(s.node, s.version, s.scheduled)
+                    metrics.switched(s.node, s.version)
+                    metrics.completed(s.node, s.version)
+                exported[s.node] = (s.version, keys)
+ 
+        for node in [n for n in exported if n not in seen_nodes]:
+            for key in exported.pop(node)[1]:
+                pod_series.remove(key)
+                if ver_series is not None:
+                    ver_series.remove(key)
+                if rollups is not None:
+                    rollups.forget(key)
+                if energy is not None:
+                    energy.counters.forget(key)
+            g_node.remove(node)
+            metrics.forget_node(node)
+            pacer.forget(node)
+            if rollups is not None:
+                rollups.drop_node(node)
+            if energy is not None:
+                energy.drop_node(node)
  
-        time.sleep(max(0.0, args.interval))
+        g_live.set(len(pod_series))
+        if rollups is not None:
+            rollups.publish()
+        with metrics.phase("publish"):
+            if snap is not None:
+                snap.publish()
+            if sink is not None:
+                sink.send(snap)
+        time.sleep(max(0.0, pacer.interval()))
  
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,15 +1,40 @@
 #!/usr/bin/env python3
 import argparse, time, sys
 from kubernetes import client, config
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import start_http_server, Counter, Gauge
+from pod_informer import PodInformer, list_pods, missing_node
+from snapshot_collector import SnapshotCollector, start_snapshot_http_server
+from pipeline_metrics import PERIOD_KEY, SCHEDULED_KEY, TRACE_TIME_KEY, ScanPacer, annotation_float
+from power_energy import EnergyCounters, PodIntegrator
 
 """
-Host-run exporter that reads Kubernetes pod annotations and exposes power metrics.
-Exposes only GAUGES (no energy counters):
+Host-run exporter that reads Kubernetes pod annotations and exposes power metrics:
   - pod_power_watts{namespace,pod,node,app,column}
   - node_power_watts{node}
+  - pod_energy_joules_total{namespace,pod,node,app,column}, node_energy_joules_total{node}
+    (trapezoid between each pod's successive trace times, emulator.power/trace-time;
+    power_energy.py, off with --no-energy)
+
+With --informer the exporter lists pods once and then follows a watch stream,
+updating only the pods whose annotation changed instead of re-listing every
+--interval seconds.
+
+With --collector the two power metrics are rendered at scrape time from a
+snapshot the scan loop swaps in once per scan, instead of living in Gauges.
+
+With --adaptive-interval the scan interval follows the annotators' row period
+(emulator.power/period), e.g. for --speedup replays.
 """
 
+def parse_watts(rec, key):
+    ann = rec.annotations.get(key)
+    if not ann:
+        return None
+    try:
+        return float(ann)
+    except Exception:
+        return None
+
 def main():
     ap = argparse.ArgumentParser(description="Expose pod/node power watts from Kubernetes pod annotations (host-run).")
     ap.add_argument("--annotation-key", default="emulator.power/watts",
@@ -18,10 +43,29 @@ def main():
                     help="HTTP port to expose metrics (default: 9100)." )
     ap.add_argument("--interval", type=float, default=2.0,
                     help="Seconds between scans (default: 2.0)." )
+    ap.add_argument("--adaptive-interval", action="store_true",
+                    help="Shorten --interval to follow the annotators' row period (emulator.power/period)." )
+    ap.add_argument("--scans-per-row", type=int, default=4,
+                    help="Scans per replayed row with --adaptive-interval (default: 4)." )
+    ap.add_argument("--min-interval", type=float, default=0.05,
+                    help="Lower bound for the adaptive interval (default: 0.05)." )
     ap.add_argument("--label-selector", default="app=kwok-power",
                     help="K8s label selector to filter pods (default: app=kwok-power). Use empty string for all pods." )
     ap.add_argument("--namespaces", nargs="*", default=[],
                     help="Optional list of namespaces to restrict to (default: all)." )
+    ap.add_argument("--informer", action="store_true",
+                    help="List once, then follow a watch stream and only update changed pods." )
+    ap.add_argument("--page-size", type=int, default=500,
+                    help="Pods per LIST request (limit/continue pagination); 0 lists in one response." )
+    ap.add_argument("--metadata-only", action="store_true",
+                    help="Fetch PartialObjectMetadata instead of full pods; the node comes from the "
+                         "kwok.power/node label." )
+    ap.add_argument("--collector", action="store_true",
+                    help="Render pod/node power from a per-scan snapshot at scrape time instead of Gauges." )
+    ap.add_argument("--trace-time-key", default=TRACE_TIME_KEY,
+                    help=f"Annotation key for the row's trace time (default: {TRACE_TIME_KEY})." )
+    ap.add_argument("--no-energy", action="store_true",
+                    help="Do not publish the pod/node energy counters." )
     args = ap.parse_args()
 
     # Kube config: try in-cluster, then local kubeconfig
@@ -36,50 +80,122 @@ def main():
 
     v1 = client.CoreV1Api()
 
-    g_pod  = Gauge("pod_power_watts", "Per-pod power in watts",
+    snap = SnapshotCollector() if args.collector else None
+    gauge = snap.gauge if snap is not None else Gauge
+    g_pod  = gauge("pod_power_watts", "Per-pod power in watts",
                    ["namespace","pod","node","app","column"])
-    g_node = Gauge("node_power_watts", "Per-node power in watts", ["node"])
+    g_node = gauge("node_power_watts", "Per-node power in watts", ["node"])
+    energy = None
+    if not args.no_energy:
+        energy = PodIntegrator(EnergyCounters(snap.counter if snap is not None else Counter))
 
-    start_http_server(args.port)
+    if snap is not None:
+        start_snapshot_http_server(snap, args.port)
+    else:
+        start_http_server(args.port)
     sel = args.label_selector if args.label_selector else "(none)"
-    print(f"[exporter] listening on :{args.port}, annotation={args.annotation_key!r}, selector={sel}", flush=True)
+    mode = "informer" if args.informer else "poll"
+    print(f"[exporter] listening on :{args.port}, annotation={args.annotation_key!r}, selector={sel}, mode={mode}", flush=True)
+
+    pacer = ScanPacer(args.interval, args.adaptive_interval, args.scans_per_row, args.min_interval, PERIOD_KEY)
+    if args.informer:
+        run_informer(args, v1, g_pod, g_node, snap, pacer, energy)
+        return
 
+    nodeless = set()
+    exported = {}      # (ns, pod) -> label values exported by the previous scan
     while True:
         node_totals = {}
         try:
-            pods = []
-            if args.namespaces:
-                for ns in args.namespaces:
-                    pods.extend(v1.list_namespaced_pod(namespace=ns,
-                                                       label_selector=(args.label_selector or None)).items)
-            else:
-                pods = v1.list_pod_for_all_namespaces(label_selector=(args.label_selector or None)).items
+            pods = list_pods(v1, args.namespaces, args.label_selector, args.page_size, args.metadata_only)
         except Exception as e:
             print(f"[exporter] error listing pods: {e}", file=sys.stderr)
             time.sleep(max(0.1, args.interval))
             continue
 
+        seen = {}
         for p in pods:
-            ns = p.metadata.namespace or ""
-            pod = p.metadata.name or ""
-            node = (p.spec.node_name or "")
-            labels = p.metadata.labels or {}
-            app = labels.get("app", "")
-            column = labels.get("kwok.power/column", "")
-            ann = (p.metadata.annotations or {}).get(args.annotation_key)
-            if not ann:
+            watts = parse_watts(p, args.annotation_key)
+            if watts is None or missing_node(p, nodeless):
                 continue
-            try:
-                watts = float(ann)
-            except Exception:
-                continue
-            g_pod.labels(ns, pod, node, app, column).set(watts)
-            node_totals[node] = node_totals.get(node, 0.0) + watts
+            key = (p.namespace, p.name)
+            labels = (p.namespace, p.name, p.node, p.app, p.column)
+            g_pod.labels(*labels).set(watts)
+            seen[key] = labels
+            node_totals[p.node] = node_totals.get(p.node, 0.0) + watts
+            pacer.observe_annotations(p.node, p.annotations)
+            if energy is not None:
+                energy.counters.track(key, labels)
+                energy.observe(key, p.node, trace_time(p, args), watts)
+
+        # pods deleted (or no longer annotated) since the last scan, and pods whose labels changed
+        for key, labels in exported.items():
+            if seen.get(key) != labels:
+                g_pod.remove(*labels)
+                node_totals.setdefault(labels[2], 0.0)
+                if key not in seen and energy is not None:
+                    energy.forget(key)
+        exported = seen
 
         for node, total in node_totals.items():
             g_node.labels(node).set(total)
+        if snap is not None:
+            snap.publish()
+
+        time.sleep(max(0.0, pacer.interval()))
+
+def trace_time(rec, args):
+    t = annotation_float(rec.annotations, args.trace_time_key)
+    return t if t is not None else annotation_float(rec.annotations, SCHEDULED_KEY)
+
+def run_informer(args, v1, g_pod, g_node, snap=None, pacer=None, energy=None):
+    informer = PodInformer(v1, args.namespaces, args.label_selector, name="exporter",
+                           page_size=args.page_size, metadata_only=args.metadata_only).start()
+    informer.wait_synced()
+    print(f"[exporter] informer synced: {len(informer)} pods", flush=True)
+
+    exported = {}      # (ns, pod) -> label values currently contributing
+    node_pods = {}     # node -> {(ns, pod): watts}; totals are re-summed, never adjusted in place
+    nodeless = set()
+    while True:
+        changed, deleted = informer.drain()
+        dirty_nodes = set()
+        for key in deleted:
+            labels = exported.pop(key, None)
+            if labels is None:
+                continue
+            g_pod.remove(*labels)
+            node_pods[labels[2]].pop(key, None)
+            dirty_nodes.add(labels[2])
+            if energy is not None:
+                energy.forget(key)
+        for key, p in changed.items():
+            watts = parse_watts(p, args.annotation_key)
+            old_labels = exported.pop(key, None)
+            if old_labels is not None:
+                node_pods[old_labels[2]].pop(key, None)
+                dirty_nodes.add(old_labels[2])
+                if watts is None or old_labels != (p.namespace, p.name, p.node, p.app, p.column):
+                    g_pod.remove(*old_labels)
+            if watts is None or missing_node(p, nodeless):
+                continue
+            labels = (p.namespace, p.name, p.node, p.app, p.column)
+            g_pod.labels(*labels).set(watts)
+            exported[key] = labels
+            node_pods.setdefault(p.node, {})[key] = watts
+            dirty_nodes.add(p.node)
+            if pacer is not None:
+                pacer.observe_annotations(p.node, p.annotations)
+            if energy is not None:
+                energy.counters.track(key, labels)
+                energy.observe(key, p.node, trace_time(p, args), watts)
+
+        for node in dirty_nodes:
+            g_node.labels(node).set(sum(node_pods[node].values()))
+        if snap is not None:
+            snap.publish()
 
-        time.sleep(max(0.0, args.interval))
+        time.sleep(max(0.0, pacer.interval() if pacer is not None else args.interval))
 
 if __name__ == "__main__":
     main()
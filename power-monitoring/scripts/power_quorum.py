@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import time
+
+"""
+Incremental version-quorum engine for node power totals.
+
+Instead of regrouping every pod by (node, version) on every scan, the engine
+keeps per-node, per-version pod counts and running watt sums and updates them
+in O(1) per pod change. Only nodes touched since the last decide() are
+re-evaluated, so a scan costs O(changed pods) rather than O(all pods).
+
+Switch rule (unchanged from the original exporter):
+  * best version = most pods, ties broken by the highest version
+  * the node total switches to the best version once it holds
+    ceil(threshold * pods_on_node) pods; otherwise the last accepted total is
+    kept (or, before the first switch, the best bucket is published anyway)
+
+Change-only replays (annotator --changes-only) patch only the pods whose value
+changed and stamp them with the batch size of their version. When the newest
+version on a node carries a batch size, the node switches as soon as
+ceil(threshold * batch) of those pods report it, and the published total is
+the sum over all pods (unchanged pods still hold valid values).
+
+For every switch to a newer version the engine also reports how long the node
+waited for quorum: from the first pod reporting a version newer than the
+accepted one until the switch. Versions whose whole batch has arrived (every
+pod on the node, or the announced batch size) are queued for
+drain_completed().
+"""
+
+
+class NodeState:
+    __slots__ = ("counts", "sums", "batch", "n", "total", "best", "newest",
+                 "good_ver", "good_total", "pending_since", "last_wait", "done_ver")
+
+    def __init__(self):
+        self.counts = {}          # version -> number of pods on that version
+        self.sums = {}            # version -> running sum of their watts
+        self.batch = {}           # version -> announced batch size (change-only replays)
+        self.n = 0                # pods on this node with a usable version
+        self.total = 0.0          # running sum of watts over all versions
+        self.best = None          # version with most pods (ties -> highest)
+        self.newest = None        # highest version present
+        self.good_ver = None      # last version the total switched to
+        self.good_total = None
+        self.pending_since = None # first time a newer version than good_ver showed up
+        self.last_wait = 0.0      # seconds the last switch waited for quorum
+        self.done_ver = None      # newest version seen complete on this node
+
+    def add(self, ver, watts, batch=None):
+        c = self.counts.get(ver, 0) + 1
+        self.counts[ver] = c
+        self.sums[ver] = self.sums.get(ver, 0.0) + watts
+        if batch is not None:
+            self.batch[ver] = batch
+        self.n += 1
+        self.total += watts
+        b = self.best
+        if b is None or (c, ver) > (self.counts[b], b):
+            self.best = ver
+        if self.newest is None or ver > self.newest:
+            self.newest = ver
+
+    def sub(self, ver, watts):
+        c = self.counts[ver] - 1
+        self.n -= 1
+        self.total = self.total - watts if self.n else 0.0
+        if c:
+            self.counts[ver] = c
+            self.sums[ver] -= watts
+        else:
+            # Dropping empty buckets also resets any float drift in the sum
+            del self.counts[ver], self.sums[ver]
+            self.batch.pop(ver, None)
+            if ver == self.newest:
+                self.newest = max(self.counts) if self.counts else None
+        if ver == self.best:
+            # Only the leader lost a pod; rescan the (few) live versions
+            self.best = max(self.counts.items(), key=lambda kv: (kv[1], kv[0]))[0] if self.counts else None
+
+
+class QuorumEngine:
+    def __init__(self, threshold, clock=time.monotonic):
+        self.threshold = threshold
+        self.clock = clock
+        self._pods = {}     # pod key -> (node, version, watts)
+        self._nodes = {}    # node -> NodeState
+        self._by_node = {}  # node -> {pod keys}
+        self._dirty = set()
+        self._completed = []
+
+    def __len__(self):
+        return len(self._pods)
+
+    def keys(self):
+        return self._pods.keys()
+
+    def nodes(self):
+        return self._nodes.keys()
+
+    def update(self, key, node, ver, watts, batch=None):
+        """Record the latest (node, version, watts) of a pod; returns False if nothing changed."""
+        cur = (node, ver, watts)
+        old = self._pods.get(key)
+        if old == cur:
+            return False
+        if old is not None:
+            self._nodes[old[0]].sub(old[1], old[2])
+            self._dirty.add(old[0])
+            self._by_node[old[0]].discard(key)
+        st = self._nodes.get(node)
+        if st is None:
+            st = self._nodes[node] = NodeState()
+        st.add(ver, watts, batch)
+        if st.pending_since is None and st.good_ver is not None and ver > st.good_ver:
+            st.pending_since = self.clock()
+        self._pods[key] = cur
+        self._by_node.setdefault(node, set()).add(key)
+        self._dirty.add(node)
+        return True
+
+    def remove(self, key):
+        old = self._pods.pop(key, None)
+        if old is None:
+            return False
+        self._nodes[old[0]].sub(old[1], old[2])
+        self._dirty.add(old[0])
+        self._by_node[old[0]].discard(key)
+        return True
+
+    def drop_node(self, node):
+        """Forget a node and its pods entirely (e.g. it moved to another shard); -> the pod keys dropped."""
+        keys = list(self._by_node.pop(node, ()))
+        for k in keys:
+            del self._pods[k]
+        self._nodes.pop(node, None)
+        self._dirty.discard(node)
+        return keys
+
+    def decide(self):
+        """Re-evaluate nodes touched since the last call.
+
+        Returns [(node, total, switched_version_or_None, quorum_wait_or_None)];
+        nodes with no versioned pods left keep their last total and are skipped.
+        """
+        out = []
+        now = self.clock()
+        for node in self._dirty:
+            st = self._nodes[node]
+            if not st.n:
+                continue
+            batch = st.batch.get(st.newest)
+            if batch is not None:
+                # change-only batch: quorum over the pods written in it
+                best = st.newest
+                need = max(1, int(self.threshold * batch + 0.999))
+                total = st.total
+            else:
+                best = st.best
+                need = max(1, int(self.threshold * st.n + 0.999))
+                total = st.sums[best]
+            if st.counts[best] >= need:
+                wait = None
+                if st.good_ver is None or best > st.good_ver:
+                    wait = now - st.pending_since if st.pending_since is not None else 0.0
+                    st.last_wait = wait
+                    st.pending_since = None
+                st.good_ver, st.good_total = best, total
+                out.append((node, total, best, wait))
+            elif st.good_total is not None:
+                out.append((node, st.good_total, None, None))
+            else:
+                # first cycle ever: publish current best anyway
+                out.append((node, total, None, None))
+            newest = st.newest
+            if (st.done_ver is None or newest > st.done_ver) and st.counts[newest] >= st.batch.get(newest, st.n):
+                st.done_ver = newest
+                self._completed.append((node, newest))
+        self._dirty.clear()
+        return out
+
+    def drain_completed(self):
+        """[(node, version)] whose full batch arrived since the last call."""
+        out, self._completed = self._completed, []
+        return out
+
+    def members(self, node):
+        """[(pod key, watts)] of the pods behind the total decide() last computed for node."""
+        st = self._nodes.get(node)
+        if st is None:
+            return []
+        pods = self._pods
+        keys = self._by_node.get(node, ())
+        if st.batch.get(st.newest) is not None:
+            return [(k, pods[k][2]) for k in keys]      # change-only batch: every pod counts
+        ver = st.best if st.good_ver is None else st.good_ver
+        return [(k, pods[k][2]) for k in keys if pods[k][1] == ver]
+
+    def accepted(self, node):
+        st = self._nodes.get(node)
+        return None if st is None or st.good_ver is None else (st.good_ver, st.good_total)
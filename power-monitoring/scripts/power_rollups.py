@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+import bisect, time
+
+"""
+Precomputed power rollups for the exporter.
+
+Dashboards used to aggregate pod_power_watts at query time (sum by (node),
+avg_over_time(...[5m])), which fans out over every per-pod series. The
+exporter now keeps the aggregates itself while it scans and publishes them as
+three low-cardinality families:
+
+  power_rollup_watts{level,group}              current total
+  power_rollup_avg_watts{level,group,window}   time-weighted mean over the window
+  power_rollup_peak_watts{level,group,window}  highest total within the window
+
+  level=node       group=<node>
+  level=namespace  group=<namespace>
+  level=app        group=<app label>
+  level=column     group=<kwok.power/column> (the same service across nodes)
+  level=cluster    group=<cluster>: Liqo virtual nodes (liqo-<cluster>) count
+                   towards their peered cluster, every other node towards
+                   --cluster-name
+  level=fleet      group=all: every node of every peered cluster
+
+Rollups follow the node totals, not the raw pods: a node's pods contribute
+with the values behind its quorum-accepted node_power_watts, so the rollups
+switch rows together with the node totals and never show mid-batch needles.
+Only nodes whose total was re-decided are re-aggregated. Windows are
+evaluated from the change points of each group's total (prefix integrals for
+the mean, a monotonic queue for the peak), so a scan costs O(groups x
+windows) whatever the window length; before a window has filled up it
+covers the history seen so far.
+"""
+
+LEVELS = ("node", "namespace", "app", "column", "cluster", "fleet")
+LIQO_PREFIX = "liqo-"
+INF = float("inf")
+
+
+def window_label(seconds):
+    """300 -> "5m", 90 -> "90s"."""
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{int(seconds // 60)}m"
+    return f"{seconds:g}s"
+
+
+def cluster_of(node, local="local", prefix=LIQO_PREFIX):
+    """Liqo names the virtual node of a peered cluster liqo-<cluster>; every other node is local."""
+    if prefix and node.startswith(prefix) and len(node) > len(prefix):
+        return node[len(prefix):]
+    return local
+
+
+class WindowStats:
+    """Time-weighted mean and peak of a step function over trailing windows."""
+
+    def __init__(self, windows, now, value):
+        self.windows = sorted(windows)
+        self.times = [now]          # change points
+        self.values = [value]       # value from times[i] until times[i+1]
+        self.cum = [0.0]            # integral of the function up to times[i]
+        self.peak_v = [value]       # decreasing maxima ...
+        self.peak_end = [INF]       # ... and when the step holding each one ended
+
+    def set(self, now, value):
+        last = self.values[-1]
+        if value == last:
+            return
+        self.cum.append(self.cum[-1] + last * (now - self.times[-1]))
+        self.times.append(now)
+        self.values.append(value)
+        # the newest step is always last in the queue; it ends now
+        self.peak_end[-1] = now
+        while self.peak_v and self.peak_v[-1] <= value:
+            self.peak_v.pop()
+            self.peak_end.pop()
+        self.peak_v.append(value)
+        self.peak_end.append(INF)
+
+    def _integral(self, t):
+        i = bisect.bisect_right(self.times, t) - 1
+        return self.cum[i] + self.values[i] * (t - self.times[i])
+
+    def _trim(self, now):
+        cut = now - self.windows[-1]
+        k = bisect.bisect_right(self.times, cut) - 1      # the step in force at `cut` stays
+        if k > 64 and 2 * k > len(self.times):
+            del self.times[:k], self.values[:k], self.cum[:k]
+        k = bisect.bisect_right(self.peak_end, cut)
+        if k > 64 and 2 * k > len(self.peak_end):
+            del self.peak_v[:k], self.peak_end[:k]
+
+    def stats(self, now):
+        """-> [(mean, peak)] per window (ascending window length)."""
+        self._trim(now)
+        total = self._integral(now)
+        out = []
+        for w in self.windows:
+            lo = max(now - w, self.times[0])
+            span = now - lo
+            mean = (total - self._integral(lo)) / span if span > 0 else self.values[-1]
+            out.append((mean, self.peak_v[bisect.bisect_right(self.peak_end, lo)]))
+        return out
+
+
+class RollupEngine:
+    def __init__(self, gauge, windows=(60.0, 300.0), cluster="local", liqo_prefix=LIQO_PREFIX,
+                 shard=None, clock=time.monotonic):
+        # gauge: prometheus_client.Gauge or SnapshotCollector.gauge; shard adds a shard label
+        # so the rollups of several shard workers do not collide
+        self.windows = sorted(set(windows))
+        self.window_labels = [window_label(w) for w in self.windows]
+        self.cluster = cluster
+        self.liqo_prefix = liqo_prefix
+        self.extra = () if shard is None else (str(shard),)
+        self.clock = clock
+        extra = [] if shard is None else ["shard"]
+        self.g_watts = gauge("power_rollup_watts", "Power summed per node, namespace, app, column, cluster or fleet",
+                             ["level", "group"] + extra)
+        self.g_avg = gauge("power_rollup_avg_watts", "Time-weighted mean of power_rollup_watts over the window",
+                           ["level", "group", "window"] + extra)
+        self.g_peak = gauge("power_rollup_peak_watts", "Peak of power_rollup_watts within the window",
+                            ["level", "group", "window"] + extra)
+        self._meta = {}      # pod key -> (namespace, app, column)
+        self._nodes = {}     # node -> {(level, group): watts}
+        self._groups = {}    # (level, group) -> {node: watts}
+        self._stats = {}     # (level, group) -> WindowStats
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def track(self, key, app, column):
+        self._meta[key] = (key[0], app or "", column or "")
+
+    def forget(self, key):
+        self._meta.pop(key, None)
+
+    def set_node(self, node, members):
+        """members: [(pod key, watts)] making up the node's published total."""
+        contrib = {}
+        total = 0.0
+        for key, watts in members:
+            total += watts
+            meta = self._meta.get(key)
+            if meta is None:
+                continue
+            for k in (("namespace", meta[0]), ("app", meta[1]), ("column", meta[2])):
+                contrib[k] = contrib.get(k, 0.0) + watts
+        contrib[("node", node)] = total
+        contrib[("cluster", cluster_of(node, self.cluster, self.liqo_prefix))] = total
+        contrib[("fleet", "all")] = total
+        old = self._nodes.get(node, {})
+        if old == contrib:
+            return
+        self._nodes[node] = contrib
+        for k in old.keys() - contrib.keys():
+            del self._groups[k][node]
+        for k, watts in contrib.items():
+            self._groups.setdefault(k, {})[node] = watts
+        self._dirty.update(old.keys() | contrib.keys())
+
+    def drop_node(self, node):
+        for k in self._nodes.pop(node, {}):
+            del self._groups[k][node]
+            self._dirty.add(k)
+
+    def _remove(self, k):
+        for g, labels in [(self.g_watts, k)] + [(g, k + (wl,)) for g in (self.g_avg, self.g_peak)
+                                                 for wl in self.window_labels]:
+            try:
+                g.remove(*labels, *self.extra)
+            except KeyError:
+                pass
+
+    def publish(self, now=None):
+        """Refresh the rollup gauges; call once per scan after the node totals."""
+        now = self.clock() if now is None else now
+        for k in self._dirty:
+            nodes = self._groups.get(k)
+            if not nodes:
+                self._groups.pop(k, None)
+                self._stats.pop(k, None)
+                self._remove(k)
+                continue
+            value = sum(nodes.values())
+            st = self._stats.get(k)
+            if st is None:
+                self._stats[k] = WindowStats(self.windows, now, value)
+            else:
+                st.set(now, value)
+            self.g_watts.labels(*k, *self.extra).set(value)
+        self._dirty.clear()
+        for k, st in self._stats.items():
+            for wl, (mean, peak) in zip(self.window_labels, st.stats(now)):
+                self.g_avg.labels(*k, wl, *self.extra).set(mean)
+                self.g_peak.labels(*k, wl, *self.extra).set(peak)
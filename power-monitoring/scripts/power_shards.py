@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import copy, hashlib, json, multiprocessing, os, sys, threading, time
+from multiprocessing.connection import wait
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.metrics_core import Metric
+from prometheus_client.parser import text_string_to_metric_families
+from prometheus_client.registry import Collector
+from snapshot_collector import PowerSnapshot, _Frozen, start_snapshot_http_server
+
+"""
+Node sharding for power_export_versioned2.py.
+
+Each exporter instance owns a stable subset of the nodes and only publishes
+series of pods on those nodes:
+
+  --shard-index i --shard-count N   rendezvous hashing on the pod's node name:
+                                    going from N to N+1 shards only moves the
+                                    ~1/(N+1) of nodes that the new shard wins
+  --shard-nodes a b c               an explicit node list
+  --shard-file F                    JSON re-read whenever it changes:
+                                    {"count": N, "pins": {"node-a": 0}} hashes
+                                    unpinned nodes over N shards, or
+                                    {"nodes": {"0": ["a", "b"], "1": ["c"]}}
+
+Rebalancing: a changed shard file takes effect at its "at" epoch time, or
+--shard-handoff seconds after its mtime. Every instance switches at that same
+wall-clock instant, dropping the nodes it lost and picking up the ones it won
+on the same scan, so a moving node_power_watts{node} series is doubled or
+missing for at most one scan interval rather than until every exporter has
+been restarted (hosts need synchronised clocks).
+
+Worker mode (--shard-workers N) runs the N shards as processes of one host:
+each worker scans its shard and ships its snapshot (and, once a second, its
+self-metrics) over a pipe; the parent serves their union on one metrics port,
+adding a shard label to the self-metrics. A worker that dies is restarted.
+"""
+
+
+def shard_of(node, count):
+    """Rendezvous (highest random weight) hashing: the shard with the largest hash(shard, node) wins."""
+    if count <= 1:
+        return 0
+    best, owner = b"", 0
+    for i in range(count):
+        h = hashlib.blake2b(f"{i}/{node}".encode(), digest_size=8).digest()
+        if h > best:
+            best, owner = h, i
+    return owner
+
+
+class ShardMap:
+    def __init__(self, index=0, count=1, nodes=None, path=None, handoff=0.0,
+                 clock=time.time, name="exporter"):
+        self.index = index
+        self.path = path
+        self.handoff = handoff
+        self.clock = clock         # wall clock: every instance must switch at the same instant
+        self.name = name
+        self.active = bool(path) or count > 1 or bool(nodes)
+        self._rule = (count, frozenset(nodes) if nodes else None, {})
+        self._next = None          # (rule, switch time) read from the file but not in force yet
+        self._mtime = None
+        self._cache = {}           # node -> owned
+        if path:
+            self._load()
+            if self._next is not None:
+                self._rule, self._next = self._next[0], None
+            print(f"[{self.name}] {self.describe()}", file=sys.stderr, flush=True)
+
+    def describe(self):
+        count, nodes, pins = self._rule
+        if nodes is not None:
+            return f"shard {self.index}: {len(nodes)} node(s)"
+        return f"shard {self.index}/{count}" + (f" ({len(pins)} pinned)" if pins else "")
+
+    def _assigned(self, node):
+        count, nodes, pins = self._rule
+        if nodes is not None:
+            return node in nodes
+        pin = pins.get(node)
+        if pin is not None:
+            return pin == self.index
+        return shard_of(node, count) == self.index
+
+    def owns(self, node):
+        if not self.active:
+            return True
+        owned = self._cache.get(node)
+        if owned is None:
+            owned = self._cache[node] = self._assigned(node)
+        return owned
+
+    def poll(self):
+        """Re-read the shard file; True when a new layout came into force since the last call."""
+        if self.path:
+            self._load()
+        if self._next is None or self.clock() < self._next[1]:
+            return False
+        self._rule, self._next = self._next[0], None
+        self._cache.clear()
+        print(f"[{self.name}] now {self.describe()}", file=sys.stderr, flush=True)
+        return True
+
+    def _load(self):
+        try:
+            st = os.stat(self.path)
+            if st.st_mtime_ns == self._mtime:
+                return
+            with open(self.path) as f:
+                data = json.load(f)
+            nodes = data.get("nodes")
+            if nodes is not None:
+                rule = (0, frozenset(nodes.get(str(self.index), ())), {})
+            else:
+                rule = (int(data.get("count", 1)), None, {str(k): int(v) for k, v in (data.get("pins") or {}).items()})
+            at = float(data.get("at", st.st_mtime + self.handoff))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"[{self.name}] shard file {self.path}: {e}; keeping {self.describe()}", file=sys.stderr, flush=True)
+            return
+        first, self._mtime = self._mtime is None, st.st_mtime_ns
+        if rule != self._rule:
+            self._next = (rule, at)
+            if not first:
+                print(f"[{self.name}] shard file changed; switching in {max(0.0, at - self.clock()):.2f}s",
+                      file=sys.stderr, flush=True)
+
+
+# ---------- worker mode ----------
+class ShardSink:
+    """Worker side: ship the current snapshot, and now and then the self-metrics, to the parent."""
+
+    def __init__(self, conn, index, registry=REGISTRY, metrics_every=1.0):
+        self.conn = conn
+        self.index = index
+        self.registry = registry
+        self.metrics_every = metrics_every
+        self._gen = None
+        self._last = 0.0
+
+    def send(self, snap):
+        cur = snap.current()
+        families = cur.families if cur.generation != self._gen else None
+        text = None
+        now = time.monotonic()
+        if now - self._last >= self.metrics_every:
+            text = generate_latest(self.registry)
+            self._last = now
+        if families is not None or text is not None:
+            self.conn.send((self.index, families, text))
+            self._gen = cur.generation
+
+
+class ShardUnion(Collector):
+    """Parent side: the union of the workers' snapshots plus their self-metrics labelled by shard."""
+
+    def __init__(self, count):
+        self._families = [()] * count
+        self._metrics = [()] * count
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._rendered = (-1, b"")
+
+    def update(self, index, families, text):
+        parsed = list(text_string_to_metric_families(text.decode())) if text is not None else None
+        with self._lock:
+            if families is not None:
+                self._families[index] = families
+            if parsed is not None:
+                self._metrics[index] = parsed
+            self._generation += 1
+
+    def forget(self, index):
+        with self._lock:
+            self._families[index] = ()
+            self._metrics[index] = ()
+            self._generation += 1
+
+    def _merged(self):
+        # shards own disjoint nodes, so the per-family dicts never collide
+        by_name = {}
+        for families in self._families:
+            for name, doc, labelnames, values, kind, created in families:
+                if name not in by_name:
+                    by_name[name] = (name, doc, labelnames, {}, kind, None if created is None else {})
+                by_name[name][3].update(values)
+                if created is not None:
+                    by_name[name][5].update(created)
+        return PowerSnapshot(self._generation, tuple(by_name.values()))
+
+    def collect(self):
+        with self._lock:
+            snap, shards = self._merged(), list(enumerate(self._metrics))
+        yield from _Frozen(snap).collect()
+        out = {}
+        for index, families in shards:
+            for fam in families:
+                m = out.get(fam.name)
+                if m is None:
+                    m = out[fam.name] = Metric(fam.name, fam.documentation, fam.type)
+                for s in fam.samples:
+                    m.add_sample(s.name, dict(s.labels, shard=str(index)), s.value)
+        yield from out.values()
+
+    def render(self):
+        gen = self._generation
+        if self._rendered[0] != gen:
+            self._rendered = (gen, generate_latest(self))
+        return self._rendered[1]
+
+
+def _worker_main(target, args, conn):
+    try:
+        target(args, ShardSink(conn, args.shard_index))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_shard_workers(target, args, count, port, addr="0.0.0.0", respawn_delay=1.0):
+    """Run target(args-for-shard-i, sink) in `count` processes and serve their union on one port."""
+    ctx = multiprocessing.get_context("spawn")
+    union = ShardUnion(count)
+    # empty registry: the parent's own process metrics would clash with the workers' families
+    start_snapshot_http_server(union, port, addr=addr, registry=CollectorRegistry())
+    procs, conns = {}, {}
+
+    def spawn(i):
+        wargs = copy.copy(args)
+        wargs.shard_index, wargs.shard_count, wargs.shard_workers = i, count, 0
+        recv, send = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=_worker_main, args=(target, wargs, send), name=f"shard-{i}", daemon=True)
+        p.start()
+        send.close()
+        procs[i] = p
+        conns[recv] = i
+
+    for i in range(count):
+        spawn(i)
+    print(f"[exporter] {count} shard workers behind {addr}:{port}", flush=True)
+    try:
+        while True:
+            for conn in wait(list(conns)):
+                i = conns[conn]
+                try:
+                    union.update(*conn.recv())
+                except EOFError:
+                    del conns[conn]
+                    procs[i].join()
+                    print(f"[exporter] shard worker {i} exited ({procs[i].exitcode}); restarting",
+                          file=sys.stderr, flush=True)
+                    union.forget(i)
+                    time.sleep(respawn_delay)
+                    spawn(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs.values():
+            p.terminate()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+import json, mmap, os, struct, sys, tempfile
+import numpy as np
+from power_configmap import NodeSnapshot
+
+"""
+Local fast path from the annotators to the exporter, for when both run on the
+same host: rows go through a shared-memory ring buffer instead of the API
+server, so a row is visible to the exporter microseconds after it is written,
+always as a whole, and without a single API request.
+
+One file per node, <dir>/<namespace>.<node>.ring (default dir /dev/shm/kwok-power),
+mapped by the annotator (--shm) and the exporter (--source shm):
+
+  header  magic, format, columns C, slots S, meta length, head
+  meta    JSON {namespace, node, app, columns, pods}: the column label and pod
+          of every value, fixed for the life of the file
+  slots   S fixed-size records: seq, version, scheduled, period, trace_time,
+          then C float64 watts in column order
+
+Row k (k = 1, 2, ...) goes to slot k % S under a seqlock: the writer sets the
+slot's seq to 2k-1, fills the slot, sets seq to 2k and only then publishes
+head = k. A reader takes head, copies slot head % S and accepts the copy if
+seq read 2*head before and after it; otherwise the writer lapped it and it
+retries with the new head. The writer only comes back to a slot S rows
+later, so readers practically never retry and never block the writer.
+
+A restarted annotator replaces the file (new inode, readers re-map it) and
+continues above the last version it finds in the old one. The annotators
+still mirror every --mirror-every-th row to the pods (or ConfigMaps) for
+kubectl users and API-based exporters.
+"""
+
+RING_MAGIC = b"KWPWRING"
+RING_FORMAT = 1
+HEADER = struct.Struct("<8sIIIIQ")       # magic, format, columns, slots, meta length, head
+HEAD_OFFSET = 24
+META_OFFSET = 64
+DEFAULT_DIR = "/dev/shm/kwok-power" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "kwok-power")
+
+
+def ring_path(directory, namespace, node):
+    return os.path.join(directory, f"{namespace}.{node}.ring")
+
+
+def slot_dtype(columns):
+    return np.dtype([("seq", "<u8"), ("version", "<i8"), ("scheduled", "<f8"), ("period", "<f8"),
+                     ("trace_time", "<f8"), ("watts", "<f8", (columns,))])
+
+
+def _layout(columns, meta_len):
+    data = META_OFFSET + (meta_len + 7) // 8 * 8
+    return data, slot_dtype(columns)
+
+
+def last_version(path):
+    """Version of the newest row in an existing ring file, 0 if there is none."""
+    try:
+        reader = RingReader(path)
+    except (OSError, ValueError):
+        return 0
+    try:
+        row = reader.read()
+        return row.version if row is not None else 0
+    finally:
+        reader.close()
+
+
+class RingWriter:
+    def __init__(self, path, namespace, node, app, columns, pods, slots=8):
+        self.path = path
+        self.last_version = last_version(path)
+        meta = json.dumps({"namespace": namespace, "node": node, "app": app, "columns": list(columns),
+                           "pods": list(pods)}, separators=(",", ":")).encode()
+        data, dtype = _layout(len(columns), len(meta))
+        self.slots = max(2, int(slots))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(RING_MAGIC, RING_FORMAT, len(columns), self.slots, len(meta), 0))
+            f.seek(META_OFFSET)
+            f.write(meta)
+            f.truncate(data + self.slots * dtype.itemsize)
+        fd = os.open(tmp, os.O_RDWR)
+        try:
+            self._mm = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        os.replace(tmp, path)    # readers of the old file re-map on the new inode
+        self._ring = np.frombuffer(self._mm, dtype=dtype, count=self.slots, offset=data)
+        self._k = 0
+
+    def write(self, version, watts, scheduled=None, period=None, trace_time=None):
+        k = self._k + 1
+        rec = self._ring[k % self.slots]
+        rec["seq"] = 2 * k - 1
+        rec["version"] = version
+        rec["scheduled"] = np.nan if scheduled is None else scheduled
+        rec["period"] = np.nan if period is None else period
+        rec["trace_time"] = np.nan if trace_time is None else trace_time
+        rec["watts"] = watts
+        rec["seq"] = 2 * k
+        struct.pack_into("<Q", self._mm, HEAD_OFFSET, k)
+        self._k = k
+
+    def close(self):
+        self._ring = None
+        self._mm.close()
+
+
+def _opt(x):
+    return None if x != x else float(x)
+
+
+class RingReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.inode = st.st_ino
+        magic, fmt, columns, self.slots, meta_len, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != RING_MAGIC or fmt != RING_FORMAT:
+            self._mm.close()
+            raise ValueError(f"{path}: not a power ring buffer (format {RING_FORMAT})")
+        meta = json.loads(self._mm[META_OFFSET:META_OFFSET + meta_len])
+        self.namespace, self.node, self.app = meta["namespace"], meta["node"], meta.get("app", "")
+        self.columns, self.pods = meta["columns"], meta["pods"]
+        data, dtype = _layout(columns, meta_len)
+        self._ring = np.frombuffer(self._mm, dtype=dtype, count=self.slots, offset=data)
+        self._head = 0
+        self._last = None
+
+    def read(self, retries=4):
+        """-> NodeSnapshot of the newest complete row (the previous one if it has not moved), or None."""
+        for _ in range(retries):
+            head = struct.unpack_from("<Q", self._mm, HEAD_OFFSET)[0]
+            if head == self._head:
+                return self._last
+            slot = head % self.slots
+            if self._ring["seq"][slot] != 2 * head:
+                continue
+            rec = self._ring[slot].copy()
+            if self._ring["seq"][slot] != 2 * head:
+                continue            # overwritten while copying
+            entries = []
+            total = 0.0
+            for col, pod, w in zip(self.columns, self.pods, rec["watts"].tolist()):
+                if w == w:
+                    entries.append((col, pod, w))
+                    total += w
+            self._head = head
+            self._last = NodeSnapshot(self.namespace, self.node, int(rec["version"]), self.app, entries, total,
+                                      _opt(rec["scheduled"]), _opt(rec["period"]), _opt(rec["trace_time"]))
+            return self._last
+        return self._last
+
+    def close(self):
+        self._ring = None
+        self._mm.close()
+
+
+class RingDirectory:
+    """All ring files in a directory, re-scanned on every call (new, replaced and removed files)."""
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        self._readers = {}      # path -> RingReader
+
+    def snapshots(self, owns=None):
+        try:
+            paths = {e.path: e.inode() for e in os.scandir(self.directory) if e.name.endswith(".ring")}
+        except FileNotFoundError:
+            paths = {}
+        for path in [p for p, r in self._readers.items() if paths.get(p) != r.inode]:
+            self._readers.pop(path).close()
+        out = []
+        for path, inode in paths.items():
+            reader = self._readers.get(path)
+            if reader is None:
+                try:
+                    reader = self._readers[path] = RingReader(path)
+                except (OSError, ValueError) as e:
+                    print(f"[shm] skipping {path}: {e}", file=sys.stderr)
+                    continue
+            if owns is not None and not owns(reader.node):
+                continue
+            row = reader.read()
+            if row is not None:
+                out.append(row)
+        return out
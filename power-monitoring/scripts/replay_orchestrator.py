@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+import argparse, atexit, os, sys, time
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from create_pods_annotate_parallel import IGNORE_REGEX, build_mapping, ensure_ns, patch_annotations, row_stamps
+from kube_transport import make_core_v1
+from replay_scheduler import DeadlineScheduler, LATE_POLICIES
+from replay_plan import RESAMPLE_METHODS, ReplayCursor, merge_plans
+from trace_cache import load_plan
+from trace_amplifier import amplify_plan
+from power_configmap import write_node_snapshot
+from pod_provisioner import DesiredPod, provision_pods
+from pipeline_metrics import PERIOD_KEY, SCHEDULED_KEY, TRACE_TIME_KEY, AnnotatorMetrics, wall_deadline
+from replay_checkpoint import Checkpointer, mapping_hash, source_fingerprint
+from power_shm import DEFAULT_DIR as SHM_DIR, RingWriter, ring_path
+from prometheus_client import start_http_server
+
+"""
+Replay many CSV traces (one per fake node) from a single process.
+
+All traces share one API client, one worker pool and one deadline scheduler,
+so every node advances on the same clock: tick n of every trace is due at
+t0 + n*tick. Each trace loops over its own rows; without --loop the replay
+ends once the longest trace has been played.
+
+Manifest (YAML):
+
+  tick: 15.0            # optional defaults, overridable on the command line
+  loop: true
+  speedup: 60           # play the CSV time columns 60x faster (overrides tick)
+  resample: 5           # common grid in trace seconds (default with speedup: native step)
+  traces:
+    - csv: data/EMULATION-pod_cpu_watts-SN-1 Hr load.csv   # relative to the manifest
+      node: sn-fake
+      namespace: demo
+      prefix: ""        # pod name prefix (optional)
+      amplify: {pods: 100, seed: 1, jitter: 0.05, shift: 300, scale: 0.2}
+                        # optional: synthetic replicas of the columns (trace_amplifier.py)
+    - node: sa-fake     # instead of csv: a node's share of several traces, as written
+      parts:            # by placement_eval.py
+        - csv: data/EMULATE_pod_cpu_watts_sa.csv
+          columns: [pod-sentiment analysis]
+
+Progress is checkpointed to <manifest>.checkpoint.json (see replay_checkpoint):
+a restart with the same traces and pod mapping skips provisioning and picks
+up at the next tick with higher versions.
+
+With --shm every tick also goes into one shared-memory ring buffer per trace
+(power_shm.py) for exporters on this host (--source shm), and only every
+--mirror-every-th tick is written to the API.
+"""
+
+
+class Trace:
+    def __init__(self, entry, base_dir, ignore, used, load_opts):
+        self.node = entry["node"]
+        self.namespace = entry.get("namespace", "demo")
+        self.prefix = entry.get("prefix", "")
+        self.label_app = entry.get("label_app", "kwok-power")
+        if entry.get("parts"):
+            self.csv = ", ".join(part["csv"] for part in entry["parts"])
+            self.paths = [os.path.join(base_dir, part["csv"]) for part in entry["parts"]]
+            self.plan = merge_plans([load_part(part, base_dir, entry.get("ignore", ignore), load_opts)
+                                     for part in entry["parts"]])
+        else:
+            self.csv = os.path.join(base_dir, entry["csv"])
+            self.paths = [self.csv]
+            # streamed once into a memory-mapped cache; non-numeric cells replay as 0 W
+            self.plan = load_plan(self.csv, entry.get("ignore", ignore), fill=0.0, **load_opts)
+        if entry.get("amplify"):
+            self.plan = amplify_plan(self.plan, self.node, entry["amplify"])
+        if not len(self.plan):
+            raise ValueError(f"{self.csv}: nothing to replay: the plan has no rows")
+        self.mapping = build_mapping(self.plan.columns, self.prefix, used.setdefault(self.namespace, set()))
+        self.pods = [self.mapping[c] for c in self.plan.columns]
+        self.sources = dict(zip(self.plan.columns, self.plan.sources))
+        self.cursor = None
+        self.ring = None          # power_shm.RingWriter with --shm
+
+    def __len__(self):
+        return len(self.plan)
+
+
+def load_part(part, base_dir, ignore, load_opts):
+    """-> (plan, column indices) of a `parts:` entry; every listed column must be in the CSV."""
+    plan = load_plan(os.path.join(base_dir, part["csv"]), part.get("ignore", ignore), fill=0.0, **load_opts)
+    missing = [c for c in part["columns"] if c not in plan.columns]
+    if missing:
+        raise ValueError(f"{part['csv']}: no column(s) {', '.join(map(repr, missing))}")
+    return plan, [plan.columns.index(c) for c in part["columns"]]
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = yaml.safe_load(f) or {}
+    if not manifest.get("traces"):
+        print(f"{path}: manifest has no traces", file=sys.stderr); sys.exit(2)
+    return manifest
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay several CSV traces onto their fake nodes from one process.")
+    ap.add_argument("--manifest", required=True, help="YAML manifest listing csv/node/namespace/prefix entries")
+    ap.add_argument("--image", default="registry.k8s.io/pause:3.9")
+    ap.add_argument("--annotation-key", default="emulator.power/watts")
+    ap.add_argument("--version-key", default="emulator.power/version")
+    ap.add_argument("--batch-key", default="emulator.power/batch")
+    ap.add_argument("--scheduled-key", default=SCHEDULED_KEY)
+    ap.add_argument("--period-key", default=PERIOD_KEY)
+    ap.add_argument("--trace-time-key", default=TRACE_TIME_KEY)
+    ap.add_argument("--ignore", default=IGNORE_REGEX)
+    ap.add_argument("--cache-dir", default=None, help="where to keep trace caches (default: next to each CSV)")
+    ap.add_argument("--no-cache", action="store_true", help="parse every CSV in chunks instead of caching it")
+    ap.add_argument("--chunksize", type=int, default=1000, help="CSV rows parsed per chunk")
+    ap.add_argument("--tick", type=float, default=None, help="seconds between rows (default: manifest 'tick' or 15)")
+    ap.add_argument("--speedup", type=float, default=None,
+                    help="play the traces' time columns N times faster (default: manifest 'speedup' or off)")
+    ap.add_argument("--resample", type=float, default=None,
+                    help="common grid in trace seconds (default: manifest 'resample', or the native step with --speedup)")
+    ap.add_argument("--resample-method", choices=RESAMPLE_METHODS, default="hold")
+    ap.add_argument("--loop", action=argparse.BooleanOptionalAction, default=None,
+                    help="loop every trace forever (default: manifest 'loop' or off)")
+    ap.add_argument("--concurrency", type=int, default=64, help="shared worker pool size")
+    ap.add_argument("--late-policy", choices=LATE_POLICIES, default="run")
+    ap.add_argument("--max-lag", type=float, default=None)
+    ap.add_argument("--changes-only", action="store_true",
+                    help="only patch pods whose value changed since the last write")
+    ap.add_argument("--full-refresh-every", type=int, default=0)
+    ap.add_argument("--write-mode", choices=("pods","configmap"), default="pods")
+    ap.add_argument("--create-only", action="store_true", help="create pods for all traces and exit")
+    ap.add_argument("--create-concurrency", type=int, default=32, help="parallel pod creations while provisioning")
+    ap.add_argument("--prune", action="store_true",
+                    help="delete selector-matching pods on the manifest's nodes that no longer map to a column")
+    ap.add_argument("--patch-retries", type=int, default=3, help="retries per write on 409/429/5xx")
+    ap.add_argument("--qps", type=float, default=0.0,
+                    help="client-side API request rate limit, like client-go QPS (default: 0 = unlimited)")
+    ap.add_argument("--burst", type=int, default=None, help="requests allowed above --qps after idle time (default: --qps)")
+    ap.add_argument("--pool-size", type=int, default=0,
+                    help="keep-alive HTTP connections (default: max of --concurrency and --create-concurrency)")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="serve annotator self-metrics (tick lag, batch time, write errors/retries) on this port")
+    ap.add_argument("--shm", action="store_true",
+                    help="also publish every tick into per-trace shared-memory ring buffers for exporters on "
+                         "this host (--source shm); the API only gets every --mirror-every-th tick")
+    ap.add_argument("--shm-dir", default=SHM_DIR, help=f"ring buffer directory (default: {SHM_DIR})")
+    ap.add_argument("--mirror-every", type=int, default=10,
+                    help="with --shm, write every Nth tick to the pods/ConfigMaps for kubectl users (0 = never)")
+    ap.add_argument("--checkpoint", default=None, help="replay checkpoint file (default: <manifest>.checkpoint.json)")
+    ap.add_argument("--no-checkpoint", action="store_true", help="start at tick 0 and do not record progress")
+    ap.add_argument("--checkpoint-every", type=float, default=1.0, help="seconds between checkpoint writes")
+    ap.add_argument("--reprovision", action="store_true",
+                    help="list/create pods even if the checkpoint's column->pod mapping is unchanged")
+    args = ap.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    tick = args.tick if args.tick is not None else float(manifest.get("tick", 15.0))
+    loop = args.loop if args.loop is not None else bool(manifest.get("loop", False))
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+
+    speedup = args.speedup if args.speedup is not None else float(manifest.get("speedup", 0))
+    step = args.resample if args.resample is not None else float(manifest.get("resample", 0))
+
+    used = {}
+    load_opts = dict(cache=not args.no_cache, cache_dir=args.cache_dir, chunksize=args.chunksize,
+                     resample_step=step or ("native" if speedup else None), method=args.resample_method)
+    try:
+        traces = [Trace(e, base_dir, args.ignore, used, load_opts) for e in manifest["traces"]]
+    except ValueError as e:
+        print(e, file=sys.stderr); sys.exit(2)
+    if speedup:
+        # one shared clock: every trace must be on the same grid
+        steps = {t.plan.step for t in traces}
+        if None in steps or len(steps) > 1:
+            print(f"--speedup needs a time column and one common step in every trace (got {sorted(map(str, steps))}); "
+                  f"pass --resample", file=sys.stderr); sys.exit(2)
+        tick = steps.pop() / speedup
+        print(f"REPLAY every {tick:g}s ({speedup:g}x)")
+    for t in traces:
+        t.cursor = ReplayCursor(t.plan, changes_only=args.changes_only, full_refresh_every=args.full_refresh_every)
+        print(f"TRACE {t.node}: {len(t)} rows x {len(t.pods)} pods from {t.csv}")
+
+    longest = max(len(t) for t in traces)
+    ckpt_path = None if args.no_checkpoint else (args.checkpoint or f"{os.path.abspath(args.manifest)}.checkpoint.json")
+    ckpt = Checkpointer(ckpt_path, mapping_hash((t.namespace, t.node, t.label_app, col, pod)
+                                                for t in traces for col, pod in t.mapping.items()),
+                        longest, plan=",".join(str(len(t)) for t in traces),
+                        source=source_fingerprint([p for t in traces for p in t.paths]), every=args.checkpoint_every)
+
+    # shared by every trace: pooled keep-alive connections, optional QPS/burst ceiling
+    v1 = make_core_v1(args.pool_size or max(args.concurrency, args.create_concurrency), args.qps, args.burst)
+
+    def provision():
+        for ns in sorted({t.namespace for t in traces}):
+            ensure_ns(v1, ns)
+        for app in sorted({t.label_app for t in traces}):
+            desired = [DesiredPod(t.namespace, pod, t.node, {"app": app, "kwok.power/column": t.sources[col]})
+                       for t in traces if t.label_app == app for col, pod in t.mapping.items()]
+            provision_pods(v1, desired, label_selector=f"app={app}", image=args.image,
+                           annotations={args.annotation_key: "0", args.version_key: "0"},
+                           concurrency=args.create_concurrency, prune=args.prune)
+    if args.create_only:
+        provision()
+        return
+    first = ckpt.resume(loop)
+    trust_pods = ckpt.same_mapping and not args.reprovision
+    if trust_pods:
+        print("PROVISION skipped: column->pod mapping unchanged since the checkpoint (--reprovision to force)")
+    else:
+        provision()
+
+    if args.shm:
+        for t in traces:
+            t.ring = RingWriter(ring_path(args.shm_dir, t.namespace, t.node), t.namespace, t.node, t.label_app,
+                                t.plan.sources, t.pods)
+        # versions also continue above the rings', for exporters reading them
+        ckpt.offset = max([ckpt.offset] + [t.ring.last_version - first for t in traces])
+        mirrored = f"every {args.mirror_every} ticks" if args.mirror_every > 0 else "off"
+        print(f"SHM {len(traces)} ring buffer(s) in {args.shm_dir}; API mirror {mirrored}")
+
+    sched = DeadlineScheduler(tick, policy=args.late_policy, max_lag=args.max_lag)
+    metrics = AnnotatorMetrics()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    atexit.register(ckpt.close)
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+        for n, deadline, lag in sched.run(first=first, last=None if loop else longest):
+            version = ckpt.version(n)
+            metrics.row_lag.observe(lag)
+            if lag > sched.max_lag:
+                print(f"LATE tick {n} started {lag:.3f}s after its deadline", file=sys.stderr)
+            started = time.monotonic()
+            futures = []
+            mirror = not args.shm or (args.mirror_every > 0 and n % args.mirror_every == 0)
+            for t in traces:
+                if not loop and n >= len(t):
+                    continue            # shorter trace already finished
+                trace_time = t.plan.trace_time(n, tick)
+                if t.ring is not None:
+                    t.ring.write(version, t.plan.row(n % len(t)), wall_deadline(deadline), tick, trace_time)
+                if not mirror:
+                    continue
+                vals, write = t.cursor.step(n % len(t))
+                if args.write_mode == "configmap":
+                    futures.append(ex.submit(
+                        metrics.call, "configmap", write_node_snapshot, v1, t.namespace, t.node, version,
+                        dict(zip(t.plan.columns, vals)), t.mapping, t.label_app, wall_deadline(deadline), tick,
+                        trace_time, retries=args.patch_retries
+                    ))
+                    continue
+                batch = len(write) if args.changes_only else None
+                stamps = row_stamps(args, deadline, tick, trace_time)
+                for c in write:
+                    futures.append(ex.submit(
+                        metrics.call, "patch", patch_annotations, v1, t.namespace, t.pods[c], vals[c], version,
+                        args.annotation_key, args.version_key, batch, args.batch_key,
+                        stamps, retries=args.patch_retries
+                    ))
+            missing = 0
+            for f in as_completed(futures):
+                try: f.result()
+                except Exception as e:
+                    missing += getattr(e, "status", None) == 404
+                    print(f"PATCH error: {e}", file=sys.stderr)
+            took = time.monotonic() - started
+            metrics.batch.observe(time.monotonic() - deadline)
+            if took > tick:
+                print(f"OVERRUN tick {n}: {len(futures)} writes took {took:.3f}s (tick {tick:g}s)", file=sys.stderr)
+            ckpt.record(n)
+            if missing and trust_pods:
+                # pods went away while we were down: provision after all
+                print(f"PROVISION {missing} pod(s) not found; re-provisioning", file=sys.stderr)
+                provision()
+                trust_pods = False
+                for t in traces:
+                    t.cursor.last_row = None
+    limiter = v1.api_client.limiter
+    throttled = f", {limiter.waited:.1f}s throttled at {args.qps:g} qps" if limiter is not None else ""
+    print(f"Replay done: {sched.fired} ticks fired, {sched.late} late, {sched.dropped} dropped, "
+          f"max lag {sched.max_seen_lag:.3f}s{throttled}")
+
+
+if __name__ == "__main__":
+    main()
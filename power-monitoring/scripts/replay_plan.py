@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import numpy as np
+
+"""
+Precompiled replay plan: the chosen CSV columns as one contiguous float64
+matrix (rows x columns), built once before the replay so the hot loop never
+touches pandas. The matrix may be an in-memory array or a read-only memmap of
+a trace cache (trace_cache.py); rows are only read when they are replayed.
+
+  values[r, c]   watts of column c in row r (NaN where the cell is not numeric)
+  row(r)         row r with NaN replaced by `fill` when one is given
+  trace_time(n)  trace seconds of replay tick n, counting on across loop passes
+
+ReplayCursor walks the plan and returns, per row, which columns need a PATCH:
+cells whose value differs from the last value written for that column (one
+vectorized comparison per row). The first row and, optionally, every
+`full_refresh_every`-th row are written in full.
+
+resample() maps the trace onto a uniform grid of its own `time` column (trace
+seconds), holding the last sample or interpolating linearly, for the whole
+matrix at once before the replay starts. Rows without a numeric time (the
+blank and MAX summary rows at the end of the CSVs) are dropped.
+
+merge_plans() builds one plan from column subsets of several plans (a node's
+share of a placement, placement_eval.py); shorter traces loop inside the
+longest one, as they do when the orchestrator replays them side by side.
+"""
+
+RESAMPLE_METHODS = ("hold", "linear")
+
+
+class ReplayPlan:
+    def __init__(self, columns, values, fill=None, step=None, times=None):
+        self.columns = list(columns)
+        self.sources = self.columns   # trace column each column replays (amplified plans differ)
+        self.step = step          # trace seconds between rows, when the trace has a time column
+        # no copy for C-contiguous float64 input (including memmaps)
+        self.values = values if isinstance(values, np.memmap) else np.ascontiguousarray(values, dtype=np.float64)
+        self.fill = fill
+        self.times = None if times is None else row_times(times, step)
+        # trace seconds one loop pass covers (the last row lasts one step too)
+        self.span = None if self.times is None else float(self.times[-1] - self.times[0]) + (step or 0.0)
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def row(self, idx):
+        vals = np.array(self.values[idx], dtype=np.float64)
+        if self.fill is not None:
+            vals[np.isnan(vals)] = self.fill
+        return vals
+
+    def trace_time(self, n, step=None):
+        """Trace seconds of replay tick n since the start of the first pass; without a time
+        column, n rows of `step` (default: the plan's step) seconds."""
+        if self.times is None:
+            return n * (self.step or step or 0.0)
+        passes, idx = divmod(n, len(self))
+        return passes * self.span + float(self.times[idx] - self.times[0])
+
+
+def _same(a, b):
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def native_step(times):
+    """Typical spacing of the trace's time column (median of positive steps), or None."""
+    if times is None:
+        return None
+    t = np.asarray(times, dtype=np.float64)
+    d = np.diff(t[np.isfinite(t)])
+    d = d[d > 0]
+    return float(np.median(d)) if d.size else None
+
+
+def row_times(times, step=None):
+    """Non-decreasing time per row: rows without a numeric time (the blank and MAX summary
+    rows) continue one step after the previous row; None when no row has a time."""
+    t = np.array(times, dtype=np.float64)
+    ok = np.isfinite(t)
+    if not t.size or not ok.any():
+        return None
+    step = step or 0.0
+    first = int(np.argmax(ok))
+    rows = np.arange(t.size)
+    last = np.maximum.accumulate(np.where(ok, rows, first))   # last row with a time at or before each row
+    t = t[last] + (rows - last) * step
+    t[:first] = t[first] - (first - rows[:first]) * step
+    return np.maximum.accumulate(t)
+
+
+def resample(values, times, step, method="hold", block=4096, alloc=np.empty):
+    """-> (grid times, values on the grid) for a uniform grid of `step` trace seconds; the
+    output matrix comes from alloc(shape) (e.g. a memory-mapped .npy), filled block by block."""
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"unknown resample method {method!r} (expected one of {', '.join(RESAMPLE_METHODS)})")
+    if step is None or step <= 0:
+        raise ValueError("resample step must be > 0")
+    t = np.asarray(times, dtype=np.float64)
+    keep = np.flatnonzero(np.isfinite(t))
+    if keep.size == 0:
+        raise ValueError("trace has no numeric time values")
+    keep = keep[np.argsort(t[keep], kind="stable")]
+    t = t[keep]
+    grid = t[0] + step * np.arange(int(np.floor((t[-1] - t[0]) / step + 1e-9)) + 1)
+    out = alloc((grid.size, values.shape[1]))
+    for start in range(0, grid.size, block):
+        g = grid[start:start + block]
+        # last sample at or before each grid point
+        i0 = np.clip(np.searchsorted(t, g, side="right") - 1, 0, t.size - 1)
+        if method == "hold":
+            out[start:start + g.size] = values[keep[i0]]
+            continue
+        i1 = np.minimum(i0 + 1, t.size - 1)
+        span = t[i1] - t[i0]
+        w = np.divide(g - t[i0], span, out=np.zeros_like(g), where=span > 0)[:, None]
+        v0, v1 = values[keep[i0]], values[keep[i1]]
+        out[start:start + g.size] = v0 + (v1 - v0) * w
+    return grid, out
+
+
+def on_grid(times, step, rtol=1e-6):
+    """True when every row has a time and consecutive times are `step` apart already."""
+    if times is None or not step:
+        return False
+    t = np.asarray(times, dtype=np.float64)
+    return bool(np.isfinite(t).all() and np.allclose(np.diff(t), step, rtol=0.0, atol=rtol * step))
+
+
+def merge_plans(parts):
+    """parts: [(plan, column indices)] -> ReplayPlan over the rows of the longest part, where
+    row r holds row r % len(part) of every part."""
+    rows = max(len(p) for p, _ in parts)
+    values = np.empty((rows, sum(len(cols) for _, cols in parts)), dtype=np.float64)
+    columns, sources, at = [], [], 0
+    for p, cols in parts:
+        cols = list(cols)
+        block = np.asarray(p.values[:, cols], dtype=np.float64)
+        if p.fill is not None:
+            block = np.nan_to_num(block, nan=p.fill)
+        values[:, at:at + len(cols)] = block[np.arange(rows) % len(p)]
+        columns += [p.columns[c] for c in cols]
+        sources += [p.sources[c] for c in cols]
+        at += len(cols)
+    steps = {p.step for p, _ in parts}
+    single = len({id(p) for p, _ in parts}) == 1
+    merged = ReplayPlan(columns, values, step=steps.pop() if len(steps) == 1 else None,
+                        times=parts[0][0].times if single else None)
+    merged.sources = sources
+    return merged
+
+
+class ReplayCursor:
+    def __init__(self, plan: ReplayPlan, changes_only=True, full_refresh_every=0):
+        self.plan = plan
+        self.changes_only = changes_only
+        self.full_refresh_every = full_refresh_every
+        self.last = np.full(len(plan.columns), np.nan)   # last value written per column
+        self.last_row = None
+        self.rows = 0
+        self.cells_total = 0
+        self.cells_written = 0
+
+    def step(self, idx):
+        """Return (row values as floats, column indices to write) for plan row idx."""
+        vals = self.plan.row(idx)
+        valid = ~np.isnan(vals)
+        full = (not self.changes_only or self.last_row is None
+                or (self.full_refresh_every > 0 and self.rows % self.full_refresh_every == 0))
+        if full:
+            cols = np.flatnonzero(valid)
+        else:
+            cols = np.flatnonzero(~_same(vals, self.last) & valid)
+        self.last[cols] = vals[cols]
+        self.last_row = idx
+        self.rows += 1
+        self.cells_total += int(valid.sum())
+        self.cells_written += len(cols)
+        return vals.tolist(), cols.tolist()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import time
+
+"""
+Absolute-deadline tick scheduler for CSV replays.
+
+Tick n is due at t0 + n * tick, independent of how long earlier ticks took, so
+a replay does not drift by the batch duration each row and stays on time over
+multi-hour --loop runs. A tick that starts more than max_lag seconds after its
+deadline is "late"; the late policy decides what happens then:
+
+  run       fire every tick anyway, back to back, until the replay catches up
+  coalesce  jump straight to the newest tick that is already due (the rows in
+            between are dropped, the replay state is current again)
+  skip      drop late ticks and wait for the next deadline in the future
+"""
+
+LATE_POLICIES = ("run", "coalesce", "skip")
+
+
+class DeadlineScheduler:
+    def __init__(self, tick, policy="run", max_lag=None, clock=time.monotonic, sleep=time.sleep):
+        if policy not in LATE_POLICIES:
+            raise ValueError(f"unknown late policy {policy!r} (expected one of {', '.join(LATE_POLICIES)})")
+        self.tick = max(0.0, tick)
+        self.policy = policy
+        self.max_lag = self.tick if max_lag is None else max_lag
+        self.clock, self.sleep = clock, sleep
+        self.t0 = None
+        self.fired = 0
+        self.late = 0       # ticks fired later than max_lag (policy "run")
+        self.dropped = 0    # ticks never fired (policies "coalesce"/"skip")
+        self.max_seen_lag = 0.0
+
+    def deadline(self, n):
+        return self.t0 + n * self.tick
+
+    def _due(self, now):
+        # Newest tick whose deadline has passed
+        return int((now - self.t0) / self.tick) if self.tick > 0 else 0
+
+    def run(self, first=0, last=None, t0=None):
+        """Yield (n, deadline, lag) for ticks first..last-1 (forever if last is None)."""
+        self.t0 = self.clock() - first * self.tick if t0 is None else t0
+        n = first
+        while last is None or n < last:
+            deadline = self.deadline(n)
+            now = self.clock()
+            if now < deadline:
+                self.sleep(deadline - now)
+                now = self.clock()
+            lag = now - deadline
+            if lag > self.max_lag and self.tick > 0:
+                if self.policy == "coalesce":
+                    newest = self._due(now)
+                    if last is not None:
+                        newest = min(newest, last - 1)
+                    if newest > n:
+                        self.dropped += newest - n
+                        n = newest
+                        deadline = self.deadline(n)
+                        lag = now - deadline
+                elif self.policy == "skip":
+                    nxt = self._due(now) + 1
+                    if last is not None:
+                        nxt = min(nxt, last)
+                    self.dropped += nxt - n
+                    n = nxt
+                    continue
+                else:
+                    self.late += 1
+            self.max_seen_lag = max(self.max_seen_lag, lag)
+            self.fired += 1
+            yield n, deadline, lag
+            n += 1
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+
+"""
+Bookkeeping for labelled gauge series so the exporter's cardinality stays bounded.
+
+prometheus_client keeps every label combination ever set until it is removed
+explicitly. SeriesTracker remembers which label tuple each pod currently owns:
+  * when a pod's labels change (e.g. a new row version) the old series is removed
+  * when a pod disappears its series is removed
+  * with max_series > 0 the least recently seen series are evicted once the
+    cap is exceeded; a pod counts as seen whenever the exporter observes it
+    (set() or touch()), not only when its value changes
+Every removal is counted in an optional Counter labelled by reason.
+"""
+
+
+class SeriesTracker:
+    def __init__(self, gauge, max_series=0, evictions=None):
+        self.gauge = gauge
+        self.max_series = max_series
+        self.evictions = evictions      # Counter with a single "reason" label, or None
+        self._live = OrderedDict()      # key -> label tuple, least recently seen first
+
+    def __len__(self):
+        return len(self._live)
+
+    def set(self, key, labels, value):
+        old = self._live.pop(key, None)
+        if old is not None and old != labels:
+            self._drop(old, "superseded")
+        self._live[key] = labels
+        self.gauge.labels(*labels).set(value)
+        if self.max_series > 0:
+            while len(self._live) > self.max_series:
+                _, victim = self._live.popitem(last=False)
+                self._drop(victim, "cap")
+
+    def touch(self, key):
+        """The pod was observed with an unchanged value: keep its series off the eviction end."""
+        if key in self._live:
+            self._live.move_to_end(key)
+
+    def remove(self, key, reason="deleted"):
+        labels = self._live.pop(key, None)
+        if labels is not None:
+            self._drop(labels, reason)
+
+    def _drop(self, labels, reason):
+        try:
+            self.gauge.remove(*labels)
+        except KeyError:
+            pass
+        if self.evictions is not None:
+            self.evictions.labels(reason).inc()
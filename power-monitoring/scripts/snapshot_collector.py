@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import threading, time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+"""
+Scrape-time rendering of the power gauges from an immutable snapshot.
+
+The scan thread writes into SnapshotGauge objects (plain dicts behind the same
+labels(...).set()/remove() calls as prometheus_client.Gauge, so SeriesTracker
+works unchanged) and calls publish() once per scan. publish() freezes the
+gauges written since the last publish into a new PowerSnapshot (untouched
+families reuse the previous snapshot's frozen dicts) and swaps it in with a
+single reference assignment; /metrics renders whichever snapshot is current and caches the text
+per snapshot generation, so repeated scrapes between scans cost one bytes copy
+and never contend with the scan thread.
+
+counter() gives the same for counters (labels(...).inc()); a counter series
+exists at 0 from its first labels(...) call, which is also its _created
+timestamp, as with prometheus_client.Counter.
+"""
+
+PowerSnapshot = namedtuple("PowerSnapshot", "generation families")
+# families: ((name, doc, labelnames, {labels: value}, kind, {labels: created} or None for gauges), ...)
+
+
+class _Child:
+    __slots__ = ("values", "key")
+
+    def __init__(self, values, key):
+        self.values, self.key = values, key
+
+    def set(self, value):
+        self.values[self.key] = float(value)
+
+    def inc(self, amount=1.0):
+        self.values[self.key] = self.values.get(self.key, 0.0) + amount
+
+
+class SnapshotGauge:
+    def __init__(self, owner, name, documentation, labelnames, kind="gauge"):
+        self.owner = owner
+        self.name, self.documentation = name, documentation
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self.values = {}
+        self.created = {} if kind == "counter" else None
+        self.dirty = True
+        self._frozen = None
+
+    def labels(self, *labelvalues):
+        self.dirty = self.owner.dirty = True
+        key = tuple(str(v) for v in labelvalues)
+        if self.created is not None and key not in self.values:
+            self.values[key] = 0.0
+            self.created[key] = time.time()
+        return _Child(self.values, key)
+
+    def remove(self, *labelvalues):
+        key = tuple(str(v) for v in labelvalues)
+        del self.values[key]
+        if self.created is not None:
+            self.created.pop(key, None)
+        self.dirty = self.owner.dirty = True
+
+    def freeze(self):
+        # copy only when written since the last freeze; older snapshots keep their own dict
+        if self.dirty:
+            self._frozen = (self.name, self.documentation, self.labelnames, dict(self.values), self.kind,
+                            None if self.created is None else dict(self.created))
+            self.dirty = False
+        return self._frozen
+
+
+class _Frozen(Collector):
+    def __init__(self, snap):
+        self.snap = snap
+
+    def collect(self):
+        for name, doc, labelnames, values, kind, created in self.snap.families:
+            if kind == "counter":
+                fam = CounterMetricFamily(name, doc, labels=labelnames)
+                for labels, value in values.items():
+                    fam.add_metric(labels, value, created=created.get(labels))
+            else:
+                fam = GaugeMetricFamily(name, doc, labels=labelnames)
+                for labels, value in values.items():
+                    fam.add_metric(labels, value)
+            yield fam
+
+
+class SnapshotCollector(Collector):
+    def __init__(self):
+        self.gauges = []
+        self.dirty = False
+        self._snap = PowerSnapshot(0, ())
+        self._rendered = (-1, b"")
+        self._render_lock = threading.Lock()
+
+    def gauge(self, name, documentation, labelnames):
+        g = SnapshotGauge(self, name, documentation, labelnames)
+        self.gauges.append(g)
+        return g
+
+    def counter(self, name, documentation, labelnames):
+        c = SnapshotGauge(self, name, documentation, labelnames, kind="counter")
+        self.gauges.append(c)
+        return c
+
+    def publish(self, force=False):
+        # Called by the scan thread only; scrapes only ever see whole snapshots.
+        if not (self.dirty or force):
+            return self._snap.generation
+        families = tuple(g.freeze() for g in self.gauges)
+        self._snap = PowerSnapshot(self._snap.generation + 1, families)
+        self.dirty = False
+        return self._snap.generation
+
+    def current(self):
+        return self._snap
+
+    def collect(self):
+        return _Frozen(self._snap).collect()
+
+    def render(self):
+        snap = self._snap
+        gen, text = self._rendered
+        if gen == snap.generation:
+            return text
+        with self._render_lock:
+            if self._rendered[0] != snap.generation:
+                self._rendered = (snap.generation, generate_latest(_Frozen(snap)))
+            return self._rendered[1]
+
+
+def start_snapshot_http_server(collector, port, addr="0.0.0.0", registry=REGISTRY):
+    # /metrics = cached snapshot text + whatever else lives in the default
+    # registry (self-metrics, process/python collectors).
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = collector.render() + generate_latest(registry)
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((addr, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
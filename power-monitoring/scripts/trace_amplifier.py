@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import argparse, hashlib, os, re, sys
+import numpy as np
+from replay_plan import ReplayPlan
+from trace_cache import DEFAULT_IGNORE, load_plan
+
+"""
+Synthetic workload amplifier: the recorded traces as templates for many more
+pods and nodes than they contain.
+
+AmplifiedPlan turns one template ReplayPlan into `pods` columns: column i
+replays template column i % C (C template columns) as replica i // C, with
+per-replica seeded variation
+
+  scale   a fixed factor drawn from [1 - scale, 1 + scale]
+  shift   a time offset of 0..shift trace seconds (whole rows, wrapping around
+          the template), so replicas of one service do not peak in lockstep
+  jitter  per-cell multiplicative noise 1 + jitter * N(0, 1), clipped at 0
+
+Values are generated on the fly, `block` rows at a time with one vectorized
+gather and one noise draw per block; nothing larger than a block is ever
+stored, and a block's noise only depends on (seed, node, block index), so a
+row replays identically however the plan is read. The plan keeps the
+template's time column, so --speedup, --resample and the energy counters'
+trace time work unchanged. Replica pods keep the template column as their
+kwok.power/column label, so the column rollups stay per service.
+
+The command line writes what the annotators need for a large experiment:
+
+  <out>/nodes/<node>.yaml       KWOK nodes cloned from nodes/sn-fake.yaml
+  <out>/replay-manifest.yaml    replay_orchestrator.py manifest with one
+                                `amplify:` trace per node
+
+  python scripts/trace_amplifier.py --nodes 100 --pods 10000 --out amplified \\
+      --template "data/EMULATION-pod_cpu_watts-SN-1 Hr load.csv" data/EMULATE_pod_cpu_watts_sa.csv
+  kubectl apply -f amplified/nodes/
+  python scripts/replay_orchestrator.py --manifest amplified/replay-manifest.yaml --speedup 60
+
+create_pods_annotate_parallel.py takes the same options for a single node
+(--amplify-pods, --amplify-seed, ...).
+"""
+
+NODE_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nodes", "sn-fake.yaml")
+AMPLIFY_OPTIONS = ("pods", "seed", "jitter", "shift", "scale", "block")
+
+
+def node_seed(seed, node):
+    """Per-node seed, so every node gets its own replicas from one experiment seed."""
+    return [int(seed), int.from_bytes(hashlib.blake2b(str(node).encode(), digest_size=8).digest(), "big")]
+
+
+class AmplifiedValues:
+    """Read-only rows x columns view that generates the requested rows block by block."""
+
+    def __init__(self, plan, block):
+        self.plan = plan
+        self.block = max(1, int(block))
+        self.shape = (len(plan.template), len(plan.columns))
+        self._cache = {}
+
+    def _block(self, b):
+        out = self._cache.get(b)
+        if out is not None:
+            return out
+        p = self.plan
+        rows = np.arange(b * self.block, min((b + 1) * self.block, self.shape[0]))
+        out = p.template[(rows[:, None] + p.shift[None, :]) % self.shape[0], p.src[None, :]]
+        out *= p.scale[None, :]
+        if p.jitter:
+            noise = np.random.default_rng(p.seed + [b]).standard_normal(out.shape)
+            out *= np.maximum(0.0, 1.0 + p.jitter * noise)
+        if len(self._cache) >= 2:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[b] = out
+        return out
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.shape[0])
+            if step != 1:
+                raise IndexError("amplified rows can only be sliced contiguously")
+            parts = [self._block(b)[max(start, b * self.block) - b * self.block:stop - b * self.block]
+                     for b in range(start // self.block, (stop - 1) // self.block + 1)] if stop > start else []
+            return np.concatenate(parts) if parts else np.empty((0, self.shape[1]))
+        idx = int(key) % self.shape[0]
+        return self._block(idx // self.block)[idx % self.block]
+
+
+class AmplifiedPlan(ReplayPlan):
+    def __init__(self, template: ReplayPlan, pods, node="", seed=0, jitter=0.05, shift=0.0, scale=0.2,
+                 block=256):
+        if not template.columns or pods < 1:
+            raise ValueError("amplify needs a template with columns and pods >= 1")
+        c = len(template.columns)
+        self.template = np.asarray(template.values, dtype=np.float64)
+        self.src = np.arange(pods) % c
+        self.columns = [f"{template.columns[i % c]}#{i // c}" for i in range(pods)]
+        self.sources = [template.columns[i % c] for i in range(pods)]
+        self.step = template.step
+        self.fill = template.fill
+        self.times = template.times
+        self.span = template.span
+        self.seed = node_seed(seed, node)
+        self.jitter = float(jitter)
+        rng = np.random.default_rng(self.seed)
+        self.scale = rng.uniform(1.0 - scale, 1.0 + scale, pods) if scale else np.ones(pods)
+        max_rows = int(round(shift / (template.step or 1.0))) if shift else 0
+        self.shift = rng.integers(0, max_rows + 1, pods) if max_rows else np.zeros(pods, dtype=np.int64)
+        self.values = AmplifiedValues(self, block)
+
+    def __len__(self):
+        return self.template.shape[0]
+
+
+def amplify_plan(plan, node, opts):
+    """AmplifiedPlan from a manifest `amplify:` mapping (or flags); unknown keys are an error."""
+    unknown = set(opts) - set(AMPLIFY_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown amplify option(s): {', '.join(sorted(unknown))}")
+    return AmplifiedPlan(plan, node=node, **opts)
+
+
+def node_manifest(text, template_name, name, pods):
+    """Clone a Node YAML: rename it and make sure it advertises room for `pods` pods."""
+    out = re.sub(rf"\b{re.escape(template_name)}\b", name, text)
+    return re.sub(r'(\bpods:\s*)"(\d+)"', lambda m: f'{m.group(1)}"{max(int(m.group(2)), pods)}"', out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write KWOK nodes and a replay manifest that amplify the traces.")
+    ap.add_argument("--template", nargs="+", required=True, help="template trace CSV(s), assigned to nodes round-robin")
+    ap.add_argument("--nodes", type=int, default=100)
+    ap.add_argument("--pods", type=int, default=10000, help="pods in total, spread evenly over the nodes")
+    ap.add_argument("--node-prefix", default="amp-", help="node names are <prefix><index> (default: amp-)")
+    ap.add_argument("--namespace", default="demo")
+    ap.add_argument("--out", default="amplified", help="output directory (default: amplified)")
+    ap.add_argument("--node-template", default=NODE_TEMPLATE, help="Node YAML to clone (default: nodes/sn-fake.yaml)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--jitter", type=float, default=0.05, help="per-cell noise, fraction of the value (default: 0.05)")
+    ap.add_argument("--shift", type=float, default=300.0, help="max time shift per replica, trace seconds (default: 300)")
+    ap.add_argument("--scale", type=float, default=0.2, help="per-replica scale spread, +/- fraction (default: 0.2)")
+    ap.add_argument("--tick", type=float, default=None, help="manifest tick (default: the orchestrator's)")
+    ap.add_argument("--speedup", type=float, default=None, help="manifest speedup")
+    ap.add_argument("--loop", action="store_true", help="manifest loop: true")
+    ap.add_argument("--ignore", default=DEFAULT_IGNORE)
+    ap.add_argument("--preview", type=int, default=0,
+                    help="generate the first N rows of every node and print their mean/peak node totals")
+    args = ap.parse_args()
+    if args.nodes < 1 or args.pods < args.nodes:
+        print("need --nodes >= 1 and --pods >= --nodes", file=sys.stderr); sys.exit(2)
+
+    with open(args.node_template) as f:
+        node_text = f.read()
+    template_name = re.search(r"^\s*name:\s*(\S+)", node_text, re.M).group(1)
+    manifest_dir = os.path.abspath(args.out)
+    os.makedirs(os.path.join(manifest_dir, "nodes"), exist_ok=True)
+
+    width = len(str(args.nodes - 1))
+    per_node, extra = divmod(args.pods, args.nodes)
+    lines = [f"# Generated by scripts/trace_amplifier.py: {args.pods} pods on {args.nodes} nodes, seed {args.seed}"]
+    for key, val in (("tick", args.tick), ("speedup", args.speedup)):
+        if val is not None:
+            lines.append(f"{key}: {val:g}")
+    lines += [f"loop: {'true' if args.loop else 'false'}", "traces:"]
+    plans = {}
+    for i in range(args.nodes):
+        node = f"{args.node_prefix}{i:0{width}d}"
+        pods = per_node + (i < extra)
+        csv = args.template[i % len(args.template)]
+        with open(os.path.join(manifest_dir, "nodes", f"{node}.yaml"), "w") as f:
+            f.write(node_manifest(node_text, template_name, node, pods))
+        rel = os.path.relpath(os.path.abspath(csv), manifest_dir)
+        lines += [f"  - csv: \"{rel}\"", f"    node: {node}", f"    namespace: {args.namespace}",
+                  f"    prefix: \"{node}-\"",
+                  f"    amplify: {{pods: {pods}, seed: {args.seed}, jitter: {args.jitter:g}, "
+                  f"shift: {args.shift:g}, scale: {args.scale:g}}}"]
+        if args.preview:
+            if csv not in plans:
+                plans[csv] = load_plan(csv, args.ignore, fill=0.0)
+            plan = AmplifiedPlan(plans[csv], pods, node, args.seed, args.jitter, args.shift, args.scale)
+            totals = plan.values[0:min(args.preview, len(plan))].sum(axis=1)
+            print(f"PREVIEW {node}: {pods} pods from {os.path.basename(csv)}, rows 0..{len(totals) - 1}: "
+                  f"mean {totals.mean():.1f}W peak {totals.max():.1f}W")
+    path = os.path.join(manifest_dir, "replay-manifest.yaml")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Wrote {args.nodes} node manifests to {os.path.join(args.out, 'nodes')} and {path} "
+          f"({per_node}{'+1' if extra else ''} pods per node)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse, json, os, re, shutil, sys, time
+import numpy as np
+import pandas as pd
+from replay_plan import ReplayPlan, native_step, on_grid, resample
+
+"""
+Streaming CSV ingestion and a memory-mappable cache for long traces.
+
+The wide trace CSVs (e.g. EMULATION-pod_cpu_watts-SN-1 Hr load.csv) start with
+a UTF-8 BOM and interleave blank spacer columns, which pandas names
+'Unnamed: N'. Instead of loading the whole file into a DataFrame, the reader
+parses `chunksize` rows at a time, keeps only the selected columns as float64
+(non-numeric cells -> NaN) and appends them to a raw file, so memory stays
+bounded by the chunk size rather than the trace length.
+
+The result is cached next to the CSV (or in --cache-dir) as:
+
+  <csv name>.npy        float64 matrix, rows x selected columns (np.load(mmap_mode="r"))
+  <csv name>.time.npy   float64 time column, if the CSV has one
+  <csv name>.json       sidecar: columns, rows, source size/mtime, ignore regex
+
+Later runs memory-map the .npy instead of parsing the CSV; the cache is rebuilt
+when the CSV or the ignore regex changes.
+
+Resampling (--resample, or --speedup's native step) is skipped when the rows
+are on the requested grid already. Otherwise the resampled matrix is written
+block by block to its own cache, so replays stay memory-mapped:
+
+  <csv name>.r<step>-<method>.npy / .time.npy / .json
+
+  python scripts/trace_cache.py data/*.csv          # pre-build caches
+"""
+
+CACHE_FORMAT = 1
+TIME_REGEX = r'(?i)^time$'
+DEFAULT_IGNORE = r'(?i)^(time|total)$|^Unnamed:.*'
+
+
+def read_header(path):
+    # pandas' own names, so blank headers become 'Unnamed: N' and duplicates 'x.1'
+    return [str(c) for c in pd.read_csv(path, nrows=0, encoding="utf-8-sig").columns]
+
+
+def select_columns(names, ignore_regex):
+    pat = re.compile(ignore_regex)
+    return [c for c in names if not pat.match(c)]
+
+
+def find_time_column(names):
+    pat = re.compile(TIME_REGEX)
+    return next((c for c in names if pat.match(c)), None)
+
+
+def iter_chunks(path, columns, time_column=None, chunksize=1000):
+    """Yield (times-or-None, values) float64 blocks of at most `chunksize` rows."""
+    use = list(columns) + ([time_column] if time_column else [])
+    reader = pd.read_csv(path, usecols=use, chunksize=chunksize, low_memory=False,
+                         encoding="utf-8-sig", skip_blank_lines=True)
+    for chunk in reader:
+        frame = chunk[list(columns)]
+        text = [c for c, dt in frame.dtypes.items() if not pd.api.types.is_numeric_dtype(dt)]
+        if text:
+            # only columns holding non-numeric cells need the slow path
+            frame = frame.assign(**{c: pd.to_numeric(frame[c], errors="coerce") for c in text})
+        block = frame.to_numpy(dtype=np.float64)
+        times = None
+        if time_column:
+            times = pd.to_numeric(chunk[time_column], errors="coerce").to_numpy(dtype=np.float64)
+        yield times, block
+
+
+def cache_paths(csv_path, cache_dir=None):
+    base = os.path.join(cache_dir or os.path.dirname(os.path.abspath(csv_path)), os.path.basename(csv_path))
+    return base + ".npy", base + ".time.npy", base + ".json"
+
+
+def _write_npy(raw_path, out_path, rows, cols):
+    # .npy header + the raw row-major float64 data, copied in bounded blocks
+    with open(out_path, "wb") as out:
+        shape = (rows, cols) if cols is not None else (rows,)
+        np.lib.format.write_array_header_1_0(out, {"descr": "<f8", "fortran_order": False, "shape": shape})
+        with open(raw_path, "rb") as src:
+            shutil.copyfileobj(src, out, 16 << 20)
+    os.remove(raw_path)
+
+
+def build_cache(csv_path, ignore_regex=DEFAULT_IGNORE, cache_dir=None, chunksize=1000):
+    names = read_header(csv_path)
+    columns = select_columns(names, ignore_regex)
+    if not columns:
+        raise ValueError(f"{csv_path}: no usable columns (after ignoring {ignore_regex})")
+    time_column = find_time_column(names)
+    values_path, time_path, meta_path = cache_paths(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(values_path), exist_ok=True)
+    st = os.stat(csv_path)
+
+    started = time.monotonic()
+    rows = 0
+    with open(values_path + ".raw", "wb") as fv, open(time_path + ".raw", "wb") as ft:
+        for times, block in iter_chunks(csv_path, columns, time_column, chunksize):
+            block.tofile(fv)
+            if times is not None:
+                times.tofile(ft)
+            rows += block.shape[0]
+    _write_npy(values_path + ".raw", values_path + ".tmp", rows, len(columns))
+    os.replace(values_path + ".tmp", values_path)
+    if time_column:
+        _write_npy(time_path + ".raw", time_path + ".tmp", rows, None)
+        os.replace(time_path + ".tmp", time_path)
+    else:
+        os.remove(time_path + ".raw")
+
+    meta = {
+        "format": CACHE_FORMAT,
+        "source": os.path.abspath(csv_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "ignore": ignore_regex,
+        "columns": columns,
+        "time_column": time_column,
+        "rows": rows,
+    }
+    # the sidecar is written last: its presence marks a complete cache
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    print(f"CACHE {csv_path}: {rows} rows x {len(columns)} columns -> {values_path} "
+          f"in {time.monotonic() - started:.2f}s", flush=True)
+    return meta
+
+
+def _fresh_meta(csv_path, ignore_regex, cache_dir):
+    values_path, time_path, meta_path = cache_paths(csv_path, cache_dir)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        st = os.stat(csv_path)
+    except (OSError, ValueError):
+        return None
+    if (meta.get("format") != CACHE_FORMAT or meta.get("size") != st.st_size
+            or meta.get("mtime_ns") != st.st_mtime_ns or meta.get("ignore") != ignore_regex
+            or not os.path.exists(values_path)):
+        return None
+    return meta
+
+
+def open_trace(csv_path, ignore_regex=DEFAULT_IGNORE, cache_dir=None, chunksize=1000, rebuild=False):
+    """-> (columns, values memmap [rows x columns], times memmap or None), building the cache if stale."""
+    meta = None if rebuild else _fresh_meta(csv_path, ignore_regex, cache_dir)
+    if meta is None:
+        meta = build_cache(csv_path, ignore_regex, cache_dir, chunksize)
+    values_path, time_path, _ = cache_paths(csv_path, cache_dir)
+    values = np.load(values_path, mmap_mode="r")
+    times = np.load(time_path, mmap_mode="r") if meta.get("time_column") else None
+    return meta["columns"], values, times
+
+
+def read_trace(csv_path, ignore_regex=DEFAULT_IGNORE, chunksize=1000):
+    """Chunked parse straight into memory (no cache files); -> (columns, values, times or None)."""
+    names = read_header(csv_path)
+    columns = select_columns(names, ignore_regex)
+    if not columns:
+        raise ValueError(f"{csv_path}: no usable columns (after ignoring {ignore_regex})")
+    time_column = find_time_column(names)
+    times, blocks = [], []
+    for t, block in iter_chunks(csv_path, columns, time_column, chunksize):
+        blocks.append(block)
+        if t is not None:
+            times.append(t)
+    values = np.concatenate(blocks) if blocks else np.empty((0, len(columns)))
+    return columns, values, (np.concatenate(times) if times else None)
+
+
+def resampled_paths(csv_path, cache_dir, step, method):
+    base = cache_paths(csv_path, cache_dir)[0][:-len(".npy")]
+    return tuple(f"{base}.r{step:g}-{method}{ext}" for ext in (".npy", ".time.npy", ".json"))
+
+
+def open_resampled(csv_path, ignore_regex, cache_dir, values, times, step, method):
+    """-> (values memmap, grid times) of the trace on a `step` grid, resampled into a cache once."""
+    values_path, time_path, meta_path = resampled_paths(csv_path, cache_dir, step, method)
+    st = os.stat(csv_path)
+    want = {"format": CACHE_FORMAT, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "ignore": ignore_regex,
+            "step": step, "method": method}
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if all(meta.get(k) == v for k, v in want.items()):
+            return np.load(values_path, mmap_mode="r"), np.load(time_path, mmap_mode="r")
+    except (OSError, ValueError):
+        pass
+    started = time.monotonic()
+    alloc = lambda shape: np.lib.format.open_memmap(values_path + ".tmp", mode="w+", dtype=np.float64,
+                                                    shape=shape)
+    grid, out = resample(values, times, step, method, alloc=alloc)
+    out.flush()
+    del out
+    os.replace(values_path + ".tmp", values_path)
+    with open(time_path + ".tmp", "wb") as f:
+        np.save(f, grid)
+    os.replace(time_path + ".tmp", time_path)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(dict(want, rows=int(grid.size)), f)
+    os.replace(meta_path + ".tmp", meta_path)
+    print(f"CACHE {csv_path}: resampled to {grid.size} rows of {step:g}s ({method}) -> {values_path} "
+          f"in {time.monotonic() - started:.2f}s", flush=True)
+    return np.load(values_path, mmap_mode="r"), np.load(time_path, mmap_mode="r")
+
+
+def load_plan(csv_path, ignore_regex=DEFAULT_IGNORE, fill=None, cache=True, cache_dir=None, chunksize=1000,
+              resample_step=None, method="hold"):
+    """ReplayPlan of the trace; with resample_step (trace seconds, or "native" for the trace's
+    own typical step) the rows are put on a uniform grid of the time column."""
+    if cache:
+        columns, values, times = open_trace(csv_path, ignore_regex, cache_dir, chunksize)
+    else:
+        columns, values, times = read_trace(csv_path, ignore_regex, chunksize)
+    step = native_step(times)
+    if resample_step == "native":
+        resample_step = step
+    if resample_step:
+        if times is None:
+            raise ValueError(f"{csv_path}: no time column to resample on")
+        if not on_grid(times, resample_step):
+            if cache:
+                values, times = open_resampled(csv_path, ignore_regex, cache_dir, values, times,
+                                               resample_step, method)
+            else:
+                times, values = resample(values, times, resample_step, method)
+        step = resample_step
+    return ReplayPlan(columns, values, fill=fill, step=step, times=times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert trace CSVs into memory-mappable replay caches.")
+    ap.add_argument("csv", nargs="+")
+    ap.add_argument("--ignore", default=DEFAULT_IGNORE, help="regex of columns to drop")
+    ap.add_argument("--cache-dir", default=None, help="where to write caches (default: next to each CSV)")
+    ap.add_argument("--chunksize", type=int, default=1000, help="rows parsed per chunk")
+    ap.add_argument("--force", action="store_true", help="rebuild even if the cache is up to date")
+    args = ap.parse_args()
+
+    for path in args.csv:
+        try:
+            columns, values, times = open_trace(path, args.ignore, args.cache_dir, args.chunksize, args.force)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            continue
+        span = f", t={times[0]:g}..{times[-1]:g}" if times is not None and len(times) else ""
+        print(f"{path}: {values.shape[0]} rows x {len(columns)} columns{span}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os, sys
+
+# the scripts are flat modules, imported the way they import each other
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
@@ -0,0 +1,117 @@
+import json, os
+import pytest
+from replay_checkpoint import Checkpointer, load_checkpoint, mapping_hash, source_fingerprint
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def played(path, rows, n_rows, mapping="m", loop=True, every=0.0, **kw):
+    ckpt = Checkpointer(path, mapping, rows, every=every, **kw)
+    first = ckpt.resume(loop)
+    for n in range(first, first + n_rows):
+        ckpt.record(n)
+    ckpt.flush()
+    return ckpt, first
+
+
+def test_mapping_hash_ignores_order():
+    a = mapping_hash([("demo", "n1", "app", "x", "pod-x"), ("demo", "n1", "app", "y", "pod-y")])
+    assert a == mapping_hash([("demo", "n1", "app", "y", "pod-y"), ("demo", "n1", "app", "x", "pod-x")])
+    assert a != mapping_hash([("demo", "n1", "app", "x", "pod-y")])
+
+
+def test_resume_continues_at_the_next_row_above_the_lease(tmp_path):
+    path = str(tmp_path / "c.json")
+    ckpt, first = played(path, 10, 4)
+    assert first == 0
+    assert load_checkpoint(path)["next"] == 4
+    ckpt, first = played(path, 10, 0)
+    assert first == 4
+    # a crash may have used any version up to the leased block
+    assert ckpt.version(first) == 1002
+
+
+def test_new_mapping_restarts_at_row_0_with_higher_versions(tmp_path):
+    path = str(tmp_path / "c.json")
+    played(path, 10, 4)
+    ckpt, first = played(path, 10, 0, mapping="other")
+    assert first == 0
+    assert not ckpt.same_mapping
+    assert ckpt.version(0) == 1002
+
+
+def test_finished_replay_plays_again_unless_looping(tmp_path):
+    path = str(tmp_path / "c.json")
+    played(path, 10, 10)
+    assert Checkpointer(path, "m", 10).resume(loop=False) == 0
+    assert Checkpointer(path, "m", 10).resume(loop=True) == 10
+    assert Checkpointer(path, "m", 12).resume(loop=True) == 0
+
+
+def test_no_checkpoint_records_without_a_file(tmp_path):
+    ckpt, first = played(None, 5, 12, every=1.0)
+    assert first == 0
+    assert ckpt.version(11) == 12
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_saves_at_most_every_interval(tmp_path):
+    path = str(tmp_path / "c.json")
+    clock = Clock()
+    ckpt = Checkpointer(path, "m", 100, every=5.0, clock=clock)
+    ckpt.resume(True)
+    ckpt.record(0)
+    clock.now = 1.0
+    ckpt.record(1)
+    assert load_checkpoint(path)["next"] == 1
+    clock.now = 6.0
+    ckpt.record(2)
+    assert load_checkpoint(path)["next"] == 3
+
+
+def test_unreadable_checkpoint_starts_fresh(tmp_path, capsys):
+    path = tmp_path / "c.json"
+    path.write_text("{truncated")
+    assert load_checkpoint(str(path)) is None
+    assert "unreadable" in capsys.readouterr().err
+    path.write_text(json.dumps({"format": 0, "next": 3}))
+    assert Checkpointer(str(path), "m", 10).resume(True) == 0
+
+
+def test_clean_exit_reserves_no_more_than_it_used(tmp_path):
+    path = str(tmp_path / "c.json")
+    ckpt = Checkpointer(path, "m", 10, every=0.0)
+    ckpt.resume(True)
+    for n in range(4):
+        ckpt.record(n)
+    ckpt.close()
+    assert load_checkpoint(path)["reserved"] == 4
+    ckpt = Checkpointer(path, "m", 10)
+    assert ckpt.version(ckpt.resume(True)) == 5
+
+
+def test_changed_trace_restarts_at_row_0(tmp_path):
+    csv = tmp_path / "t.csv"
+    csv.write_text("time,a\n0,1\n")
+    path = str(tmp_path / "c.json")
+    ckpt, _ = played(path, 10, 4, source=source_fingerprint([str(csv)]))
+    ckpt.close()
+    ckpt, first = played(path, 10, 0, source=source_fingerprint([str(csv)]))
+    assert first == 4
+    os.utime(str(csv), ns=(0, 10**9))
+    ckpt, first = played(path, 10, 0, source=source_fingerprint([str(csv)]))
+    assert first == 0
+    assert ckpt.version(0) == 5
+
+
+def test_empty_plan_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="no rows"):
+        Checkpointer(str(tmp_path / "c.json"), "m", 0)
+    with pytest.raises(ValueError, match="no rows"):
+        Checkpointer(None, "m", 0)
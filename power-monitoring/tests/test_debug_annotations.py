@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+import pytest
+from debug_annotations import AnnotationMonitor, node_ceilings, node_csv, trace_maxima
+
+
+def write_csv(path, rows, header="time,a,b,Total"):
+    with open(path, "w") as f:
+        f.write(header + "\n" + "".join(r + "\n" for r in rows))
+    return str(path)
+
+
+def args(**kw):
+    a = dict(history=16, drop_window=4, drop_ratio=0.5, min_total=0.0, mixed_grace=2.0, tolerance=1.0,
+             max_pod=None, max_total=None, annotation_key="w", version_key="v")
+    a.update(kw)
+    return SimpleNamespace(**a)
+
+
+def pod(name, node, watts, ver=1):
+    return SimpleNamespace(namespace="demo", name=name, node=node, annotations={"w": str(watts), "v": str(ver)})
+
+
+def test_summary_rows_without_a_time_are_skipped(tmp_path):
+    csv = write_csv(tmp_path / "t.csv", ["0,1,2,3", "15,4,1,5", ",40,20,60"])
+    assert trace_maxima(csv) == (4.0, 5.0)
+    untimed = write_csv(tmp_path / "u.csv", ["1,2", "4,1"], header="a,b")
+    assert trace_maxima(untimed) == (4.0, 5.0)
+
+
+def test_ceilings_per_node(tmp_path):
+    small = write_csv(tmp_path / "s.csv", ["0,1,1,2"])
+    big = write_csv(tmp_path / "b.csv", ["0,10,20,30"])
+    ceilings = node_ceilings([("n1", small), ("n2", big), ("n2", small)])
+    assert ceilings == {"n1": (1.0, 2.0), "n2": (20.0, 32.0)}
+    assert node_csv("n1=data/a=b.csv") == ("n1", "data/a=b.csv")
+
+
+def test_spikes_are_judged_against_the_pods_own_node(tmp_path):
+    out = tmp_path / "out.txt"
+    with open(out, "w") as f:
+        mon = AnnotationMonitor(args(), {"n1": (1.0, 2.0), "n2": (20.0, 32.0)}, out=f)
+        mon.apply({("demo", "a"): pod("a", "n1", 5.0), ("demo", "b"): pod("b", "n2", 5.0),
+                   ("demo", "c"): pod("c", "n3", 500.0)}, [])
+        mon.sample(now=0.0)
+    lines = out.read_text().splitlines()
+    assert len(lines) == 1 and "SPIKE   n1" in lines[0] and "pods: a=5.00W" in lines[0]
+
+
+def test_max_overrides_every_node():
+    mon = AnnotationMonitor(args(max_total=3.0), {"n1": (1.0, 2.0)})
+    mon.apply({("demo", "a"): pod("a", "n1", 1.0), ("demo", "b"): pod("b", "n2", 1.0)}, [])
+    assert [(st.max_pod, st.max_total) for st in mon.nodes.values()] == [(1.0, 3.0), (None, 3.0)]
@@ -0,0 +1,106 @@
+import time
+import pytest
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from fake_kube_api import FakeKubeAPI, merge_patch, parse_selector
+from pod_informer import PodInformer, list_scope, missing_node
+from pod_provisioner import DesiredPod, provision_pods
+
+
+@pytest.fixture
+def api():
+    api = FakeKubeAPI().start()
+    yield api
+    api.stop()
+
+
+def pod(name, labels, node="n1"):
+    return client.V1Pod(metadata=client.V1ObjectMeta(name=name, labels=labels),
+                        spec=client.V1PodSpec(node_name=node, containers=[client.V1Container(name="c", image="x")]))
+
+
+def test_merge_patch_deletes_null_keys():
+    doc = {"metadata": {"annotations": {"a": "1", "b": "2"}}}
+    assert merge_patch(doc, {"metadata": {"annotations": {"a": None, "c": "3"}}}) == \
+        {"metadata": {"annotations": {"b": "2", "c": "3"}}}
+    assert doc["metadata"]["annotations"] == {"a": "1", "b": "2"}
+
+
+def test_parse_selector():
+    assert parse_selector("app=x, tier!=db,kwok.power/node,!gone") == [
+        ("app", "=", "x"), ("tier", "!=", "db"), ("kwok.power/node", "exists", None), ("gone", "!", None)]
+
+
+def test_pods_through_the_client(api):
+    v1 = api.core_v1()
+    v1.create_namespaced_pod("demo", pod("a", {"app": "kwok-power"}))
+    v1.create_namespaced_pod("demo", pod("b", {"app": "other"}))
+    with pytest.raises(ApiException) as e:
+        v1.create_namespaced_pod("demo", pod("a", {"app": "kwok-power"}))
+    assert e.value.status == 409
+    v1.patch_namespaced_pod("a", "demo", {"metadata": {"annotations": {"emulator.power/watts": "5"}}})
+    v1.patch_namespaced_pod("a", "demo", {"metadata": {"annotations": {"emulator.power/watts": None}}})
+    assert not v1.read_namespaced_pod("a", "demo").metadata.annotations
+    assert [p.metadata.name for p in v1.list_namespaced_pod("demo", label_selector="app=kwok-power").items] == ["a"]
+    v1.delete_namespaced_pod("b", "demo")
+    assert api.count("pods") == 1
+
+
+def test_informer_follows_changes_and_compaction(api):
+    v1 = api.core_v1()
+    v1.create_namespaced_pod("demo", pod("a", {"app": "kwok-power"}))
+    informer = PodInformer(v1, ["demo"], "app=kwok-power", watch_timeout=5, retry_delay=0.05).start()
+    try:
+        assert informer.wait_synced(timeout=5)
+        changed, deleted = informer.drain()
+        assert list(changed) == [("demo", "a")] and not deleted
+        api.compact()
+        v1.create_namespaced_pod("demo", pod("b", {"app": "kwok-power"}))
+        v1.delete_namespaced_pod("a", "demo")
+        seen, gone = {}, set()
+        for _ in range(100):
+            changed, deleted = informer.drain()
+            seen.update(changed)
+            gone.update(deleted)
+            if ("demo", "b") in seen and ("demo", "a") in gone:
+                break
+            time.sleep(0.05)
+        assert ("demo", "b") in seen and ("demo", "a") in gone
+        assert len(informer) == 1
+    finally:
+        informer.stop()
+
+
+def test_paginated_and_metadata_only_lists(api):
+    v1 = api.core_v1()
+    for i in range(7):
+        v1.create_namespaced_pod("demo", pod(f"p{i}", {"app": "kwok-power", "kwok.power/node": "n2"}, node="n1"))
+    records, rv = list_scope(v1, "demo", "app=kwok-power", page_size=3)
+    assert len(records) == 7 and rv
+    assert {r.node for r in records} == {"n1"}
+    # no spec in PartialObjectMetadata: the node comes from the label
+    records, _ = list_scope(v1, "demo", "app=kwok-power", page_size=3, metadata_only=True)
+    assert {r.node for r in records} == {"n2"}
+
+
+def test_provisioner_labels_pods_from_older_versions(api):
+    v1 = api.core_v1()
+    v1.create_namespaced_pod("demo", pod("old", {"app": "kwok-power"}))
+    desired = [DesiredPod("demo", "old", "n1", {"app": "kwok-power"}),
+               DesiredPod("demo", "new", "n1", {"app": "kwok-power"})]
+    rep = provision_pods(v1, desired, label_selector="app=kwok-power", image="x", annotations={}, verbose=False)
+    assert (rep.existing, rep.created, rep.labelled, rep.failed) == (1, 1, 1, 0)
+    records, _ = list_scope(v1, "demo", "app=kwok-power", metadata_only=True)
+    assert {(r.name, r.node) for r in records} == {("old", "n1"), ("new", "n1")}
+    rep = provision_pods(v1, desired, label_selector="app=kwok-power", image="x", annotations={}, verbose=False)
+    assert (rep.existing, rep.created, rep.labelled) == (2, 0, 0)
+
+
+def test_pods_without_a_node_are_reported_once(api, capsys):
+    v1 = api.core_v1()
+    v1.create_namespaced_pod("demo", pod("bare", {"app": "kwok-power"}))
+    warned = set()
+    records, _ = list_scope(v1, "demo", "app=kwok-power", metadata_only=True)
+    assert [missing_node(r, warned) for r in records] == [True]
+    assert [missing_node(r, warned) for r in records] == [True]
+    assert capsys.readouterr().err.count("demo/bare") == 1
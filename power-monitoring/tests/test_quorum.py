@@ -0,0 +1,117 @@
+from power_quorum import QuorumEngine
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def node_pods(q, node, n, ver, watts):
+    for i in range(n):
+        q.update((node, f"p{i}"), node, ver, watts)
+
+
+def test_switches_once_threshold_of_pods_agree():
+    q = QuorumEngine(0.8)
+    node_pods(q, "n1", 5, 1, 10.0)
+    assert q.decide() == [("n1", 50.0, 1, 0.0)]
+    for i in range(3):
+        q.update(("n1", f"p{i}"), "n1", 2, 20.0)
+    # 3 of 5 on version 2: keep the accepted total of version 1
+    assert q.decide() == [("n1", 50.0, None, None)]
+    q.update(("n1", "p3"), "n1", 2, 20.0)
+    (node, total, switched, _), = q.decide()
+    assert (node, total, switched) == ("n1", 80.0, 2)
+
+
+def test_only_touched_nodes_are_decided():
+    q = QuorumEngine(0.5)
+    node_pods(q, "n1", 2, 1, 1.0)
+    node_pods(q, "n2", 2, 1, 2.0)
+    assert sorted(node for node, *_ in q.decide()) == ["n1", "n2"]
+    assert q.decide() == []
+    assert not q.update(("n2", "p0"), "n2", 1, 2.0)
+    q.update(("n2", "p0"), "n2", 1, 3.0)
+    assert q.decide() == [("n2", 5.0, 1, None)]
+
+
+def test_reports_quorum_wait():
+    clock = Clock()
+    q = QuorumEngine(1.0, clock=clock)
+    node_pods(q, "n1", 2, 1, 1.0)
+    q.decide()
+    clock.now = 10.0
+    q.update(("n1", "p0"), "n1", 2, 1.0)
+    q.decide()
+    clock.now = 12.5
+    q.update(("n1", "p1"), "n1", 2, 1.0)
+    assert q.decide() == [("n1", 2.0, 2, 2.5)]
+
+
+def test_removed_pods():
+    q = QuorumEngine(0.5)
+    node_pods(q, "n1", 2, 1, 1.0)
+    q.decide()
+    assert q.remove(("n1", "p0"))
+    assert not q.remove(("n1", "p0"))
+    assert q.decide() == [("n1", 1.0, 1, None)]
+    assert len(q) == 1
+
+
+def test_partial_batch_switches_on_the_announced_batch_size():
+    q = QuorumEngine(0.8)
+    node_pods(q, "n1", 10, 1, 1.0)
+    q.decide()
+    # change-only row: only 2 of 10 pods changed, and only they carry version 2
+    q.update(("n1", "p0"), "n1", 2, 5.0, batch=2)
+    assert q.decide() == [("n1", 10.0, None, None)]
+    q.update(("n1", "p1"), "n1", 2, 5.0, batch=2)
+    (node, total, switched, _), = q.decide()
+    # the total covers the unchanged pods too
+    assert (node, total, switched) == ("n1", 18.0, 2)
+
+
+def test_completed_versions():
+    q = QuorumEngine(0.5)
+    node_pods(q, "n1", 4, 1, 1.0)
+    q.decide()
+    assert q.drain_completed() == [("n1", 1)]
+    q.update(("n1", "p0"), "n1", 2, 1.0)
+    q.update(("n1", "p1"), "n1", 2, 1.0)
+    q.decide()
+    # switched on quorum, but half the batch is still missing
+    assert q.drain_completed() == []
+    q.update(("n1", "p2"), "n1", 3, 1.0, batch=1)
+    q.decide()
+    assert q.drain_completed() == [("n1", 3)]
+
+
+def test_dropped_nodes():
+    q = QuorumEngine(0.5)
+    node_pods(q, "n1", 2, 1, 1.0)
+    node_pods(q, "n2", 2, 1, 2.0)
+    q.decide()
+    assert sorted(q.drop_node("n2")) == [("n2", "p0"), ("n2", "p1")]
+    assert list(q.nodes()) == ["n1"]
+    assert len(q) == 2
+
+
+def test_members_follow_the_accepted_version():
+    q = QuorumEngine(0.8)
+    node_pods(q, "n1", 5, 1, 10.0)
+    q.decide()
+    q.update(("n1", "p0"), "n1", 2, 99.0)
+    q.decide()
+    assert sorted(k[1] for k, _ in q.members("n1")) == ["p1", "p2", "p3", "p4"]
+
+
+def test_members_cover_a_whole_change_only_batch():
+    q = QuorumEngine(0.8)
+    node_pods(q, "n1", 4, 1, 1.0)
+    q.decide()
+    q.update(("n1", "p0"), "n1", 2, 5.0, batch=1)
+    q.decide()
+    assert sorted(w for _, w in q.members("n1")) == [1.0, 1.0, 1.0, 5.0]
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from replay_plan import ReplayCursor, ReplayPlan, native_step, on_grid, resample, row_times
+
+
+def test_cursor_writes_only_changed_cells():
+    plan = ReplayPlan(["a", "b", "c"], np.array([[1.0, 2.0, np.nan], [1.0, 3.0, np.nan], [1.0, 3.0, 4.0]]))
+    cursor = ReplayCursor(plan, changes_only=True)
+    assert cursor.step(0)[1] == [0, 1]
+    assert cursor.step(1)[1] == [1]
+    assert cursor.step(2)[1] == [2]
+    # jumping back (a loop pass) compares against what was written last
+    assert cursor.step(0)[1] == [1]
+    assert (cursor.cells_written, cursor.cells_total) == (5, 9)
+
+
+def test_cursor_full_refresh():
+    plan = ReplayPlan(["a"], np.ones((4, 1)))
+    cursor = ReplayCursor(plan, changes_only=True, full_refresh_every=2)
+    assert [cursor.step(i)[1] for i in range(4)] == [[0], [], [0], []]
+    cursor = ReplayCursor(plan, changes_only=False)
+    assert [cursor.step(i)[1] for i in range(2)] == [[0], [0]]
+
+
+def test_fill_replaces_missing_cells():
+    plan = ReplayPlan(["a", "b"], np.array([[1.0, np.nan]]), fill=0.0)
+    assert plan.row(0).tolist() == [1.0, 0.0]
+    assert ReplayCursor(plan).step(0) == ([1.0, 0.0], [0, 1])
+
+
+def test_hold_grid():
+    values = np.array([[1.0], [2.0], [3.0]])
+    grid, out = resample(values, np.array([0.0, 10.0, 30.0]), 5.0, "hold")
+    assert grid.tolist() == [0.0, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0]
+    assert out[:, 0].tolist() == [1.0, 1.0, 2.0, 2.0, 2.0, 2.0, 3.0]
+
+
+def test_linear_grid():
+    values = np.array([[0.0, 10.0], [10.0, 10.0], [np.nan, np.nan], [30.0, 0.0]])
+    grid, out = resample(values, np.array([0.0, 10.0, np.nan, 30.0]), 5.0, "linear")
+    assert grid.tolist() == [0.0, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0]
+    # the row without a time is dropped, not interpolated through
+    assert out[:, 0].tolist() == [0.0, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0]
+    assert out[:, 1].tolist() == [10.0, 10.0, 10.0, 7.5, 5.0, 2.5, 0.0]
+
+
+def test_resample_sorts_times_across_blocks():
+    grid, out = resample(np.array([[3.0], [1.0], [2.0]]), np.array([20.0, 0.0, 10.0]), 2.5, "hold", block=2)
+    assert grid.size == 9
+    assert out[:, 0].tolist() == [1.0] * 4 + [2.0] * 4 + [3.0]
+
+
+def test_resample_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        resample(np.zeros((2, 1)), np.array([0.0, 1.0]), 1.0, "cubic")
+    with pytest.raises(ValueError):
+        resample(np.zeros((2, 1)), np.array([0.0, 1.0]), 0)
+    with pytest.raises(ValueError):
+        resample(np.zeros((2, 1)), np.array([np.nan, np.nan]), 1.0)
+
+
+def test_native_step():
+    assert native_step(np.array([0.0, 15.0, 30.0, np.nan, 60.0])) == 15.0
+    assert native_step(None) is None
+
+
+def test_row_times_continue_over_summary_rows():
+    t = row_times(np.array([np.nan, 0.0, 10.0, np.nan, np.nan]), 10.0)
+    assert t.tolist() == [-10.0, 0.0, 10.0, 20.0, 30.0]
+    assert row_times(np.array([np.nan]), 10.0) is None
+
+
+def test_trace_time_counts_on_across_passes():
+    plan = ReplayPlan(["a"], np.zeros((3, 1)), step=10.0, times=np.array([0.0, 10.0, 20.0]))
+    assert [plan.trace_time(n) for n in range(6)] == [0.0, 10.0, 20.0, 30.0, 40.0, 50.0]
+    assert ReplayPlan(["a"], np.zeros((3, 1)), step=15.0).trace_time(4) == 60.0
+
+
+def test_resample_fills_the_allocated_output():
+    out = {}
+
+    def alloc(shape):
+        out["m"] = np.full(shape, -1.0)
+        return out["m"]
+
+    _, values = resample(np.array([[1.0], [2.0]]), np.array([0.0, 10.0]), 5.0, "hold", block=1, alloc=alloc)
+    assert values is out["m"]
+    assert values[:, 0].tolist() == [1.0, 1.0, 2.0]
+
+
+def test_on_grid():
+    assert on_grid(np.arange(5) * 15.0, 15.0)
+    assert not on_grid(np.array([0.0, 15.0, 31.0]), 15.0)
+    assert not on_grid(np.array([0.0, 15.0, np.nan]), 15.0)
+    assert not on_grid(None, 15.0)
@@ -0,0 +1,58 @@
+from functools import partial
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+from power_rollups import RollupEngine, WindowStats, cluster_of, window_label
+
+
+def test_window_mean_and_peak():
+    st = WindowStats([10.0, 100.0], 0.0, 10.0)
+    st.set(5.0, 30.0)
+    st.set(8.0, 0.0)
+    (mean10, peak10), (mean100, peak100) = st.stats(20.0)
+    assert mean10 == pytest.approx(0.0)
+    assert peak10 == 0.0
+    # before the 100 s window has filled up it covers the 20 s seen so far
+    assert mean100 == pytest.approx((5 * 10.0 + 3 * 30.0) / 20.0)
+    assert peak100 == 30.0
+
+
+def test_window_peak_expires():
+    st = WindowStats([10.0], 0.0, 50.0)
+    st.set(1.0, 20.0)
+    assert st.stats(5.0) == [(pytest.approx((50.0 + 4 * 20.0) / 5.0), 50.0)]
+    assert st.stats(30.0) == [(pytest.approx(20.0), 20.0)]
+
+
+def test_labels():
+    assert window_label(300.0) == "5m"
+    assert window_label(90.0) == "90s"
+    assert cluster_of("liqo-remote") == "remote"
+    assert cluster_of("kwok-node-1", local="home") == "home"
+
+
+def test_engine_groups_node_members():
+    registry = CollectorRegistry()
+    engine = RollupEngine(partial(Gauge, registry=registry), windows=(60.0,), cluster="home", clock=lambda: 0.0)
+    engine.track(("demo", "a"), "web", "frontend")
+    engine.track(("demo", "b"), "web", "db")
+    engine.track(("other", "c"), "batch", "frontend")
+    engine.set_node("n1", [(("demo", "a"), 10.0), (("demo", "b"), 5.0)])
+    engine.set_node("liqo-remote", [(("other", "c"), 2.0)])
+    engine.publish(0.0)
+
+    def watts(level, group):
+        return registry.get_sample_value("power_rollup_watts", {"level": level, "group": group})
+
+    assert watts("node", "n1") == 15.0
+    assert watts("namespace", "demo") == 15.0
+    assert watts("app", "web") == 15.0
+    assert watts("column", "frontend") == 12.0
+    assert watts("cluster", "home") == 15.0
+    assert watts("cluster", "remote") == 2.0
+    assert watts("fleet", "all") == 17.0
+    engine.drop_node("liqo-remote")
+    engine.publish(1.0)
+    assert watts("cluster", "remote") is None
+    assert watts("fleet", "all") == 15.0
+    assert registry.get_sample_value("power_rollup_peak_watts",
+                                     {"level": "fleet", "group": "all", "window": "1m"}) == 17.0
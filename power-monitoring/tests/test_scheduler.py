@@ -0,0 +1,69 @@
+import pytest
+from replay_scheduler import DeadlineScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def scheduler(policy, stall_at=None, stall=0.0, tick=1.0, last=10):
+    clock = Clock()
+    sched = DeadlineScheduler(tick, policy=policy, max_lag=0.5, clock=clock, sleep=clock.sleep)
+    fired = []
+    for n, deadline, lag in sched.run(last=last):
+        fired.append(n)
+        if n == stall_at:
+            clock.now += stall
+    return sched, fired
+
+
+def test_on_time_replay_fires_every_tick_at_its_deadline():
+    sched, fired = scheduler("run")
+    assert fired == list(range(10))
+    assert (sched.fired, sched.late, sched.dropped, sched.max_seen_lag) == (10, 0, 0, 0.0)
+
+
+def test_run_fires_late_ticks_back_to_back():
+    sched, fired = scheduler("run", stall_at=2, stall=3.2)
+    assert fired == list(range(10))
+    # ticks 3 and 4 start 2.2 s and 1.2 s late, tick 5 is back within max_lag
+    assert sched.late == 2
+    assert sched.max_seen_lag == pytest.approx(2.2)
+
+
+def test_coalesce_jumps_to_the_newest_due_tick():
+    sched, fired = scheduler("coalesce", stall_at=2, stall=3.2)
+    assert fired == [0, 1, 2, 5, 6, 7, 8, 9]
+    assert sched.dropped == 2
+
+
+def test_skip_waits_for_the_next_deadline():
+    sched, fired = scheduler("skip", stall_at=2, stall=3.2)
+    assert fired == [0, 1, 2, 6, 7, 8, 9]
+    assert sched.dropped == 3
+
+
+@pytest.mark.parametrize("policy", ["coalesce", "skip"])
+def test_drops_never_run_past_the_end(policy):
+    sched, fired = scheduler(policy, stall_at=3, stall=100.0)
+    assert sched.fired + sched.dropped == 10
+    assert fired[-1] <= 9
+
+
+def test_resumes_at_first():
+    clock = Clock()
+    sched = DeadlineScheduler(2.0, clock=clock, sleep=clock.sleep)
+    assert [n for n, _, _ in sched.run(first=5, last=8)] == [5, 6, 7]
+    assert clock.now == pytest.approx(4.0)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(1.0, policy="later")
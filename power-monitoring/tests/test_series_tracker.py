@@ -0,0 +1,58 @@
+from series_tracker import SeriesTracker
+
+
+class Gauge:
+    def __init__(self):
+        self.values = {}
+
+    def labels(self, *labels):
+        gauge = self
+
+        class Child:
+            def set(self, value):
+                gauge.values[labels] = value
+        return Child()
+
+    def remove(self, *labels):
+        del self.values[labels]
+
+
+class Counter:
+    def __init__(self):
+        self.counts = {}
+
+    def labels(self, reason):
+        counts = self.counts
+
+        class Child:
+            def inc(self):
+                counts[reason] = counts.get(reason, 0) + 1
+        return Child()
+
+
+def test_new_labels_supersede_the_old_series():
+    g, c = Gauge(), Counter()
+    t = SeriesTracker(g, evictions=c)
+    t.set("a", ("a", "1"), 1.0)
+    t.set("a", ("a", "2"), 2.0)
+    assert g.values == {("a", "2"): 2.0}
+    t.remove("a")
+    t.remove("a")
+    assert g.values == {} and len(t) == 0
+    assert c.counts == {"superseded": 1, "deleted": 1}
+
+
+def test_cap_evicts_the_least_recently_seen_series():
+    g, c = Gauge(), Counter()
+    t = SeriesTracker(g, max_series=2, evictions=c)
+    t.set("quiet", ("quiet",), 5.0)
+    t.set("busy", ("busy",), 1.0)
+    # the quiet pod's value never changes, but it is still observed every scan
+    t.touch("quiet")
+    t.set("busy", ("busy",), 2.0)
+    t.touch("quiet")
+    t.set("new", ("new",), 3.0)
+    assert set(g.values) == {("quiet",), ("new",)}
+    assert c.counts == {"cap": 1}
+    t.touch("busy")
+    assert len(t) == 2
@@ -0,0 +1,63 @@
+import json, os
+from power_shards import ShardMap, shard_of
+
+NODES = [f"node-{i}" for i in range(300)]
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_rendezvous_hashing_moves_only_nodes_the_new_shard_wins():
+    assert {shard_of(n, 1) for n in NODES} == {0}
+    before = {n: shard_of(n, 4) for n in NODES}
+    after = {n: shard_of(n, 5) for n in NODES}
+    moved = [n for n in NODES if before[n] != after[n]]
+    assert moved and all(after[n] == 4 for n in moved)
+    assert len(moved) < len(NODES) / 3
+    assert {shard_of(n, 4) for n in NODES} == {0, 1, 2, 3}
+
+
+def test_static_maps():
+    assert ShardMap().owns("anything")
+    assert not ShardMap().active
+    explicit = ShardMap(nodes=["a", "b"])
+    assert explicit.owns("a") and not explicit.owns("c")
+    shards = [ShardMap(index=i, count=3) for i in range(3)]
+    assert all(sum(s.owns(n) for s in shards) == 1 for n in NODES)
+
+
+def test_shard_file_switches_at_the_handoff_time(tmp_path):
+    path = str(tmp_path / "layout.json")
+    with open(path, "w") as f:
+        json.dump({"count": 2, "pins": {"a": 1}}, f)
+    clock = Clock(1000.0)
+    shard = ShardMap(index=1, path=path, clock=clock)
+    assert shard.owns("a")
+    with open(path, "w") as f:
+        json.dump({"nodes": {"1": ["b"]}, "at": 1100.0}, f)
+    os.utime(path, ns=(0, 10**9))
+    clock.now = 1050.0
+    assert not shard.poll()
+    assert shard.owns("a")
+    clock.now = 1100.0
+    assert shard.poll()
+    assert shard.owns("b") and not shard.owns("a")
+    assert not shard.poll()
+
+
+def test_broken_shard_file_keeps_the_layout(tmp_path, capsys):
+    path = str(tmp_path / "layout.json")
+    with open(path, "w") as f:
+        json.dump({"nodes": {"0": ["a"]}}, f)
+    shard = ShardMap(index=0, path=path, clock=Clock())
+    with open(path, "w") as f:
+        f.write("{not json")
+    os.utime(path, ns=(0, 10**9))
+    assert not shard.poll()
+    assert shard.owns("a")
+    assert "keeping shard 0" in capsys.readouterr().err
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from power_shm import RingDirectory, RingReader, RingWriter, last_version, ring_path
+
+
+def writer(tmp_path, node="n1", slots=4):
+    return RingWriter(ring_path(str(tmp_path), "demo", node), "demo", node, "kwok-power",
+                      ["a", "b"], ["pod-a", "pod-b"], slots=slots)
+
+
+def test_reads_the_newest_whole_row(tmp_path):
+    w = writer(tmp_path)
+    r = RingReader(w.path)
+    assert r.read() is None
+    w.write(1, [1.0, 2.0], scheduled=100.0, period=1.0, trace_time=0.0)
+    w.write(2, [3.0, np.nan], trace_time=15.0)
+    row = r.read()
+    assert (row.node, row.version, row.total) == ("n1", 2, 3.0)
+    assert row.entries == [("a", "pod-a", 3.0)]
+    assert row.scheduled is None and row.trace_time == 15.0
+    assert r.read() is row
+    r.close()
+    w.close()
+
+
+def test_rejects_a_slot_the_writer_is_filling(tmp_path):
+    w = writer(tmp_path)
+    r = RingReader(w.path)
+    w.write(1, [1.0, 1.0])
+    assert r.read().version == 1
+    w.write(2, [2.0, 2.0])
+    # head says row 2, but the slot's seq is odd: the writer is inside it
+    w._ring[2]["seq"] = 3
+    assert r.read().version == 1
+    w._ring[2]["seq"] = 4
+    assert r.read().version == 2
+    r.close()
+    w.close()
+
+
+def test_rejects_a_slot_lapped_by_the_writer(tmp_path):
+    w = writer(tmp_path, slots=2)
+    r = RingReader(w.path)
+    w.write(1, [1.0, 1.0])
+    assert r.read().version == 1
+    w.write(2, [2.0, 2.0])
+    # row 4 went into slot 2 % 2 before row 2 was read, but head still says row 2
+    w._ring[0]["seq"] = 8
+    w._ring[0]["version"] = 4
+    assert r.read().version == 1
+    r.close()
+    w.close()
+
+
+def test_restart_continues_above_the_old_ring(tmp_path):
+    w = writer(tmp_path)
+    for v in range(1, 8):
+        w.write(v, [v, v])
+    w.close()
+    assert last_version(w.path) == 7
+    w2 = writer(tmp_path)
+    assert w2.last_version == 7
+    w2.close()
+    assert last_version(os.path.join(str(tmp_path), "missing.ring")) == 0
+
+
+def test_directory_remaps_replaced_files(tmp_path):
+    d = RingDirectory(str(tmp_path))
+    assert d.snapshots() == []
+    w = writer(tmp_path)
+    w.write(5, [1.0, 1.0])
+    writer(tmp_path, node="n2").close()
+    assert [s.version for s in d.snapshots()] == [5]
+    assert d.snapshots(owns=lambda node: node != "n1") == []
+    w.close()
+    w = writer(tmp_path)
+    w.write(1, [2.0, 2.0])
+    assert [(s.version, s.total) for s in d.snapshots()] == [(1, 4.0)]
+    w.close()
@@ -0,0 +1,48 @@
+from snapshot_collector import SnapshotCollector
+
+
+def test_publish_copies_only_written_families():
+    sc = SnapshotCollector()
+    pods = sc.gauge("pod_watts", "", ["pod"])
+    nodes = sc.gauge("node_watts", "", ["node"])
+    pods.labels("a").set(1.0)
+    nodes.labels("n1").set(1.0)
+    assert sc.publish() == 1
+    first = sc.current()
+    pods.labels("a").set(2.0)
+    assert sc.publish() == 2
+    second = sc.current()
+    assert second.families[1][3] is first.families[1][3]
+    # the old snapshot is never mutated by later writes
+    assert first.families[0][3] == {("a",): 1.0}
+    assert second.families[0][3] == {("a",): 2.0}
+    assert sc.publish() == 2
+    assert sc.publish(force=True) == 3
+    assert sc.current().families == second.families
+
+
+def test_removed_series_leave_the_next_snapshot_only():
+    sc = SnapshotCollector()
+    pods = sc.gauge("pod_watts", "", ["pod"])
+    pods.labels("a").set(1.0)
+    pods.labels("b").set(1.0)
+    sc.publish()
+    before = sc.current()
+    pods.remove("a")
+    sc.publish()
+    assert list(sc.current().families[0][3]) == [("b",)]
+    assert len(before.families[0][3]) == 2
+
+
+def test_render_is_cached_per_generation():
+    sc = SnapshotCollector()
+    sc.counter("node_energy_joules", "", ["node"]).labels("n1")
+    sc.publish()
+    text = sc.render()
+    assert b'node_energy_joules_total{node="n1"} 0.0' in text
+    # the same series as a prometheus_client Counter, _created included
+    assert b'node_energy_joules_created{node="n1"}' in text
+    assert sc.render() is text
+    sc.gauge("pod_watts", "", ["pod"]).labels("a").set(3.0)
+    sc.publish()
+    assert b'pod_watts{pod="a"} 3.0' in sc.render()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from replay_plan import ReplayPlan
+from trace_amplifier import AmplifiedPlan, amplify_plan, node_manifest
+
+
+def template(rows=10):
+    values = np.stack([np.arange(rows, dtype=np.float64), 100.0 + np.arange(rows)], axis=1)
+    return ReplayPlan(["a", "b"], values, step=15.0, times=np.arange(rows) * 15.0)
+
+
+def test_replicas_cycle_over_the_template_columns():
+    plan = AmplifiedPlan(template(), pods=5)
+    assert plan.columns == ["a#0", "b#0", "a#1", "b#1", "a#2"]
+    assert plan.sources == ["a", "b", "a", "b", "a"]
+    assert len(plan) == 10 and plan.values.shape == (10, 5)
+    assert plan.step == 15.0 and plan.trace_time(10) == 150.0
+
+
+def test_without_variation_replicas_are_copies():
+    plan = AmplifiedPlan(template(), pods=4, jitter=0.0, scale=0.0, shift=0.0)
+    assert plan.row(3).tolist() == [3.0, 103.0, 3.0, 103.0]
+
+
+def test_shift_rotates_whole_rows():
+    plan = AmplifiedPlan(template(), pods=20, jitter=0.0, scale=0.0, shift=45.0)
+    offsets = {int(plan.row(0)[i]) for i in range(0, 20, 2)}
+    assert offsets <= {0, 1, 2, 3} and len(offsets) > 1
+
+
+def test_rows_are_seeded_per_node_and_stable_however_read():
+    a = AmplifiedPlan(template(), pods=6, node="n1", seed=7, block=3)
+    b = AmplifiedPlan(template(), pods=6, node="n1", seed=7, block=4)
+    c = AmplifiedPlan(template(), pods=6, node="n2", seed=7)
+    rows = np.array([a.row(i) for i in range(10)])
+    np.testing.assert_array_equal(a.values[2:9], rows[2:9])
+    with pytest.raises(AssertionError):
+        np.testing.assert_array_equal(np.array([c.row(i) for i in range(10)]), rows)
+    # the noise depends on the block index, so only the variation without jitter survives a new block size
+    assert (rows >= 0).all()
+    assert np.array([b.row(i) for i in range(10)]).shape == rows.shape
+
+
+def test_amplify_options():
+    assert len(amplify_plan(template(), "n1", {"pods": 3, "seed": 1}).columns) == 3
+    with pytest.raises(ValueError):
+        amplify_plan(template(), "n1", {"pods": 3, "replicas": 2})
+    with pytest.raises(ValueError):
+        AmplifiedPlan(template(), pods=0)
+
+
+def test_node_manifest():
+    text = 'metadata:\n  name: sn-fake\n  labels:\n    kubernetes.io/hostname: sn-fake\nstatus:\n  capacity:\n    pods: "110"\n'
+    out = node_manifest(text, "sn-fake", "amp-007", 500)
+    assert "sn-fake" not in out
+    assert out.count("amp-007") == 2
+    assert 'pods: "500"' in out
+    assert 'pods: "110"' in node_manifest(text, "sn-fake", "amp-007", 20)
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pytest
+from trace_cache import cache_paths, load_plan, open_trace, read_trace
+
+
+def write_csv(path, rows, header="time,a,b,Total"):
+    with open(path, "w") as f:
+        f.write(header + "\n" + "".join(r + "\n" for r in rows))
+    return str(path)
+
+
+@pytest.fixture
+def trace(tmp_path):
+    return write_csv(tmp_path / "t.csv", ["0,1,2,3", "15,n/a,4,4", "", "30,5,6,11", ",9,9,18"])
+
+
+def test_cache_holds_the_numeric_columns(trace, tmp_path):
+    columns, values, times = open_trace(trace, cache_dir=str(tmp_path / "cache"))
+    assert columns == ["a", "b"]
+    assert isinstance(values, np.memmap)
+    np.testing.assert_array_equal(values, [[1, 2], [np.nan, 4], [5, 6], [9, 9]])
+    np.testing.assert_array_equal(times, [0, 15, 30, np.nan])
+    assert all(os.path.exists(p) for p in cache_paths(trace, str(tmp_path / "cache")))
+
+
+def test_cache_is_reused_until_the_csv_changes(trace, tmp_path, capsys):
+    cache = str(tmp_path / "cache")
+    open_trace(trace, cache_dir=cache)
+    assert "CACHE" in capsys.readouterr().out
+    open_trace(trace, cache_dir=cache)
+    assert capsys.readouterr().out == ""
+    write_csv(trace, ["0,1,2,3", "15,3,4,7"])
+    assert open_trace(trace, cache_dir=cache)[1].shape == (2, 2)
+    # a different ignore regex is a different cache too
+    assert open_trace(trace, r"(?i)^(time|total|a)$", cache_dir=cache)[0] == ["b"]
+
+
+def test_uncached_read_matches_the_cache(trace, tmp_path):
+    cached = open_trace(trace, cache_dir=str(tmp_path))
+    parsed = read_trace(trace, chunksize=2)
+    assert cached[0] == parsed[0]
+    np.testing.assert_array_equal(cached[1], parsed[1])
+    np.testing.assert_array_equal(cached[2], parsed[2])
+
+
+def test_plan_fills_missing_cells(trace, tmp_path):
+    plan = load_plan(trace, fill=0.0, cache_dir=str(tmp_path))
+    assert len(plan) == 4
+    assert plan.row(1).tolist() == [0.0, 4.0]
+
+
+def test_no_usable_columns(tmp_path):
+    with pytest.raises(ValueError):
+        open_trace(write_csv(tmp_path / "x.csv", ["0,1"], header="time,total"), cache_dir=str(tmp_path))
+
+
+def test_native_resample(tmp_path):
+    csv = write_csv(tmp_path / "r.csv", ["0,1,1,2", "15,2,2,4", "30,3,3,6", "60,4,4,8"])
+    plan = load_plan(csv, cache_dir=str(tmp_path), resample_step="native")
+    assert plan.step == 15.0
+    assert [plan.row(i)[0] for i in range(len(plan))] == [1.0, 2.0, 3.0, 3.0, 4.0]
+    with pytest.raises(ValueError):
+        load_plan(write_csv(tmp_path / "n.csv", ["1,2"], header="a,b"), cache_dir=str(tmp_path),
+                  resample_step=5.0)
+
+
+def test_traces_on_the_grid_are_not_resampled(tmp_path, capsys):
+    csv = write_csv(tmp_path / "g.csv", ["0,1,1,2", "15,2,2,4", "30,3,3,6"])
+    plan = load_plan(csv, cache_dir=str(tmp_path), resample_step="native")
+    assert plan.values.filename == os.path.join(str(tmp_path), "g.csv.npy")
+    assert "resampled" not in capsys.readouterr().out
+
+
+def test_resampled_trace_is_cached_and_memory_mapped(tmp_path, capsys):
+    csv = write_csv(tmp_path / "r.csv", ["0,1,1,2", "15,2,2,4", "30,3,3,6", "60,4,4,8"])
+    plan = load_plan(csv, cache_dir=str(tmp_path), resample_step="native", method="linear")
+    assert isinstance(plan.values, np.memmap)
+    assert plan.row(3)[0] == 3.5
+    assert "5 rows of 15s" in capsys.readouterr().out
+    again = load_plan(csv, cache_dir=str(tmp_path), resample_step="native", method="linear")
+    assert capsys.readouterr().out == ""
+    uncached = load_plan(csv, cache=False, resample_step="native", method="linear")
+    np.testing.assert_array_equal(again.values, uncached.values)
+    np.testing.assert_array_equal(again.times, uncached.times)